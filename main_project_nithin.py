@@ -44,11 +44,18 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from sklearn.preprocessing import StandardScaler
-from sklearn.feature_selection import SelectKBest, f_regression
 
-"""***Load the dataset and using pandas to import the data***"""
+"""***Load the dataset and using pandas to import the data. Only the relevant columns are parsed, with fixed dtypes and in chunks, so memory stays bounded on the multi-GB yearly files. The same pass counts the null values and distinct values of every column and hashes every row, so duplicate rows are skipped per chunk and columns with more than MAX_NULL_FRACTION missing values are dropped before the full table is built***"""
 
-data=pd.read_csv("/content/Final OSHA Accident and Inspections Data Merged May 2021.csv")
+from osha_data import DATA_PATH, DROP_COLUMNS, MAX_NULL_FRACTION, load_profiled_osha_data
+from osha_profiling import StageRecorder
+
+# Wall/CPU time, RSS and rows/columns of the main stages are appended to stage_log.jsonl (profile_dir/profile_stages add cProfile dumps)
+recorder = StageRecorder('stage_log.jsonl')
+
+with recorder.stage('load') as stage:
+    data, column_profile, duplicate_rows = load_profiled_osha_data(DATA_PATH, chunksize=100_000, max_null_fraction=MAX_NULL_FRACTION)
+    stage.output(data)
 data.head(10)
 
 """**EXPLORATORY DATA ANALYSIS**
@@ -58,9 +65,9 @@ data.head(10)
 
 data.columns
 
-"""***Drop irrelevant columns by using data.drop***"""
+"""***Irrelevant columns (DROP_COLUMNS) are already skipped by the loader, so no data.drop is needed***"""
 
-data = data.drop(['state_flag','health_const','nr_in_estab','reporting_id','health_marit','migrant','report_id','abstract_text','fall_distance', 'event_date','event_time','summary_nr','injury_line_nr','occ_code','naics_code','adv_notice','state_flag.1','site_zip','mail_street', 'mail_city', 'open_date', 'case_mod_date', 'close_conf_date','sic_code','host_est_key','site_address','mail_zip','owner_code','nonbuild_ht','close_case_date', 'ld_dt'],axis=1)
+DROP_COLUMNS
 
 data
 
@@ -72,24 +79,21 @@ data.describe()
 
 """ ***Get Summary statistics for numerical columns by using data.describe()***"""
 
-data.isnull().sum()
-
-data.isnull().sum()/len(data)*100
+# Null count, null rate, number of distinct values and dropped flag of every parsed column, computed while loading
+column_profile
 
-data=data.dropna(axis=1,thresh=15000)
+# Columns dropped for having more than MAX_NULL_FRACTION (37%, the thresh=15000 of the May 2021 file) missing values
+column_profile[column_profile['dropped']]
 
-data.isnull().sum()/len(data)*100
-
-data.duplicated()
-
-data.drop_duplicates()
+# Positions in the file of the rows skipped as duplicates of an earlier row
+duplicate_rows
 
 """***Finding out null values and duplicated values. remove duplicate values from the dataset .***"""
 
 num_data = data.select_dtypes(include="number")
 num_data
 
-num_data.isnull().sum()
+column_profile.loc[num_data.columns, 'null_count']
 
 from sklearn.impute import SimpleImputer
 
@@ -99,23 +103,25 @@ data['degree_of_inj'] = SimpleImputer(strategy='median').fit_transform(data[['de
 
 num_data.skew()
 
-cat_data = data.select_dtypes(include="object")
+cat_data = data.select_dtypes(include=["object", "category"])
 cat_data
 
-cat_data.isnull().sum()
+column_profile.loc[cat_data.columns, 'null_count']
 
 data1=data.copy()
-data1['fatality'].fillna('no',inplace=True)
+data1['fatality'] = data1['fatality'].astype(object).fillna('no')
 
-sex_imputer = SimpleImputer(strategy='most_frequent')
+with recorder.stage('impute_categorical', data) as stage:
+    sex_imputer = SimpleImputer(strategy='most_frequent')
 
-# Fit the imputer and transform the 'sex' column
-data['sex'] = sex_imputer.fit_transform(data[['sex']]).flatten()
+    # Fit the imputer and transform the 'sex' column
+    data['sex'] = sex_imputer.fit_transform(data[['sex']]).flatten()
 
-union_status_imputer = SimpleImputer(strategy='most_frequent')
+    union_status_imputer = SimpleImputer(strategy='most_frequent')
 
-# Fit the imputer and transform the 'union_status' column
-data['union_status'] = union_status_imputer.fit_transform(data[['union_status']]).flatten()
+    # Fit the imputer and transform the 'union_status' column
+    data['union_status'] = union_status_imputer.fit_transform(data[['union_status']]).flatten()
+    stage.output(data)
 
 """***In this step we already checked the categorical columns and impute most_frequent values in some categorical columns***"""
 
@@ -159,23 +165,16 @@ for column in numeric_columns:
 
 """***Remove outliers by applying IQR(Inter Quartile Range) method and visualize again to cross check whether outliers removed or not.***"""
 
-def remove_outliers_iqr(data, column):
-    Q1 = data[column].quantile(0.25)
-    Q3 = data[column].quantile(0.75)
-    IQR = Q3 - Q1
-
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
+from osha_data import filter_outliers_iqr, iqr_bounds
 
-    # Return a filtered DataFrame that excludes outliers
-    return data[(data[column] >= lower_bound) &  (data[column] <= upper_bound)]
-
-# Start with the original data
-cleaned_data = data.copy()  # Create a copy for cleaning
-
-# Remove outliers for each numeric column
-for column in numeric_columns:
-    cleaned_data = remove_outliers_iqr(cleaned_data, column)
+# Remove outliers for all numeric columns with one filter of the data
+# (mode='independent' computes every bound on the full data instead)
+# The bounds are kept so that the incremental update filters new rows the same way
+with recorder.stage('iqr_filter', data) as stage:
+    outlier_bounds = iqr_bounds(data, numeric_columns, mode='sequential')
+    cleaned_data, outliers_removed = filter_outliers_iqr(data, numeric_columns, mode='sequential', bounds=outlier_bounds)
+    stage.output(cleaned_data)
+print("Rows removed per column:\n", outliers_removed)
 
 # Visualize the cleaned data again to confirm outliers are removed
 for column in numeric_columns:
@@ -193,10 +192,23 @@ for column in numeric_columns:
 
     plt.show()
 
+"""***The same plots can be rendered headless (Agg backend, process pool, pre-binned histograms and sampled KDEs) into a single HTML report, for servers without a display***"""
+
+from osha_eda import build_eda_report
+
+build_eda_report({'before outlier removal': data, 'after outlier removal': cleaned_data}, numeric_columns,
+                 out_path='eda_report.html', sample_size=100_000)
+
 cleaned_data.select_dtypes("number").skew()
 
 cleaned_data.shape
 
+"""***Cache the cleaned data in a columnar file keyed by the source CSV and the cleaning parameters. Retraining and analysis jobs can start from load_cleaned_data() and skip the steps above***"""
+
+from osha_cache import cache_key, write_cache
+
+write_cache(cleaned_data, cache_key(DATA_PATH, max_null_fraction=MAX_NULL_FRACTION, drop_duplicates=True))
+
 cleaned_data["degree_of_inj"].value_counts()
 
 """**visualization**
@@ -275,69 +287,45 @@ x
 
 y
 
-cat_cleaned_data=x.select_dtypes(include="object")
+cat_cleaned_data=x.select_dtypes(include=["object", "category"])
 cat_cleaned_data
 
 cat_cleaned_data_columns=list(cat_cleaned_data)
 cat_cleaned_data_columns
 
-"""***Encode the categorical columns by using OneHotEncoder***"""
+"""***Encode the categorical columns by using OneHotEncoder. The encoded columns stay a sparse CSR matrix (no .toarray()), stacked with the numeric columns***"""
 
-from sklearn.preprocessing import OneHotEncoder
-enc = OneHotEncoder()
+from osha_features import encode_sparse, memory_report
 
 # Fit and transform the specified categorical columns
-encoded_data = enc.fit_transform(x[cat_cleaned_data_columns]).toarray()
-
-encoded_data
-
-# Create a DataFrame from the encoded data
-encoded_df = pd.DataFrame(encoded_data, columns=enc.get_feature_names_out(cat_cleaned_data_columns))
+with recorder.stage('one_hot', x) as stage:
+    x, feature_names, enc = encode_sparse(x, cat_cleaned_data_columns)
+    stage.output(x)
 
-# Combine the encoded DataFrame with the original cleaned_data (excluding the original categorical columns)
-x = pd.concat([x.drop(columns=cat_cleaned_data_columns).reset_index(drop=True), encoded_df], axis=1)
-
-# Display the first few rows of the encoded DataFrame
+# Display the sparse matrix and its memory compared with the dense version
 x
 
-x.shape
-
-from sklearn.feature_selection import SelectKBest, f_classif
-
-from sklearn.ensemble import RandomForestClassifier
-import pandas as pd
-import numpy as np
+memory_report(x)
 
-# Assume x is feature set and y is target variable
-# Create a Random Forest model
-model = RandomForestClassifier(random_state=42)
-model.fit(x, y)
+x.shape
 
 """**Feature Engineering**
 
-***By using feature importance method findout important features whichever we can apply for further process.***
-"""
-
-# Get feature importances
-importances = model.feature_importances_
-# Create a DataFrame to display feature importances
-feature_importance_df = pd.DataFrame({
-    'Feature': x.columns,
-    'Importance': importances
-}).sort_values(by='Importance', ascending=False)
+***Select the important features in two cheap steps instead of one forest on the full one-hot matrix: a univariate f_classif pre-filter on the sparse matrix drops features unrelated to the target, then permutation importance of a forest fitted on a row subsample ranks the rest (in parallel). The selection is re-validated on held-out rows and cached per dataset, so a re-run on the same data is instant***"""
 
-print(feature_importance_df)
+from osha_selection import raw_columns, select_features
 
-# Set a threshold (example: 0.01)
-threshold = 0.01
+with recorder.stage('feature_selection', x) as stage:
+    selected_positions, selected_feature_names, feature_importance_df = select_features(x, y, feature_names, score_func='f_classif', alpha=0.01, min_importance=0.001, sample_size=50_000, n_jobs=-1)
+    stage.output(x[:, selected_positions])
 
-# Select features with importance above the threshold
-selected_features = feature_importance_df[feature_importance_df['Importance'] > threshold]
+print(feature_importance_df.sort_values('importance_mean', ascending=False))
 
 print("Selected Features:")
-print(selected_features)
+print(selected_feature_names)
 
-X_selected = x[selected_features['Feature']]
+# Slice the selected columns from the sparse matrix
+X_selected = x[:, selected_positions]
 
 """***The above mentioned features are now important for this project.***"""
 
@@ -345,21 +333,19 @@ X_selected
 
 y
 
-"""***Installing imbalanced learn for SMOTE technique to varify features and target are balanced or imbalanced.***"""
+"""***Installing imbalanced learn for SMOTE technique to varify features and target are balanced or imbalanced. SMOTE is not applied to the full data here (that would leak synthetic rows into the test data); it runs inside the training folds only, with ChunkedSMOTE which builds the synthetic rows in chunks and supports the sparse matrix***"""
 
 !pip install imbalanced-learn
 
-from imblearn.over_sampling import SMOTE
-
-smote=SMOTE(random_state=42)
-x_smote,y_smote=smote.fit_resample(x,y)
+from osha_resampling import ChunkedSMOTE
 
-class_counts = y_smote.value_counts()
-print('Balanced class distribution:\n',class_counts)
-print('Balanced class ratios:\n',class_counts/len(y_smote))
+class_counts = y.value_counts()
+print('Class distribution:\n',class_counts)
+print('Class ratios:\n',class_counts/len(y))
 
 from sklearn.preprocessing import StandardScaler
-scaler = StandardScaler()
+# with_mean=False keeps the sparse matrix sparse
+scaler = StandardScaler(with_mean=False)
 x_scaled = scaler.fit_transform(X_selected)
 
 from sklearn.linear_model import LogisticRegression
@@ -384,49 +370,25 @@ x_test_scaled = scaler.transform(x_test)
 ***Initialize models such as Logisticregression,RandomForest classifier,DecissionTree,SVM,KNN and Calculate Training Accuracy Scores***
 """
 
-log_reg = LogisticRegression()
-log_reg.fit(x_train_scaled, y_train)
-
-y_pred = log_reg.predict(x_test_scaled)
-
-print("Logistic Regression prediction:",y_pred)
-print("Accuracy:", accuracy_score(y_test, y_pred))
-
 from sklearn.tree import DecisionTreeClassifier
-dt = DecisionTreeClassifier()
-dt.fit(x_train_scaled, y_train)
-
-y_pred = dt.predict(x_test_scaled)
-
-print("Decision Tree prediction:",y_pred)
-print("Accuracy:", accuracy_score(y_test, y_pred))
-
 from sklearn.ensemble import RandomForestClassifier
-rf = RandomForestClassifier()
-rf.fit(x_train_scaled, y_train)
-
-y_pred = rf.predict(x_test_scaled)
-
-print("Random Forest prediction:",y_pred)
-print("Accuracy:", accuracy_score(y_test, y_pred))
-
 from sklearn.svm import SVC
-svm = SVC()
-svm.fit(x_train_scaled, y_train)
-
-y_pred = svm.predict(x_test_scaled)
-
-print("SVM prediction:",y_pred)
-print("Accuracy:", accuracy_score(y_test, y_pred))
-
 from sklearn.neighbors import KNeighborsClassifier
-knn = KNeighborsClassifier()
-knn.fit(x_train_scaled, y_train)
-
-y_pred = knn.predict(x_test_scaled)
+from osha_harness import train_and_evaluate
+
+# The five baselines are fitted and scored at the same time in a process pool; x_train_scaled/x_test_scaled are written once and memory-mapped by every worker
+baseline_models = {
+    'Logistic Regression': LogisticRegression(),
+    'Decision Tree': DecisionTreeClassifier(),
+    'Random Forest': RandomForestClassifier(),
+    'SVM': SVC(),
+    'KNN': KNeighborsClassifier(),
+}
+with recorder.stage('baselines', x_train_scaled):
+    baseline_report, baseline_fitted = train_and_evaluate(baseline_models, x_train_scaled, y_train, x_test_scaled, y_test)
+log_reg, dt, rf, svm, knn = (baseline_fitted[name] for name in baseline_models)
 
-print("KNN prediction:",y_pred)
-print("Accuracy:", accuracy_score(y_test, y_pred))
+baseline_report
 
 """**Model Training and Evaluation**
 
@@ -446,47 +408,53 @@ ROC AUC: Measures the ability of the model to distinguish between classes.
 Results Visualization: Finally, it presents the results in a DataFrame for easier comparison.
 """
 
-from sklearn.model_selection import train_test_split, GridSearchCV
-
-# Apply classification algorithms (Logistic Regression, SVM, Random Forest,Decision tree,KNN)
-# Hyperparameter tuning using GridSearchCV
-
-# Logistic Regression
-log_reg = LogisticRegression(max_iter=1000)
-log_reg_params = {'C': [0.01, 0.1, 1, 10]}
-log_reg_grid = GridSearchCV(log_reg, log_reg_params, cv=5)
-log_reg_grid.fit(x_train_scaled, y_train)
-
-# SVM
-svm = SVC()
-svm_params = {'C': [0.1,1], 'kernel': ['linear', 'rbf']}
-svm_grid = GridSearchCV(svm, svm_params, cv=5)
-svm_grid.fit(x_train_scaled, y_train)
-
-# Random Forest
-rf = RandomForestClassifier()
-rf_params = {'n_estimators': [10,50, 100, 150], 'max_depth': [2,3, 5, 7]}
-rf_grid = GridSearchCV(rf, rf_params, cv=5)
-rf_grid.fit(x_train_scaled, y_train)
-
-# Decision tree
-dt = DecisionTreeClassifier()
-dt_params = {'max_depth': [2,3, 5, 7]}
-dt_grid = GridSearchCV(dt, dt_params, cv=5)
-dt_grid.fit(x_train_scaled, y_train)
-
-#KNN
-knn = KNeighborsClassifier()
-knn_params = {'n_neighbors': [3, 5, 7, 9]}
-knn_grid = GridSearchCV(knn, knn_params, cv=5)
-knn_grid.fit(x_train_scaled, y_train)
+"""***Hyperparameter tuning of all the candidate models (Logistic Regression, SVM, Random Forest, Decision tree, KNN) with one search engine. Successive halving drops weak candidates early, every fit runs in parallel on all cores and finished fits are checkpointed, so an interrupted search resumes where it stopped***"""
 
-# Evaluate model performance
-def evaluate_model(model, x_test_scaled, y_test):
-    y_pred = model.predict(x_test_scaled)
-    accuracy = accuracy_score(y_test, y_pred)
-    print(f"Accuracy: {accuracy:.4f}")
-    print(f"Classification Report:\n{classification_report(y_test, y_pred)}")
+from osha_folds import FoldCache
+from osha_tuning import PARAM_GRIDS, candidate_models, tune_models
+
+# The CV splits, the per-fold scaling and SMOTE (training part of each fold only) are computed once, memory-mapped and shared by every model search
+with recorder.stage('fold_cache_smote', x_train):
+    fold_cache = FoldCache(x_train, y_train, cv=5, transformer=StandardScaler(with_mean=False), sampler=ChunkedSMOTE(random_state=42))
+
+from osha_knn import tune_knn
+
+# KNN is tuned separately: one BallTree per fold is queried once at the largest n_neighbors and every n_neighbors/weights candidate is scored from that result
+search_models = {name: model for name, model in candidate_models().items() if name != 'KNN'}
+with recorder.stage('tune_models', x_train):
+    search_results = tune_models(x_train, y_train, search_models, PARAM_GRIDS, search='halving_grid', scoring='accuracy', n_jobs=-1, fold_cache=fold_cache)
+with recorder.stage('tune_knn', x_train):
+    search_results['KNN'] = tune_knn(x_train, y_train, PARAM_GRIDS['KNN'], scoring='accuracy', fold_cache=fold_cache)
+
+# Dictionary to hold the best models
+best_models = {name: result['best_estimator'] for name, result in search_results.items()}
+
+"""***HistGradientBoosting as an additional candidate. It splits the categorical columns natively (a missing category is a category of its own) and handles missing numeric values itself, so it is trained on the raw records (same rows as x_train/x_test, and only the raw columns behind the selected features) without one-hot encoding, scaling or SMOTE (class_weight='balanced' is part of its grid)***"""
+
+from osha_boosting import GRADIENT_BOOSTING, HGB_PARAM_GRID, build_hgb_pipeline, compare_models
+from osha_pipeline import prepare_records, split_columns
+
+# Same random_state and test_size as the split of x_scaled, so the raw rows match x_train/x_test
+raw_x = cleaned_data.drop("degree_of_inj", axis=1)
+raw_x_train, raw_x_test, raw_y_train, raw_y_test = train_test_split(raw_x, cleaned_data["degree_of_inj"], test_size=0.2, random_state=42)
+
+# Only the raw columns behind the selected features, so gradient boosting is compared with the other models on the same inputs
+selected_numeric, selected_categorical = raw_columns(selected_feature_names, *split_columns(raw_x_train))
+selected_raw_columns = selected_numeric + selected_categorical
+hgb_x_train = prepare_records(raw_x_train[selected_raw_columns], selected_numeric, selected_categorical)
+hgb_x_test = prepare_records(raw_x_test[selected_raw_columns], selected_numeric, selected_categorical)
+
+search_results.update(tune_models(hgb_x_train, raw_y_train, {GRADIENT_BOOSTING: build_hgb_pipeline(hgb_x_train)}, {GRADIENT_BOOSTING: HGB_PARAM_GRID}, search='halving_grid', scoring='accuracy', n_jobs=-1))
+best_models[GRADIENT_BOOSTING] = search_results[GRADIENT_BOOSTING]['best_estimator']
+
+# Test features of every model: the scaled one-hot matrix, or the raw records for gradient boosting
+test_inputs = {name: x_test_scaled for name in best_models}
+test_inputs[GRADIENT_BOOSTING] = hgb_x_test
+
+# Fit time, single-row predict latency and accuracy of the six tuned models
+train_inputs = {name: fold_cache.full() for name in best_models}
+train_inputs[GRADIENT_BOOSTING] = (hgb_x_train, raw_y_train)
+model_comparison = compare_models({name: (model, *train_inputs[name], test_inputs[name]) for name, model in best_models.items()}, y_test)
 
 # Evaluate model performance
 def evaluate_model(model, x_test_scaled, y_test):
@@ -518,86 +486,14 @@ def evaluate_model(model, x_test_scaled, y_test):
     # Print classification report
     print(f"Classification Report:\n{classification_report(y_test, y_pred)}")
 
-print("\nEvaluation for Logistic Regression:")
-evaluate_model(log_reg_grid, x_test_scaled, y_test)
-
-print("\nEvaluation for SVM:")
-evaluate_model(svm_grid, x_test_scaled, y_test)
-
-print("\nEvaluation for Random Forest:")
-evaluate_model(rf_grid, x_test_scaled, y_test)
-
-print("\nEvaluation for Decision Tree:")
-evaluate_model(dt_grid, x_test_scaled, y_test)
-
-print("\nEvaluation for KNN:")
-evaluate_model(knn_grid, x_test_scaled, y_test)
-
-from sklearn.datasets import make_classification
-# Create a synthetic dataset
-x, y = make_classification(n_samples=1000, n_features=10, n_informative=5, n_redundant=2, random_state=42)
-
-# Split the data into training and testing sets
-x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.2, random_state=42)
-
-# Define parameter grids for each model
-param_grids = {
-    "Random Forest": {
-        'n_estimators': [50, 100, 200],
-        'max_depth': [None, 10, 20],
-        'min_samples_split': [2, 5, 10]
-    },
-    "Decision Tree": {
-        'max_depth': [None, 10, 20],
-        'min_samples_split': [2, 5, 10]
-    },
-    "Logistic Regression": {
-        'C': [0.001, 0.01, 0.1, 1, 10],
-        'solver': ['liblinear', 'saga']  # solvers that support L1 regularization
-    },
-    "SVM": {
-        'C': [0.001, 0.01, 0.1, 1, 10],
-        'kernel': ['linear', 'rbf']
-    },
-    "KNN": {
-        'n_neighbors': [3, 5, 7, 9],
-        'weights': ['uniform', 'distance']
-    }
-}
-
-# Dictionary to hold the best models
-best_models = {}
-
-# Hyperparameter tuning using Grid Search
-for name, model in [
-    ("Random Forest", RandomForestClassifier()),
-    ("Decision Tree", DecisionTreeClassifier()),
-    ("Logistic Regression", LogisticRegression(max_iter=1000)),
-    ("SVM", SVC(probability=True)),
-    ("KNN", KNeighborsClassifier())
-]:
-    print(f"Tuning {name}...")
-    grid_search = GridSearchCV(model, param_grids[name], cv=5, scoring='accuracy', n_jobs=-1)
-    grid_search.fit(x_train, y_train)
-    best_models[name] = grid_search.best_estimator_
-    print(f"Best parameters for {name}: {grid_search.best_params_}")
-    print(f"Best cross-validation score for {name}: {grid_search.best_score_:.4f}\n")
-
-# Evaluate the best models on the test set
 for name, model in best_models.items():
-    test_score = model.score(x_test, y_test)
-    print(f"Test accuracy for {name}: {test_score:.4f}")
+    print(f"\nEvaluation for {name}:")
+    evaluate_model(model, test_inputs[name], y_test)
 
 """***Find the model with the highest test accuracy***"""
 
 # Store the test accuracies in a dictionary
-test_accuracies = {
-    'Random Forest': 0.9650,
-    'Decision Tree': 0.9100,
-    'Logistic Regression': 0.8300,
-    'SVM': 0.9450,
-    'KNN': 0.9250
-}
+test_accuracies = {name: model.score(test_inputs[name], y_test) for name, model in best_models.items()}
 
 # Find the model with the highest test accuracy
 best_model = max(test_accuracies, key=test_accuracies.get)
@@ -607,32 +503,108 @@ best_accuracy = test_accuracies[best_model]
 print(f"The model with the highest test accuracy is: {best_model}")
 print(f"Highest Test Accuracy: {best_accuracy:.4f}")
 
+"""***Out-of-core training for data that does not fit in memory: the file is read chunk by chunk, a logistic regression is trained with SGDClassifier.partial_fit and a warm-start Random Forest grows new trees on every chunk. The held-out accuracy is compared with the same models fitted in memory***"""
+
+from osha_streaming import train_streaming
+
+streaming = train_streaming(DATA_PATH, chunksize=100_000, trees_per_chunk=10, compare_in_memory=True)
+
 """ ***Save the best model and Choose the model with the highest performance metrics***"""
 
-best_model = max([log_reg_grid, svm_grid, rf_grid], key=lambda model: model.best_score_)
-print(f"\nBest model: {best_model.best_estimator_}")
+best_model = max(search_results, key=lambda name: search_results[name]['best_score'])
+print(f"\nBest model: {best_models[best_model]}")
+
+"""**Save the Model**
+
+***The preprocessing (imputation, one-hot encoding, scaling) and the best estimator are saved together as one fitted pipeline, trained on the raw cleaned records***"""
+
+from sklearn.base import clone
+from osha_pipeline import fit_pipeline, load_model, predict, save_model
+
+# raw_x_train/raw_y_train are the raw training rows split above. A gradient boosting winner keeps its own native categorical preprocessing
+
+# Only the raw columns behind the selected features are inputs of the saved model; the selected feature list is saved in the artifact
+final_x_train = raw_x_train[selected_raw_columns]
 
-"""**Save the Model**"""
+from osha_compact import compare_representations
 
-# Save the best model using joblib
-import joblib
-joblib.dump(best_model, 'final_best_occupational_safety_model.pkl')
+# Compact features: uint8 one-hot columns, small integer codes (float32 when scaled), hashed inspection ids.
+# The compact pipeline is saved unless it costs more than MAX_COMPACT_ACCURACY_LOSS accuracy on a validation
+# split carved from the training rows; the test rows only evaluate the saved pipeline
+MAX_COMPACT_ACCURACY_LOSS = 0.005
+with recorder.stage('final_fit', final_x_train, model=best_model):
+    if best_model == GRADIENT_BOOSTING:
+        # The gradient boosting pipeline keeps its own preprocessing and uses class_weight instead of SMOTE
+        final_pipeline = fit_pipeline(clone(best_models[best_model]), final_x_train, raw_y_train)
+    else:
+        fit_x, val_x, fit_y, val_y = train_test_split(final_x_train, raw_y_train, test_size=0.2, random_state=42,
+                                                      stratify=raw_y_train)
+        compact_report, _ = compare_representations(best_models[best_model], fit_x, fit_y, val_x, val_y,
+                                                    sampler=ChunkedSMOTE(random_state=42), id_mode='hash')
+        accuracy_loss = compact_report.loc['float64', 'accuracy'] - compact_report.loc['compact', 'accuracy']
+        final_representation = 'compact' if accuracy_loss <= MAX_COMPACT_ACCURACY_LOSS else 'float64'
+        print(f"Saving the {final_representation} representation")
+        final_pipeline = fit_pipeline(clone(best_models[best_model]), final_x_train, raw_y_train,
+                                      sampler=ChunkedSMOTE(random_state=42),
+                                      compact=final_representation == 'compact', id_mode='hash')
+final_test_records = prepare_records(raw_x_test, *split_columns(final_x_train))
+print(f"Test accuracy of the saved pipeline: {final_pipeline.score(final_test_records, raw_y_test):.4f}")
+
+from osha_incremental import init_incremental_state, scan_keys
+
+# The keys (summary_nr, rel_insp_nr) of every row of the file and the outlier bounds let the next release update the model incrementally
+incremental_state = init_incremental_state(scan_keys(DATA_PATH), outlier_bounds)
+save_model(final_pipeline, 'final_best_occupational_safety_model.pkl', final_x_train, selected_features=selected_feature_names, incremental_state=incremental_state)
 
 print("\nBest model saved as 'final_best_occupational_safety_model.pkl'")
 
+# Slowest stages of this run
+recorder.summary()[['stage', 'wall_s', 'cpu_s', 'stage_peak_rss_mb', 'rss_increase_mb', 'rows_in', 'cols_in', 'rows_out', 'cols_out']]
+
+"""***Incremental update for a new monthly release: only the rows whose summary_nr/rel_insp_nr were not seen yet are read, they are cleaned like the training rows, the one-hot vocabulary (of the ColumnTransformer or of the compact encoder) is extended with their categories while the fitted imputers and scaler are kept, and a Random Forest grows new trees on them with the same hyperparameters, without re-running the searches. Other models are refitted with their saved hyperparameters when the history is passed***"""
+
+import os
+from osha_incremental import update_saved_model
+
+NEW_RELEASE_PATH = "/content/Final OSHA Accident and Inspections Data Merged June 2021.csv"
+
+if os.path.exists(NEW_RELEASE_PATH):
+    updated_artifact = update_saved_model('final_best_occupational_safety_model.pkl', NEW_RELEASE_PATH, n_trees=20, history=raw_x_train.assign(degree_of_inj=raw_y_train))
+
+"""***Export the saved model in compact formats (uncompressed, zlib and lzma compressed joblib, and for a random forest the flat .npy arrays that are memory-mapped at load) and compare artifact size and cold-load time***"""
+
+from osha_export import compare_artifact_formats
+
+export_report = compare_artifact_formats('final_best_occupational_safety_model.pkl', 'model_exports')
+
+"""***Optional vectorized prediction engine for the Random Forest: all trees are compiled into flat NumPy arrays and evaluated together over a batch. Predictions are checked to be identical to rf.predict while comparing speed at batch sizes 1 and 1k (the 1M row case runs in osha_benchmark.py)***"""
+
+from osha_forest import benchmark_forest
+
+forest_benchmark = benchmark_forest(best_models['Random Forest'], x_test_scaled, batch_sizes=(1, 1_000))
+
 """**Load the model**"""
 
-import joblib
-# Load the saved model
-loaded_model = joblib.load('final_best_occupational_safety_model.pkl')
+# Load the saved pipeline and its input column layout
+loaded_model = load_model('final_best_occupational_safety_model.pkl')
 
-"""***Predict degree of injury of a sample data by using model which I saved as best model***"""
+"""***Predict degree of injury of a sample data by using model which I saved as best model. The raw record is passed as is, all transforms are done by the saved pipeline***"""
 
-sample_data = pd.DataFrame({'fatality_nan':[0.0],	'fatality_X':[1.0],	'nature_of_inj':[2.0],	'activity_nr':[17456682],	'part_of_body':[20.0],	'evn_factor':[1.0],	'rel_insp_nr':[17456682],	'src_of_injury':[27],	'age':[48],	'sic_list':[1791]})
+sample_data = [{'fatality': 'X', 'nature_of_inj': 2, 'activity_nr': 17456682, 'part_of_body': 20, 'evn_factor': 1, 'rel_insp_nr': 17456682, 'src_of_injury': 27, 'age': 48, 'sic_list': 1791, 'sex': 'M', 'union_status': 'N'}]
 
-prediction=loaded_model.predict(sample_data)
+prediction=predict(sample_data, loaded_model)
 print("Predicted Degree of injury:",prediction[0])
 
+"""***Re-submitted records can be answered from a prediction cache keyed by the preprocessed features (LRU eviction, optional expiry). The server enables it with --cache-size***"""
+
+from osha_prediction_cache import PredictionCache
+
+prediction_cache = PredictionCache(loaded_model, max_size=100_000, ttl_seconds=3600)
+prediction_cache.predict(sample_data)
+# Same incident with an edited free text field: same model features, answered from the cache
+prediction_cache.predict([{**sample_data[0], 'abstract_text': 'Edited description'}])
+prediction_cache.stats()
+
 """***Prediction done by using the model is accurate***
 
 ***In OSHA Accident and inspection data, the nature of injury refers to the type of injury sustained by the worker during an accident. it describes the specific physical harm or illness resulting from the incident. some common categories of the nature of injury indicates in datasets***
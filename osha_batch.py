@@ -0,0 +1,151 @@
+"""Batch scoring of OSHA incident extracts.
+
+Streams a CSV or Parquet file in chunks, applies the saved preprocessing
+pipeline (osha_pipeline artifact) in a pool of worker processes and writes the
+predicted degree of injury plus the class probabilities to Parquet.
+
+Usage:
+    python osha_batch.py extract.csv predictions.parquet \
+        --model final_best_occupational_safety_model.pkl --workers 8
+"""
+
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from osha_data import OSHA_DTYPES
+from osha_pipeline import load_model, predict_with_proba, prepare_records
+from osha_profiling import peak_rss_mb
+
+MODEL_PATH = 'final_best_occupational_safety_model.pkl'
+
+# Model loaded once per worker process by _init_worker
+_artifact = None
+
+
+def _init_worker(model_path):
+    global _artifact
+    _artifact = load_model(model_path)
+
+
+def score_chunk(chunk, artifact, id_columns=()):
+    """
+    Predict one chunk of raw records.
+
+    Returns:
+        DataFrame with the id columns, the prediction and one proba_<class>
+        column per class.
+    """
+    records = prepare_records(chunk, artifact['numeric_columns'], artifact['categorical_columns'])
+    pipeline = artifact['pipeline']
+    result = chunk[list(id_columns)].reset_index(drop=True)
+    # The labels match pipeline.predict (see predict_with_proba)
+    result['prediction'], probabilities = predict_with_proba(pipeline, records)
+    if probabilities is not None:
+        for i, label in enumerate(pipeline.classes_):
+            result[f'proba_{label}'] = probabilities[:, i]
+    return result
+
+
+def _score_in_worker(chunk, id_columns):
+    return score_chunk(chunk, _artifact, id_columns)
+
+
+def iter_input_chunks(path, columns, chunksize=100_000):
+    """Stream the needed columns of a CSV or Parquet file in chunks."""
+    if path.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(path)
+        available = [column for column in columns if column in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=available):
+            yield batch.to_pandas()
+    else:
+        dtype = {column: OSHA_DTYPES[column] for column in columns if column in OSHA_DTYPES}
+        reader = pd.read_csv(path, usecols=lambda column: column in columns, dtype=dtype,
+                             chunksize=chunksize, low_memory=False)
+        with reader:
+            yield from reader
+
+
+def score_file(input_path, output_path, model_path=MODEL_PATH, chunksize=100_000, workers=None,
+               id_columns=('activity_nr', 'rel_insp_nr')):
+    """
+    Score an extract chunk by chunk and write the predictions to Parquet.
+
+    Args:
+        input_path: CSV or Parquet file with raw incident records.
+        output_path: Output Parquet file.
+        model_path: Artifact written by osha_pipeline.save_model.
+        chunksize: Rows per chunk (memory is bounded by workers * chunksize).
+        workers: Number of worker processes (all cores by default).
+        id_columns: Input columns copied to the output to identify the rows.
+
+    Returns:
+        Dict with the number of rows, seconds, rows/sec and peak RSS in MB.
+    """
+    workers = workers or os.cpu_count()
+    artifact = load_model(model_path)
+    id_columns = list(id_columns)
+    columns = set(artifact['numeric_columns']) | set(artifact['categorical_columns']) | set(id_columns)
+    del artifact
+
+    start = time.perf_counter()
+    n_rows = 0
+    writer = None
+    pending = deque()
+    # Written under a temporary name and renamed once complete, so a failed
+    # chunk never leaves a truncated file at output_path
+    tmp_path = f"{output_path}.tmp"
+
+    def write(result):
+        nonlocal writer, n_rows
+        table = pa.Table.from_pandas(result, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(tmp_path, table.schema)
+        writer.write_table(table)
+        n_rows += len(result)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+            for chunk in iter_input_chunks(input_path, columns, chunksize):
+                chunk_ids = [column for column in id_columns if column in chunk.columns]
+                pending.append(pool.submit(_score_in_worker, chunk, chunk_ids))
+                # Keep at most two chunks per worker in flight so memory stays bounded
+                while len(pending) >= 2 * workers:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        os.replace(tmp_path, output_path)
+
+    seconds = time.perf_counter() - start
+    own_rss, children_rss = peak_rss_mb()
+    report = {'rows': n_rows, 'seconds': seconds, 'rows_per_sec': n_rows / seconds if seconds else 0.0,
+              'peak_rss_mb': own_rss, 'peak_worker_rss_mb': children_rss}
+    print(f"Scored {n_rows} rows in {seconds:.1f}s ({report['rows_per_sec']:.0f} rows/sec), "
+          f"peak RSS {own_rss:.0f} MB (workers {children_rss:.0f} MB)")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score OSHA incident records in bulk.")
+    parser.add_argument('input', help="CSV or Parquet extract")
+    parser.add_argument('output', help="Output Parquet file")
+    parser.add_argument('--model', default=MODEL_PATH, help="Saved model artifact")
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--id-columns', nargs='*', default=['activity_nr', 'rel_insp_nr'])
+    args = parser.parse_args(argv)
+    score_file(args.input, args.output, args.model, args.chunksize, args.workers, args.id_columns)
+
+
+if __name__ == '__main__':
+    main()
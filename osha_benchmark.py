@@ -0,0 +1,203 @@
+"""Headless benchmark of every pipeline stage.
+
+Generates OSHA-shaped synthetic data (osha_synthetic) at several row counts
+and measures wall/CPU time, RSS and peak traced memory of each stage of the
+project with osha_profiling.StageRecorder: load, column drop, imputation, IQR
+filtering, one-hot encoding, feature selection, SMOTE, fit and predict of
+every candidate model, the random forest predict with sklearn and with
+osha_forest.FlatForest at batch sizes 1, 1k and 1M, and the hyperparameter
+search. Results are written as
+JSON so two runs (e.g. two versions of the code) can be compared.
+
+Usage:
+    python osha_benchmark.py --rows 10000 100000 1000000 --output benchmark.json
+    python osha_benchmark.py --rows 10000 --output new.json --baseline benchmark.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.impute import SimpleImputer
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+
+from osha_data import drop_sparse_columns, filter_outliers_iqr, load_osha_data
+from osha_features import encode_sparse
+from osha_forest import FlatForest
+from osha_profiling import StageRecorder
+from osha_resampling import ChunkedSMOTE
+from osha_selection import select_features
+from osha_synthetic import write_synthetic_osha
+from osha_tuning import candidate_models, tune_models
+
+# Models whose cost grows faster than linearly are fitted on at most this many rows
+MAX_FIT_ROWS = {'SVM': 20_000, 'KNN': 200_000}
+
+# Batch sizes of the sklearn vs FlatForest random forest predict stages
+FOREST_BATCH_SIZES = (1, 1_000, 1_000_000)
+
+# Small grids keep the search stage comparable between runs
+BENCHMARK_GRIDS = {
+    "Random Forest": {'n_estimators': [20, 50], 'max_depth': [10, None]},
+    "Decision Tree": {'max_depth': [10, None]},
+    "Logistic Regression": {'C': [0.1, 1]},
+    "SVM": {'C': [0.1, 1]},
+    "KNN": {'n_neighbors': [5, 9]},
+}
+
+
+def run_pipeline_benchmark(n_rows, workdir, random_state=42, search=True):
+    """Run every stage on n_rows synthetic rows and return the stage records."""
+    recorder = StageRecorder(log_path=None, trace_memory=True)
+    csv_path = os.path.join(workdir, f"osha_{n_rows}.csv")
+    write_synthetic_osha(csv_path, n_rows, random_state=random_state)
+    print(f"Benchmark on {n_rows} rows")
+
+    with recorder.stage('load') as stage:
+        data = stage.output(load_osha_data(csv_path))
+    with recorder.stage('column_drop', data) as stage:
+        data = stage.output(drop_sparse_columns(data, 0.5))
+    with recorder.stage('imputation', data) as stage:
+        data['degree_of_inj'] = SimpleImputer(strategy='median').fit_transform(data[['degree_of_inj']])
+        for column in ['sex', 'union_status']:
+            data[column] = SimpleImputer(strategy='most_frequent').fit_transform(data[[column]]).flatten()
+        stage.output(data)
+    with recorder.stage('iqr_filter', data) as stage:
+        numeric_columns = [column for column in data.select_dtypes(include="number") if column != 'degree_of_inj']
+        data, _ = filter_outliers_iqr(data, numeric_columns)
+        stage.output(data)
+
+    x, y = data.drop(columns='degree_of_inj'), data['degree_of_inj'].to_numpy()
+    categorical_columns = [column for column in x.columns if column not in numeric_columns]
+    with recorder.stage('one_hot', x) as stage:
+        x, feature_names, _ = encode_sparse(x, categorical_columns)
+        stage.output(x)
+    with recorder.stage('feature_selection', x) as stage:
+        selected, _, _ = select_features(x, y, feature_names, cache_dir=None, random_state=random_state)
+        x = stage.output(x[:, selected])
+    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.2, random_state=random_state)
+    with recorder.stage('scaling', x_train) as stage:
+        scaler = StandardScaler(with_mean=False)
+        x_train = stage.output(scaler.fit_transform(x_train))
+        x_test = scaler.transform(x_test)
+    with recorder.stage('smote', x_train) as stage:
+        stage.output(ChunkedSMOTE(random_state=random_state).fit_resample(x_train, y_train))
+
+    fitted = {}
+    for name, model in candidate_models().items():
+        rows = min(x_train.shape[0], MAX_FIT_ROWS.get(name, x_train.shape[0]))
+        with recorder.stage(f'fit:{name}', x_train[:rows]):
+            fitted[name] = model.fit(x_train[:rows], y_train[:rows])
+        with recorder.stage(f'predict:{name}', x_test) as stage:
+            stage.output(model.predict(x_test))
+
+    forest = fitted['Random Forest']
+    with recorder.stage('compile:FlatForest'):
+        flat = FlatForest.from_sklearn(forest)
+    rng = np.random.RandomState(random_state)
+    for batch_size in FOREST_BATCH_SIZES:
+        batch = x_test[rng.randint(0, x_test.shape[0], size=batch_size)]
+        predictions = {}
+        for engine, model in (('sklearn', forest), ('flat', flat)):
+            with recorder.stage(f'forest_predict:{engine}:{batch_size}', batch) as stage:
+                predictions[engine] = stage.output(model.predict(batch))
+        if not np.array_equal(predictions['sklearn'], predictions['flat']):
+            raise AssertionError(f"FlatForest predictions differ from sklearn at batch size {batch_size}")
+
+    if search:
+        rows = min(x_train.shape[0], 20_000)
+        with recorder.stage('grid_search', x_train[:rows]):
+            tune_models(x_train[:rows], y_train[:rows], param_grids=BENCHMARK_GRIDS, search='grid', cv=3,
+                        checkpoint_dir=None, refit=False)
+    os.remove(csv_path)
+    return [{'dataset_rows': n_rows, **record} for record in recorder.records]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(row_counts=(10_000, 100_000, 1_000_000), output='benchmark_results.json', random_state=42,
+                   search=True):
+    """Benchmark every row count and write the results with run metadata as JSON."""
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_rows in row_counts:
+            results.extend(run_pipeline_benchmark(n_rows, workdir, random_state, search))
+    report = {
+        'metadata': {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'sklearn': sklearn.__version__,
+            'random_state': random_state,
+        },
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results written to {output}")
+    return report
+
+
+def compare_benchmarks(baseline_path, current_path, tolerance=0.2):
+    """
+    Compare two benchmark JSON files and list the regressions.
+
+    Args:
+        baseline_path: Results of the reference run.
+        current_path: Results of the new run.
+        tolerance: Relative slowdown (or memory growth) reported as a regression.
+
+    Returns:
+        DataFrame with both measurements and the ratios of every stage present in both runs.
+    """
+    frames = []
+    for path in (baseline_path, current_path):
+        with open(path) as f:
+            results = pd.DataFrame(json.load(f)['results']).set_index(['dataset_rows', 'stage'])
+            frames.append(results[['wall_s', 'traced_peak_mb']])
+    table = frames[0].join(frames[1], lsuffix='_baseline', rsuffix='_current', how='inner')
+    table['time_ratio'] = table['wall_s_current'] / table['wall_s_baseline']
+    table['memory_ratio'] = table['traced_peak_mb_current'] / table['traced_peak_mb_baseline'].replace(0, np.nan)
+    table['regression'] = (table['time_ratio'] > 1 + tolerance) | (table['memory_ratio'] > 1 + tolerance)
+    regressions = table[table['regression']]
+    if len(regressions):
+        print(f"Regressions above {tolerance:.0%}:")
+        print(regressions.to_string())
+    else:
+        print("No regressions")
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the degree of injury pipeline.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="Earlier results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--no-search', action='store_true', help="Skip the hyperparameter search stage")
+    args = parser.parse_args(argv)
+    run_benchmarks(args.rows, args.output, search=not args.no_search)
+    if args.baseline:
+        compare_benchmarks(args.baseline, args.output, args.tolerance)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Histogram gradient boosting candidate with native categorical support.
+
+SVC(probability=True) scales roughly quadratically with the number of rows and
+KNN keeps the whole training set for prediction. HistGradientBoostingClassifier
+bins every feature once and grows trees on the histograms, so it scales
+linearly, handles missing numeric values itself and splits categorical columns
+natively. The one-hot encoding, imputation and scaling steps are therefore not
+used: build_hgb_pipeline only ordinal-encodes the categorical columns of the
+raw records and marks them as categorical for the model. A missing category
+gets a code of its own, like the fatality_nan column of the one-hot path:
+fatality only takes the value 'X', so in HGB's missing bin it could not be
+split on at all. Class imbalance is
+handled with class_weight instead of SMOTE, which would interpolate category
+codes.
+
+The pipeline takes the same raw records as osha_pipeline.prepare_records
+returns, so it is tuned with tune_models, saved with save_model and served like
+the other models.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.metrics import accuracy_score
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OrdinalEncoder
+from sklearn.utils import _safe_indexing
+
+from osha_pipeline import split_columns
+
+GRADIENT_BOOSTING = "Gradient Boosting"
+
+# Category of the missing values of the categorical columns
+MISSING_CATEGORY = '<missing>'
+
+HGB_PARAM_GRID = {
+    'model__learning_rate': [0.05, 0.1, 0.2],
+    'model__max_leaf_nodes': [31, 63, 127],
+    'model__l2_regularization': [0.0, 1.0],
+    'model__class_weight': [None, 'balanced'],
+}
+
+
+def native_preprocessor(numeric_columns, categorical_columns):
+    """
+    Pass the numeric columns through and ordinal-encode the categorical ones.
+
+    Missing categories are encoded as the MISSING_CATEGORY category; unknown
+    categories go to HGB's missing bin.
+    """
+    categorical = Pipeline([
+        ('fill', SimpleImputer(strategy='constant', fill_value=MISSING_CATEGORY)),
+        ('encode', OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=np.nan)),
+    ])
+    return ColumnTransformer([
+        ('numeric', 'passthrough', numeric_columns),
+        ('categorical', categorical, categorical_columns),
+    ], sparse_threshold=0)
+
+
+def build_hgb_pipeline(x, random_state=42, **params):
+    """
+    Build the gradient boosting pipeline for the raw feature frame x.
+
+    Args:
+        x: Raw training features (cleaned_data without degree_of_inj).
+        random_state: Seed of the model (early stopping split and binning subsample).
+        **params: Extra HistGradientBoostingClassifier parameters.
+    """
+    numeric_columns, categorical_columns = split_columns(x)
+    # The ColumnTransformer outputs the numeric columns first, then the categorical ones
+    categorical_features = list(range(len(numeric_columns), len(numeric_columns) + len(categorical_columns)))
+    model = HistGradientBoostingClassifier(categorical_features=categorical_features, random_state=random_state,
+                                           **params)
+    return Pipeline([
+        ('preprocess', native_preprocessor(numeric_columns, categorical_columns)),
+        ('model', model),
+    ])
+
+
+def _predict_latency_ms(model, x, n_rows=200, random_state=42):
+    """Median latency of single-row predictions, in milliseconds."""
+    rows = np.random.RandomState(random_state).randint(0, x.shape[0], size=min(n_rows, x.shape[0]))
+    timings = []
+    for row in rows:
+        single = _safe_indexing(x, [row])
+        start = time.perf_counter()
+        model.predict(single)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def compare_models(entries, y_test, refit=True):
+    """
+    Compare fit time, predict latency and accuracy of several models.
+
+    Each model can use its own inputs (e.g. the scaled one-hot matrix for the
+    five original candidates and the raw records for gradient boosting).
+
+    Args:
+        entries: Dict of name -> (model, x_train, y_train, x_test).
+        y_test: Test target shared by all models.
+        refit: Refit a clone of each model on x_train, y_train to time the fit.
+            When False the models must already be fitted and fit_s is empty.
+
+    Returns:
+        DataFrame with one row per model, sorted by accuracy.
+    """
+    rows = []
+    for name, (model, x_train, y_train, x_test) in entries.items():
+        fit_seconds = np.nan
+        if refit:
+            model = clone(model)
+            start = time.perf_counter()
+            model.fit(x_train, y_train)
+            fit_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        y_pred = model.predict(x_test)
+        batch_seconds = time.perf_counter() - start
+        rows.append({
+            'model': name,
+            'accuracy': accuracy_score(y_test, y_pred),
+            'fit_s': fit_seconds,
+            'predict_batch_s': batch_seconds,
+            'predict_rows_per_s': x_test.shape[0] / batch_seconds if batch_seconds else np.inf,
+            'predict_single_ms': _predict_latency_ms(model, x_test),
+        })
+    report = pd.DataFrame(rows).sort_values('accuracy', ascending=False, ignore_index=True)
+    print(report.to_string(index=False))
+    return report
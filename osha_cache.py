@@ -0,0 +1,93 @@
+"""Columnar cache of the cleaned OSHA dataset.
+
+Parsing the raw CSV and re-running the drop, imputation and outlier steps takes
+minutes on the yearly files. The cleaned frame is written once to an
+uncompressed Feather file whose name is a fingerprint of the source CSV and the
+cleaning parameters, so later runs read it back in one columnar pass and skip
+cleaning.
+"""
+
+import hashlib
+import json
+import os
+
+import pyarrow.feather as feather
+
+from osha_data import DATA_PATH, DROP_COLUMNS, MAX_NULL_FRACTION, OSHA_DTYPES, clean_osha_data, load_profiled_osha_data
+
+CACHE_DIR = "osha_cache"
+
+# Bump when the cleaning code changes so old cache files are not reused
+CACHE_VERSION = 2
+
+
+def file_fingerprint(path, block_size=8 * 1024 * 1024):
+    """Return a hex digest of the file contents, read in blocks."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(path, **params):
+    """
+    Build the cache key from the source CSV and the cleaning parameters.
+
+    Args:
+        path: Path to the raw OSHA CSV.
+        **params: Cleaning parameters (e.g. max_null_fraction) that change the output.
+    """
+    params = {'version': CACHE_VERSION, 'drop_columns': sorted(DROP_COLUMNS),
+              'dtype': OSHA_DTYPES, **params}
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(file_fingerprint(path).encode())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def cache_path(key, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f"cleaned_{key}.feather")
+
+
+def write_cache(cleaned_data, key, cache_dir=CACHE_DIR):
+    """Write the cleaned frame to the cache (uncompressed, so reading it needs no decompression)."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(key, cache_dir)
+    tmp_path = path + '.tmp'
+    feather.write_feather(cleaned_data.reset_index(drop=True), tmp_path, compression='uncompressed')
+    # Rename at the end so an interrupted write never leaves a half written cache
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_cache(key, cache_dir=CACHE_DIR):
+    """
+    Read a cached frame, or return None when it does not exist.
+
+    The table is converted to a regular pandas frame (numpy and categorical
+    columns), which copies it into memory, so it is not memory-mapped.
+    """
+    path = cache_path(key, cache_dir)
+    if not os.path.exists(path):
+        return None
+    return feather.read_feather(path)
+
+
+def load_cleaned_data(path=DATA_PATH, cache_dir=CACHE_DIR, max_null_fraction=MAX_NULL_FRACTION, chunksize=100_000):
+    """
+    Return the cleaned dataset, from the cache when possible.
+
+    On a cache miss the CSV is loaded without duplicate rows, cleaned with
+    clean_osha_data and the result is written to the cache for the next run.
+    """
+    key = cache_key(path, max_null_fraction=max_null_fraction, drop_duplicates=True)
+    cleaned_data = read_cache(key, cache_dir)
+    if cleaned_data is not None:
+        print(f"Loaded cleaned data from cache {cache_path(key, cache_dir)}")
+        return cleaned_data
+
+    data, _, _ = load_profiled_osha_data(path, chunksize, max_null_fraction)
+    cleaned_data = clean_osha_data(data, max_null_fraction)
+    print(f"Cleaned data cached as {write_cache(cleaned_data, key, cache_dir)}")
+    return cleaned_data
@@ -0,0 +1,218 @@
+"""Compact low-precision feature representation.
+
+After encoding every feature is float64, although the one-hot columns only
+hold 0/1, age/nature_of_inj/part_of_body/src_of_injury/... are small integer
+codes and activity_nr/rel_insp_nr are inspection identifiers with no meaning as
+numbers. CompactEncoder produces the model features as a DataFrame with:
+
+- uint8 one-hot columns (missing values are their own category except for
+  the most frequent imputed columns, unknown categories encode to zeros);
+- the integer codes median-imputed in the smallest signed integer dtype that
+  holds their training range (int8/int16/int32), or float32 standardized
+  values when scale=True (for the linear, SVM and KNN models);
+- the identifier columns dropped, or hashed into n_hash_buckets int16 buckets.
+
+It is a regular sklearn transformer, so build_pipeline(..., compact=True) puts
+it in the saved pipeline in place of the ColumnTransformer and training and
+inference use the same representation. compare_representations reports the
+memory of both training matrices and the accuracy of a model on each.
+
+ChunkedSMOTE interpolates between neighbours, so with a sampler the codes are
+scaled (float32) even for trees, and the synthetic values of the integer
+columns are rounded back to valid codes.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.base import BaseEstimator, TransformerMixin, clone
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+from osha_features import sparse_nbytes
+
+ID_COLUMNS = ('activity_nr', 'rel_insp_nr')
+
+# Models that split on thresholds and do not need scaled codes
+TREE_MODELS = (DecisionTreeClassifier, RandomForestClassifier, ExtraTreesClassifier)
+
+INTEGER_DTYPES = (np.int8, np.int16, np.int32)
+
+
+def integer_dtype(low, high):
+    """Smallest signed integer dtype holding [low, high], None if it does not fit in int32."""
+    for dtype in INTEGER_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return None
+
+
+def frame_nbytes(frame):
+    """Memory of the column arrays of a DataFrame (without the index)."""
+    return int(frame.memory_usage(index=False).sum())
+
+
+class CompactEncoder(TransformerMixin, BaseEstimator):
+    """
+    Encode raw records (prepare_records output) into compact typed feature columns.
+
+    Args:
+        id_columns: Identifier columns, dropped or hashed.
+        id_mode: 'drop' or 'hash'.
+        n_hash_buckets: Buckets of the hashed identifiers (at most 32768, int16).
+        scale: Standardize the numeric codes as float32 instead of keeping integers.
+        most_frequent_columns: Categorical columns imputed with their most
+            frequent value; in the other ones a missing value is a category.
+    """
+
+    def __init__(self, id_columns=ID_COLUMNS, id_mode='drop', n_hash_buckets=4096, scale=False,
+                 most_frequent_columns=()):
+        self.id_columns = id_columns
+        self.id_mode = id_mode
+        self.n_hash_buckets = n_hash_buckets
+        self.scale = scale
+        self.most_frequent_columns = most_frequent_columns
+
+    def fit(self, x, y=None):
+        if self.id_mode not in ('drop', 'hash'):
+            raise ValueError(f"Unknown id_mode {self.id_mode!r}, expected 'drop' or 'hash'")
+        if not 0 < self.n_hash_buckets <= 32768:
+            raise ValueError("n_hash_buckets must be between 1 and 32768 to fit in int16")
+        x = pd.DataFrame(x)
+        numeric = list(x.select_dtypes(include='number'))
+        self.id_columns_ = [column for column in numeric if column in self.id_columns]
+        self.numeric_columns_ = [column for column in numeric if column not in self.id_columns]
+        self.categorical_columns_ = [column for column in x.columns if column not in numeric]
+        values = x[self.numeric_columns_].astype('float64')
+        self.fill_ = values.median().fillna(0.0)
+        values = values.fillna(self.fill_)
+        self.dtypes_ = {}
+        if self.scale:
+            self.mean_ = values.mean()
+            self.std_ = values.std(ddof=0).replace(0.0, 1.0).fillna(1.0)
+        for column in self.numeric_columns_:
+            column_values = values[column].to_numpy()
+            dtype = None
+            if not self.scale and len(column_values) and np.all(column_values == np.round(column_values)):
+                dtype = integer_dtype(column_values.min(), column_values.max())
+            self.dtypes_[column] = dtype or np.dtype(np.float32)
+        self.categories_ = {column: [] for column in self.categorical_columns_}
+        self.category_fill_ = {}
+        for column in self.categorical_columns_:
+            if column in self.most_frequent_columns:
+                mode = x[column].dropna().astype(str).value_counts()
+                self.category_fill_[column] = mode.sort_index().idxmax() if len(mode) else 'missing'
+        self.n_features_in_ = x.shape[1]
+        self.feature_names_in_ = np.array(x.columns, dtype=object)
+        return self.extend_categories(x)
+
+    def extend_categories(self, x):
+        """
+        Add the categories of new records to the fitted encoder, in place.
+
+        The imputation values, integer dtypes and scaling stay as fitted, so
+        known categories and numeric codes encode as before and the new
+        categories get new one-hot columns (used by osha_incremental).
+        """
+        x = pd.DataFrame(x)
+        for column in self.categorical_columns_:
+            column_values = x[column]
+            if column in self.category_fill_:
+                column_values = column_values.fillna(self.category_fill_[column])
+            categories = self.categories_[column]
+            known = sorted({category for category in categories if category is not None}
+                           | set(column_values.dropna().astype(str).unique()))
+            missing = None in categories or column_values.isna().any()
+            self.categories_[column] = known + ([None] if missing else [])
+        self.feature_names_out_ = np.array(
+            self.numeric_columns_
+            + (self.id_columns_ if self.id_mode == 'hash' else [])
+            + [f"{column}_{'nan' if category is None else category}"
+               for column, categories in self.categories_.items() for category in categories], dtype=object)
+        return self
+
+    def transform(self, x):
+        x = pd.DataFrame(x)
+        n_rows = len(x)
+        columns = {}
+        values = x[self.numeric_columns_].astype('float64').fillna(self.fill_)
+        for column in self.numeric_columns_:
+            column_values = values[column].to_numpy()
+            dtype = self.dtypes_[column]
+            if self.scale:
+                column_values = (column_values - self.mean_[column]) / self.std_[column]
+            elif dtype.kind == 'i':
+                # Codes outside the training range are clipped into the integer dtype
+                info = np.iinfo(dtype)
+                column_values = np.clip(np.round(column_values), info.min, info.max)
+            columns[column] = column_values.astype(dtype)
+        if self.id_mode == 'hash':
+            for column in self.id_columns_:
+                hashes = pd.util.hash_array(x[column].astype('float64').to_numpy())
+                columns[column] = (hashes % np.uint64(self.n_hash_buckets)).astype(np.int16)
+        for column, categories in self.categories_.items():
+            column_values = x[column]
+            if column in self.category_fill_:
+                column_values = column_values.fillna(self.category_fill_[column])
+            known = [category for category in categories if category is not None]
+            codes = pd.Categorical(column_values.where(column_values.isna(), column_values.astype(str)),
+                                   categories=known).codes.astype(np.int64)
+            if None in categories:
+                codes[column_values.isna().to_numpy()] = len(known)
+            one_hot = np.zeros((n_rows, len(categories)), dtype=np.uint8)
+            valid = codes >= 0
+            one_hot[np.flatnonzero(valid), codes[valid]] = 1
+            for j, category in enumerate(categories):
+                columns[f"{column}_{'nan' if category is None else category}"] = one_hot[:, j]
+        return pd.DataFrame(columns, index=x.index)[list(self.feature_names_out_)]
+
+    def get_feature_names_out(self, input_features=None):
+        return self.feature_names_out_
+
+
+def compare_representations(model, x_train, y_train, x_test, y_test, sampler=None, id_mode='drop'):
+    """
+    Fit model on the float64 one-hot features and on the compact features and compare.
+
+    Args:
+        model: Unfitted classifier.
+        x_train, y_train: Raw training records and target.
+        x_test, y_test: Raw held-out records and target, a validation split
+            of the training rows when the result chooses the representation.
+        sampler: Optional oversampler used in both pipelines (e.g. ChunkedSMOTE).
+        id_mode: CompactEncoder id_mode.
+
+    Returns:
+        DataFrame with the training matrix memory, fit time and held-out accuracy
+        of the 'float64' and 'compact' representations, and a dict with both
+        fitted pipelines under the same keys.
+    """
+    from osha_pipeline import fit_pipeline, prepare_records, split_columns
+
+    numeric_columns, categorical_columns = split_columns(x_train)
+    train_records = prepare_records(x_train, numeric_columns, categorical_columns)
+    test_records = prepare_records(x_test, numeric_columns, categorical_columns)
+    rows, pipelines = [], {}
+    for name, compact in (('float64', False), ('compact', True)):
+        start = time.perf_counter()
+        pipelines[name] = fit_pipeline(clone(model), x_train, y_train, sampler=sampler, compact=compact,
+                                       id_mode=id_mode)
+        fit_seconds = time.perf_counter() - start
+        features = pipelines[name].named_steps['preprocess'].transform(train_records)
+        if compact:
+            nbytes = frame_nbytes(features)
+        else:
+            # The ColumnTransformer output is dense when no categorical column is selected
+            nbytes = sparse_nbytes(features.tocsr()) if sparse.issparse(features) else features.nbytes
+        rows.append({'representation': name, 'ids': id_mode if compact else 'numeric',
+                     'features': features.shape[1], 'train_mb': nbytes / 1024 ** 2,
+                     'bytes_per_row': nbytes / max(features.shape[0], 1), 'fit_s': fit_seconds,
+                     'accuracy': pipelines[name].score(test_records, y_test)})
+    report = pd.DataFrame(rows).set_index('representation')
+    print(report.to_string())
+    print(f"Compact features use {1 - report.loc['compact', 'train_mb'] / report.loc['float64', 'train_mb']:.0%} "
+          f"less memory, accuracy change {report.loc['compact', 'accuracy'] - report.loc['float64', 'accuracy']:+.4f}")
+    return report, pipelines
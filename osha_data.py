@@ -0,0 +1,321 @@
+"""Loading helpers for the merged OSHA accident and inspection CSV.
+
+The merged yearly files are several GB, so instead of reading everything and
+dropping columns afterwards we only parse the columns the project keeps, pin
+their dtypes up front and read the file in chunks.
+
+load_profiled_osha_data also profiles the file in the same pass: null counts,
+distinct values and a 64-bit hash of every row, so duplicate rows are dropped
+per chunk before the table is built and mostly empty columns are dropped by a
+null fraction instead of the absolute thresh=15000 of the notebook.
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from sklearn.impute import SimpleImputer
+
+DATA_PATH = "/content/Final OSHA Accident and Inspections Data Merged May 2021.csv"
+
+# Columns that are never used by the project (free text, addresses, dates,
+# duplicated keys and mostly empty columns)
+DROP_COLUMNS = ['state_flag', 'health_const', 'nr_in_estab', 'reporting_id', 'health_marit', 'migrant', 'report_id',
+                'abstract_text', 'fall_distance', 'event_date', 'event_time', 'summary_nr', 'injury_line_nr',
+                'occ_code', 'naics_code', 'adv_notice', 'state_flag.1', 'site_zip', 'mail_street', 'mail_city',
+                'open_date', 'case_mod_date', 'close_conf_date', 'sic_code', 'host_est_key', 'site_address',
+                'mail_zip', 'owner_code', 'nonbuild_ht', 'close_case_date', 'ld_dt']
+
+# Low cardinality text columns are stored as categoricals
+CATEGORICAL_DTYPES = {
+    'sex': 'category',
+    'union_status': 'category',
+    'fatality': 'category',
+}
+
+# Coded columns hold small integers with missing values, so nullable ints are used
+CODE_DTYPES = {
+    'age': 'Int8',
+    'degree_of_inj': 'Int8',
+    'nature_of_inj': 'Int16',
+    'part_of_body': 'Int16',
+    'src_of_injury': 'Int16',
+    'event_type': 'Int16',
+    'evn_factor': 'Int16',
+    'hum_factor': 'Int16',
+    'task_assigned': 'Int8',
+    'sic_list': 'Int16',
+    'activity_nr': 'Int64',
+    'rel_insp_nr': 'Int64',
+}
+
+OSHA_DTYPES = {**CATEGORICAL_DTYPES, **CODE_DTYPES}
+
+# Columns with a larger fraction of missing values are dropped. The notebook kept
+# columns with at least 15000 non-null values out of the 23896 rows of the May
+# 2021 file, i.e. at most 37% missing.
+MAX_NULL_FRACTION = 0.37
+
+
+def keep_column(column, drop_columns=DROP_COLUMNS):
+    """Return True for columns the loader should parse."""
+    return column not in drop_columns
+
+
+def iter_osha_chunks(path=DATA_PATH, chunksize=100_000, drop_columns=DROP_COLUMNS, dtype=OSHA_DTYPES):
+    """
+    Stream the OSHA CSV in chunks, parsing only the kept columns.
+
+    Args:
+        path: Path to the merged OSHA CSV file.
+        chunksize: Number of rows read per chunk.
+        drop_columns: Columns that are skipped while parsing.
+        dtype: Dtype map applied to the columns that are present.
+
+    Yields:
+        One DataFrame per chunk.
+    """
+    reader = pd.read_csv(path, usecols=lambda column: keep_column(column, drop_columns),
+                         dtype=dtype, chunksize=chunksize, low_memory=False)
+    with reader:
+        for chunk in reader:
+            yield chunk
+
+
+def concat_chunks(chunks):
+    """
+    Concatenate chunks while keeping categorical columns categorical.
+
+    Chunks can see different category sets, which would make pd.concat fall
+    back to object columns, so the categories are unioned first.
+    """
+    chunks = list(chunks)
+    if not chunks:
+        return pd.DataFrame()
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            # A chunk where the column is all missing has no categories (of float dtype) and is left out of the union
+            observed = [chunk[column] for chunk in chunks if len(chunk[column].cat.categories)]
+            if not observed:
+                continue
+            categories = union_categoricals(observed).categories
+            for chunk in chunks:
+                chunk[column] = chunk[column].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def load_osha_data(path=DATA_PATH, chunksize=100_000, drop_columns=DROP_COLUMNS, dtype=OSHA_DTYPES):
+    """
+    Load the OSHA CSV with only the kept columns and compact dtypes.
+
+    Peak memory while parsing is bounded by the chunk size instead of the size
+    of the full file.
+    """
+    return concat_chunks(iter_osha_chunks(path, chunksize, drop_columns, dtype))
+
+
+class ColumnProfile:
+    """
+    Null counts, distinct values and duplicate rows of a table read in chunks.
+
+    update() is called once per chunk in file order and returns the mask of the
+    rows seen before (same 64-bit hash of all parsed columns, in this chunk or
+    an earlier one). Null counts and distinct values are counted on the rows
+    that are not duplicates; missing values are not counted as a distinct value.
+    """
+
+    def __init__(self):
+        self.n_rows = 0
+        self.n_kept = 0
+        self.null_counts = {}
+        self.distinct = {}
+        self.dtypes = {}
+        self.duplicate_rows = []
+        self._seen_rows = np.empty(0, dtype=np.uint64)
+
+    def update(self, chunk):
+        row_hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        duplicate = pd.Series(row_hashes).duplicated().to_numpy() | np.isin(row_hashes, self._seen_rows)
+        self._seen_rows = np.union1d(self._seen_rows, row_hashes)
+        self.duplicate_rows.append(self.n_rows + np.flatnonzero(duplicate))
+        self.n_rows += len(chunk)
+        kept = chunk[~duplicate]
+        self.n_kept += len(kept)
+        for column in kept.columns:
+            values = kept[column]
+            missing = values.isna()
+            self.null_counts[column] = self.null_counts.get(column, 0) + int(missing.sum())
+            hashes = np.unique(pd.util.hash_pandas_object(values[~missing], index=False).to_numpy())
+            self.distinct[column] = np.union1d(self.distinct.get(column, np.empty(0, dtype=np.uint64)), hashes)
+            self.dtypes[column] = str(values.dtype)
+        return duplicate
+
+    def report(self, max_null_fraction=MAX_NULL_FRACTION):
+        """
+        DataFrame with the dtype, null_count, null_rate, n_unique and a
+        'dropped' flag (null_rate above max_null_fraction) of every column.
+        """
+        report = pd.DataFrame({
+            'dtype': pd.Series(self.dtypes),
+            'null_count': pd.Series(self.null_counts, dtype='int64'),
+            'n_unique': pd.Series({column: len(values) for column, values in self.distinct.items()}, dtype='int64'),
+        })
+        report.insert(2, 'null_rate', report['null_count'] / max(self.n_kept, 1))
+        report['dropped'] = report['null_rate'] > max_null_fraction
+        return report
+
+
+def drop_sparse_columns(data, max_null_fraction=MAX_NULL_FRACTION):
+    """Drop the columns whose fraction of missing values is above max_null_fraction."""
+    return data.loc[:, data.isna().mean() <= max_null_fraction]
+
+
+def load_profiled_osha_data(path=DATA_PATH, chunksize=100_000, max_null_fraction=MAX_NULL_FRACTION,
+                            drop_duplicates=True, drop_columns=DROP_COLUMNS, dtype=OSHA_DTYPES):
+    """
+    Load the OSHA CSV, profile it and drop duplicate rows and sparse columns in one pass.
+
+    Args:
+        path: Path to the merged OSHA CSV file.
+        chunksize: Number of rows read per chunk.
+        max_null_fraction: Columns with a larger fraction of missing values
+            (after removing duplicates) are dropped.
+        drop_duplicates: Skip rows identical to an earlier row on all parsed columns.
+        drop_columns: Columns that are skipped while parsing.
+        dtype: Dtype map applied to the columns that are present.
+
+    Returns:
+        The loaded DataFrame, the ColumnProfile.report() DataFrame and the
+        positions (0-based data rows of the file) of the duplicate rows.
+    """
+    profile = ColumnProfile()
+    chunks = []
+    for chunk in iter_osha_chunks(path, chunksize, drop_columns, dtype):
+        duplicate = profile.update(chunk)
+        chunks.append(chunk[~duplicate] if drop_duplicates else chunk)
+    report = profile.report(max_null_fraction)
+    kept_columns = list(report.index[~report['dropped']])
+    # Sparse columns are removed from every chunk, so the full table is only built once
+    data = concat_chunks(chunk[kept_columns] for chunk in chunks)
+    duplicate_rows = np.concatenate(profile.duplicate_rows) if profile.duplicate_rows else np.empty(0, np.int64)
+    print(f"Loaded {profile.n_rows} rows: {len(duplicate_rows)} duplicate rows "
+          f"{'dropped' if drop_duplicates else 'found'}, {int(report['dropped'].sum())} columns with more than "
+          f"{max_null_fraction:.0%} missing values dropped")
+    return data, report, duplicate_rows
+
+
+def remove_outliers_iqr(data, column):
+    Q1 = data[column].quantile(0.25)
+    Q3 = data[column].quantile(0.75)
+    IQR = Q3 - Q1
+
+    lower_bound = Q1 - 1.5 * IQR
+    upper_bound = Q3 + 1.5 * IQR
+
+    # Return a filtered DataFrame that excludes outliers
+    # Missing values never pass the filter (nullable integer columns give NA instead of False)
+    return data[((data[column] >= lower_bound) & (data[column] <= upper_bound)).fillna(False)]
+
+
+def iqr_bounds(data, columns, mode='sequential', k=1.5):
+    """
+    Lower and upper IQR outlier bounds of several columns.
+
+    Args:
+        data: DataFrame the bounds are computed on.
+        columns: Numeric columns.
+        mode: 'sequential' computes the bounds of each column on the rows left
+            by the bounds of the previous ones (like calling remove_outliers_iqr
+            column after column); 'independent' computes all bounds on the
+            full frame with one quantile call.
+        k: IQR multiplier used for the bounds.
+
+    Returns:
+        DataFrame with 'lower' and 'upper' columns, indexed by column name.
+    """
+    columns = list(columns)
+    values = data[columns].astype('float64')
+    if mode == 'independent':
+        quantiles = values.quantile([0.25, 0.75])
+        Q1, Q3 = quantiles.loc[0.25].to_numpy(), quantiles.loc[0.75].to_numpy()
+    elif mode == 'sequential':
+        values = values.to_numpy()
+        keep = np.ones(len(data), dtype=bool)
+        Q1, Q3 = np.full(len(columns), np.nan), np.full(len(columns), np.nan)
+        for j in range(len(columns)):
+            if keep.any():
+                Q1[j], Q3[j] = np.nanquantile(values[keep, j], [0.25, 0.75])
+            with np.errstate(invalid='ignore'):
+                keep &= (values[:, j] >= Q1[j] - k * (Q3[j] - Q1[j])) & (values[:, j] <= Q3[j] + k * (Q3[j] - Q1[j]))
+    else:
+        raise ValueError(f"Unknown mode '{mode}', expected 'sequential' or 'independent'")
+    IQR = Q3 - Q1
+    return pd.DataFrame({'lower': Q1 - k * IQR, 'upper': Q3 + k * IQR}, index=columns)
+
+
+def filter_outliers_iqr(data, columns, mode='sequential', k=1.5, bounds=None):
+    """
+    Remove IQR outliers from several columns with a single filter of the frame.
+
+    Args:
+        data: DataFrame to filter.
+        columns: Numeric columns checked for outliers.
+        mode: 'sequential' reproduces calling remove_outliers_iqr column after
+            column, 'independent' computes all bounds on the full frame (see
+            iqr_bounds).
+        k: IQR multiplier used for the bounds.
+        bounds: Precomputed iqr_bounds (e.g. of the training data, to filter
+            new rows the same way); computed on data when None.
+
+    Returns:
+        The filtered DataFrame and a Series with the number of rows removed
+        by each column. In sequential mode a row is counted for the first
+        column it fails, in independent mode for each of them.
+    """
+    columns = list(columns)
+    if bounds is None:
+        bounds = iqr_bounds(data, columns, mode, k)
+    values = data[columns].astype('float64').to_numpy()
+    # NaN compares as False, so missing values never pass the filter
+    lower, upper = bounds.loc[columns, 'lower'].to_numpy(), bounds.loc[columns, 'upper'].to_numpy()
+    with np.errstate(invalid='ignore'):
+        inside = (values >= lower) & (values <= upper)
+    if mode == 'independent':
+        removed = pd.Series((~inside).sum(axis=0), index=columns, dtype='int64')
+    elif mode == 'sequential':
+        # Rows already outside an earlier column are not counted again
+        failed_before = np.cumsum(~inside, axis=1) - ~inside > 0
+        removed = pd.Series((~inside & ~failed_before).sum(axis=0), index=columns, dtype='int64')
+    else:
+        raise ValueError(f"Unknown mode '{mode}', expected 'sequential' or 'independent'")
+    return data[inside.all(axis=1)], removed
+
+
+def clean_osha_data(data, max_null_fraction=MAX_NULL_FRACTION, thresh=None):
+    """
+    Apply the cleaning steps of the notebook in one call.
+
+    Drops mostly empty columns, imputes degree_of_inj with the median and
+    sex/union_status with the most frequent value, then removes IQR outliers
+    from every numeric column.
+
+    Args:
+        data: DataFrame returned by load_osha_data.
+        max_null_fraction: Columns with a larger fraction of missing values are dropped.
+        thresh: Minimum number of non-null values a column needs to be kept,
+            instead of max_null_fraction (the notebook used 15000).
+
+    Returns:
+        The cleaned DataFrame.
+    """
+    if thresh is not None:
+        data = data.dropna(axis=1, thresh=thresh)
+    else:
+        data = drop_sparse_columns(data, max_null_fraction)
+    numeric_columns = list(data.select_dtypes(include="number"))
+
+    data['degree_of_inj'] = SimpleImputer(strategy='median').fit_transform(data[['degree_of_inj']])
+    for column in ['sex', 'union_status']:
+        data[column] = SimpleImputer(strategy='most_frequent').fit_transform(data[[column]]).flatten()
+
+    cleaned_data, _ = filter_outliers_iqr(data, numeric_columns)
+    return cleaned_data
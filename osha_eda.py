@@ -0,0 +1,248 @@
+"""Headless EDA report.
+
+The notebook draws every histogram, boxplot, KDE and pair plot interactively
+with plt.show(), one after the other, on the full data. build_eda_report
+renders the same plots without a display:
+
+- histogram counts and boxplot statistics are computed once per column on the
+  full data (np.histogram and quantiles), so only the aggregates are plotted;
+- KDEs and the pair plot use a random sample of sample_size rows;
+- the figures are drawn with the Agg backend in a process pool and embedded
+  as PNG images in a single self-contained HTML file.
+
+Usage:
+    python osha_eda.py --data "Final OSHA Accident and Inspections Data Merged May 2021.csv" --output eda_report.html
+"""
+
+import argparse
+import base64
+import html
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import gaussian_kde
+
+PAIRPLOT_COLUMNS = ['age', 'nature_of_inj', 'part_of_body', 'degree_of_inj']
+TARGET = 'degree_of_inj'
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _sample(values, sample_size, rng):
+    if sample_size is None or len(values) <= sample_size:
+        return values
+    return values[rng.choice(len(values), sample_size, replace=False)]
+
+
+def numeric_summary(series, bins=30, sample_size=100_000, max_fliers=500, random_state=42):
+    """
+    Pre-binned aggregates of a numeric column for the histogram, KDE and boxplot.
+
+    Args:
+        series: Numeric Series (missing values are ignored).
+        bins: Number of histogram bins.
+        sample_size: Rows used to fit the KDE, None for all rows.
+        max_fliers: Maximum number of outliers drawn on the boxplot.
+        random_state: Seed of the sampling.
+
+    Returns:
+        Dict with the histogram counts and edges, the KDE curve and the boxplot statistics.
+    """
+    rng = np.random.RandomState(random_state)
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return None
+    counts, edges = np.histogram(values, bins=bins)
+    summary = {'counts': counts, 'edges': edges, 'n': len(values), 'kde': None}
+    sample = _sample(values, sample_size, rng)
+    if len(np.unique(sample)) > 1:
+        grid = np.linspace(edges[0], edges[-1], 200)
+        # Scaled to the histogram counts, like sns.histplot(kde=True)
+        density = gaussian_kde(sample)(grid) * len(values) * (edges[1] - edges[0])
+        summary['kde'] = (grid, density)
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    fliers = values[(values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)]
+    summary['box'] = {'q1': q1, 'med': median, 'q3': q3, 'whislo': inside.min(), 'whishi': inside.max(),
+                      'fliers': _sample(fliers, max_fliers, rng), 'n_fliers': len(fliers)}
+    return summary
+
+
+def _figure_to_base64(fig):
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=90, bbox_inches='tight')
+    plt.close(fig)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def render_plot(task):
+    """Draw one plot task with Agg and return (title, base64 PNG)."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    kind, title, payload = task
+    if kind == 'numeric':
+        fig, (hist_ax, box_ax) = plt.subplots(1, 2, figsize=(12, 4))
+        edges = payload['edges']
+        hist_ax.bar(edges[:-1], payload['counts'], width=np.diff(edges), align='edge', alpha=0.6,
+                    edgecolor='white')
+        if payload['kde'] is not None:
+            hist_ax.plot(*payload['kde'])
+        hist_ax.set_title(f"Histogram of {title}")
+        hist_ax.set_ylabel('Count')
+        box = dict(payload['box'], label=title)
+        box_ax.bxp([box], orientation='horizontal', showfliers=True)
+        box_ax.set_title(f"Boxplot of {title} ({payload['box']['n_fliers']} outliers)")
+    elif kind == 'counts':
+        fig, ax = plt.subplots(figsize=(8, 4))
+        ax.bar([str(label) for label in payload.index], payload.to_numpy())
+        ax.set_title(title)
+        ax.set_ylabel('Count')
+        ax.tick_params(axis='x', rotation=90)
+    elif kind == 'bar':
+        fig, ax = plt.subplots(figsize=(8, 4))
+        ax.bar([str(label) for label in payload.index], payload.to_numpy())
+        ax.set_title(title)
+    elif kind == 'heatmap':
+        fig, ax = plt.subplots(figsize=(6, 5))
+        image = ax.imshow(payload.to_numpy(), cmap='coolwarm', vmin=-1, vmax=1)
+        ax.set_xticks(range(len(payload.columns)), payload.columns, rotation=90)
+        ax.set_yticks(range(len(payload.index)), payload.index)
+        for (i, j), value in np.ndenumerate(payload.to_numpy()):
+            ax.text(j, i, f"{value:.2f}", ha='center', va='center', fontsize=8)
+        fig.colorbar(image)
+        ax.set_title(title)
+    elif kind == 'pairplot':
+        columns = list(payload.columns)
+        fig, axes = plt.subplots(len(columns), len(columns), figsize=(2.5 * len(columns), 2.5 * len(columns)),
+                                 squeeze=False)
+        for i, row in enumerate(columns):
+            for j, column in enumerate(columns):
+                ax = axes[i, j]
+                if i == j:
+                    ax.hist(payload[column], bins=30)
+                else:
+                    ax.scatter(payload[column], payload[row], s=2, alpha=0.3)
+                if i == len(columns) - 1:
+                    ax.set_xlabel(column)
+                if j == 0:
+                    ax.set_ylabel(row)
+        fig.suptitle(title, y=1.01)
+    else:
+        raise ValueError(f"Unknown plot kind {kind!r}")
+    return title, _figure_to_base64(fig)
+
+
+def plot_tasks(frames, columns=None, bins=30, sample_size=100_000, random_state=42):
+    """
+    Compute the aggregates of every plot of the report.
+
+    Args:
+        frames: Dict of section name -> DataFrame, e.g. the data before and
+            after outlier removal.
+        columns: Numeric columns to plot, all numeric columns of each frame when None.
+        bins: Number of histogram bins.
+        sample_size: Rows sampled for the KDEs and the pair plot.
+
+    Returns:
+        List of (section, [(kind, title, payload), ...]).
+    """
+    sections = []
+    for section, data in frames.items():
+        tasks = []
+        numeric = columns or list(data.select_dtypes(include='number').columns)
+        for column in numeric:
+            if column in data:
+                summary = numeric_summary(data[column], bins, sample_size, random_state=random_state)
+                if summary is not None:
+                    tasks.append(('numeric', f"{column} ({section})", summary))
+        if TARGET in data:
+            tasks.append(('counts', f"Degree of injury counts ({section})", data[TARGET].value_counts().sort_index()))
+            if 'nature_of_inj' in data:
+                tasks.append(('bar', f"Mean nature_of_inj by degree_of_inj ({section})",
+                              data.groupby(TARGET, observed=True)['nature_of_inj'].mean()))
+        if 'fatality' in data:
+            tasks.append(('counts', f"Fatality counts ({section})", data['fatality'].value_counts(dropna=False)))
+        pair_columns = [column for column in PAIRPLOT_COLUMNS if column in data]
+        if len(pair_columns) > 1:
+            pairs = data[pair_columns].apply(pd.to_numeric, errors='coerce').astype('float64')
+            tasks.append(('heatmap', f"Correlation heatmap ({section})", pairs.corr()))
+            pairs = pairs.dropna()
+            if sample_size is not None and len(pairs) > sample_size:
+                pairs = pairs.sample(sample_size, random_state=random_state)
+            tasks.append(('pairplot', f"Pair plot of {len(pairs)} sampled rows ({section})", pairs))
+        sections.append((section, tasks))
+    return sections
+
+
+def build_eda_report(frames, columns=None, out_path='eda_report.html', bins=30, sample_size=100_000,
+                     workers=None, random_state=42):
+    """
+    Render the EDA plots headless across a process pool into one HTML file.
+
+    Args:
+        frames: Dict of section name -> DataFrame (or a single DataFrame).
+        columns: Numeric columns to plot, all numeric columns when None.
+        out_path: Output HTML file.
+        bins: Number of histogram bins.
+        sample_size: Rows sampled for the KDEs and the pair plot, None for all rows.
+        workers: Number of plotting processes (defaults to the CPU count).
+        random_state: Seed of the sampling.
+
+    Returns:
+        The output path.
+    """
+    start = time.perf_counter()
+    if isinstance(frames, pd.DataFrame):
+        frames = {'data': frames}
+    sections = plot_tasks(frames, columns, bins, sample_size, random_state)
+    tasks = [task for _, section_tasks in sections for task in section_tasks]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker) as pool:
+        images = dict(pool.map(render_plot, tasks))
+
+    parts = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>OSHA EDA report</title>',
+             '<style>body{font-family:sans-serif;margin:2em}img{max-width:100%}</style></head><body>',
+             '<h1>OSHA EDA report</h1>']
+    for section, data in frames.items():
+        parts.append(f"<h2>{html.escape(section)}</h2>")
+        parts.append(f"<p>{len(data)} rows, {data.shape[1]} columns</p>")
+        parts.append(data.describe().T.to_html(float_format='{:.3f}'.format))
+        for _, title, _ in dict(sections)[section]:
+            parts.append(f"<h3>{html.escape(title)}</h3><img src=\"data:image/png;base64,{images[title]}\">")
+    parts.append('</body></html>')
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(parts))
+    print(f"EDA report with {len(tasks)} plots written to {out_path} in {time.perf_counter() - start:.1f}s")
+    return out_path
+
+
+def main(argv=None):
+    from osha_data import DATA_PATH, clean_osha_data, load_osha_data
+
+    parser = argparse.ArgumentParser(description="Write the OSHA EDA plots to a single HTML report.")
+    parser.add_argument('--data', default=DATA_PATH, help="Merged OSHA CSV")
+    parser.add_argument('--output', default='eda_report.html')
+    parser.add_argument('--bins', type=int, default=30)
+    parser.add_argument('--sample-size', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+    data = load_osha_data(args.data)
+    frames = {'loaded data': data, 'cleaned data': clean_osha_data(data)}
+    build_eda_report(frames, out_path=args.output, bins=args.bins, sample_size=args.sample_size,
+                     workers=args.workers)
+
+
+if __name__ == '__main__':
+    main()
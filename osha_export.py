@@ -0,0 +1,191 @@
+"""Compact, fast-loading model artifacts.
+
+joblib.dump of a GridSearchCV object stores cv_results_, the search settings
+and the refit estimator, and a fully grown RandomForestClassifier makes the
+pickle large and slow to load at service startup. compact_artifact keeps only
+what inference needs (the fitted preprocessing + estimator and the input
+column layout) and export_artifact writes it in several formats:
+
+    pickle  plain joblib file, loaded normally
+    zlib    joblib compressed with zlib (smaller, slower to load)
+    lzma    joblib compressed with lzma (smallest, slowest to load)
+    flat    random forests only: the forest as osha_forest.FlatForest .npy
+            arrays, memory-mapped at load, plus a joblib file with the
+            preprocessing steps
+
+joblib mmap_mode does not help for sklearn forests: Tree.__setstate__ copies
+the node and value arrays, so the trees are always read into memory. The flat
+format is the one whose tree arrays really stay memory-mapped.
+
+compare_artifact_formats reports the size and cold-load time of each format.
+"""
+
+import os
+import subprocess
+import sys
+
+import pandas as pd
+from joblib import dump, load
+from sklearn.ensemble import RandomForestClassifier
+
+from osha_forest import FlatForest
+from osha_pipeline import load_model
+
+ARTIFACT_FORMATS = {
+    'pickle': {'compress': 0},
+    'zlib': {'compress': ('zlib', 3)},
+    'lzma': {'compress': ('lzma', 3)},
+    'flat': {'compress': 0},
+}
+
+
+def compact_artifact(model, numeric_columns=None, categorical_columns=None):
+    """
+    Keep only what is needed for inference.
+
+    Args:
+        model: An osha_pipeline artifact dict, a fitted search object
+            (GridSearchCV, tune_models result entry) or a fitted estimator.
+        numeric_columns: Raw numeric input columns, when model is not an artifact.
+        categorical_columns: Raw categorical input columns, when model is not an artifact.
+
+    Returns:
+        Artifact dict with pipeline, numeric_columns and categorical_columns.
+    """
+    if isinstance(model, dict) and 'pipeline' in model:
+        artifact = {'pipeline': model['pipeline'], 'numeric_columns': list(model['numeric_columns']),
+                    'categorical_columns': list(model['categorical_columns'])}
+        if 'selected_features' in model:
+            artifact['selected_features'] = list(model['selected_features'])
+        return artifact
+    if isinstance(model, dict) and 'best_estimator' in model:
+        model = model['best_estimator']
+    # A search object keeps cv_results_ and the whole search, only the refit estimator is kept
+    model = getattr(model, 'best_estimator_', model)
+    return {'pipeline': model, 'numeric_columns': list(numeric_columns or []),
+            'categorical_columns': list(categorical_columns or [])}
+
+
+def artifact_path(out_dir, fmt, name='occupational_safety_model'):
+    if fmt == 'flat':
+        return os.path.join(out_dir, f"{name}.flat")
+    return os.path.join(out_dir, f"{name}.{fmt}.joblib")
+
+
+def supports_flat(artifact):
+    """Whether the artifact's pipeline ends with a RandomForestClassifier (the flat format)."""
+    steps = getattr(artifact['pipeline'], 'steps', None)
+    return bool(steps) and isinstance(steps[-1][1], RandomForestClassifier)
+
+
+def export_flat(artifact, path):
+    """Write the forest as FlatForest arrays and the rest of the artifact as a small joblib file."""
+    pipeline = artifact['pipeline']
+    name, forest = pipeline.steps[-1]
+    os.makedirs(path, exist_ok=True)
+    FlatForest.from_sklearn(forest).save(os.path.join(path, 'forest'))
+    dump({**artifact, 'pipeline': list(pipeline.steps[:-1]), 'pipeline_class': type(pipeline),
+          'forest_step': name}, os.path.join(path, 'artifact.joblib'))
+    return path
+
+
+def load_flat(path, mmap_mode='r'):
+    """Load an artifact written by export_flat, memory-mapping the forest arrays."""
+    artifact = load(os.path.join(path, 'artifact.joblib'))
+    forest = FlatForest.load(os.path.join(path, 'forest'), mmap_mode=mmap_mode)
+    steps = artifact.pop('pipeline') + [(artifact.pop('forest_step'), forest)]
+    artifact['pipeline'] = artifact.pop('pipeline_class')(steps)
+    return artifact
+
+
+def path_size(path):
+    """Size in bytes of a file, or of all files under a directory."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def export_artifact(artifact, out_dir, formats=tuple(ARTIFACT_FORMATS)):
+    """
+    Write the compact artifact in each format.
+
+    The flat format is skipped for pipelines that do not end with a RandomForestClassifier.
+
+    Returns:
+        Dict of format -> path (a directory for the flat format).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for fmt in formats:
+        if fmt == 'flat':
+            if not supports_flat(artifact):
+                model = artifact['pipeline']
+                model = model.steps[-1][1] if hasattr(model, 'steps') else model
+                print(f"Skipping the flat format: {type(model).__name__} is not a random forest")
+                continue
+            paths[fmt] = export_flat(artifact, artifact_path(out_dir, fmt))
+            continue
+        compress = ARTIFACT_FORMATS[fmt]['compress']
+        path = artifact_path(out_dir, 'uncompressed' if compress == 0 else fmt)
+        dump(artifact, path, compress=compress)
+        paths[fmt] = path
+    return paths
+
+
+def load_artifact(path, fmt='pickle'):
+    """Load an artifact written by export_artifact in the given format."""
+    if fmt == 'flat':
+        return load_flat(path)
+    return load(path)
+
+
+def cold_load_seconds(path, fmt, repeats=3):
+    """
+    Time loading the artifact in a fresh Python process (best of repeats).
+
+    Only the load call is timed, not the interpreter start or the imports.
+    The OS page cache is not flushed, so a first load from disk can be slower.
+    """
+    code = (
+        "import sys, time\n"
+        "import sklearn, joblib\n"
+        "import osha_export\n"
+        "start = time.perf_counter()\n"
+        "osha_export.load_artifact(sys.argv[1], sys.argv[2])\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', code, path, fmt], check=True, capture_output=True,
+                                text=True, cwd=module_dir).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def compare_artifact_formats(model, out_dir='model_exports', formats=tuple(ARTIFACT_FORMATS)):
+    """
+    Export the compact artifact in every format and report size and cold-load time.
+
+    Args:
+        model: Path of a saved artifact, an artifact dict or a fitted search/estimator.
+        out_dir: Directory receiving the exported files.
+
+    Returns:
+        DataFrame with one row per format (path, size_mb, cold_load_s).
+    """
+    if isinstance(model, str):
+        original_size = os.path.getsize(model)
+        model = load_model(model)
+    else:
+        original_size = None
+    paths = export_artifact(compact_artifact(model), out_dir, formats)
+    rows = []
+    for fmt, path in paths.items():
+        rows.append({'format': fmt, 'path': path, 'size_mb': path_size(path) / 1024 ** 2,
+                     'cold_load_s': cold_load_seconds(path, fmt)})
+    report = pd.DataFrame(rows)
+    if original_size is not None:
+        print(f"Original artifact: {original_size / 1024 ** 2:.2f} MB")
+    print(report.to_string(index=False))
+    return report
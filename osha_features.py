@@ -0,0 +1,70 @@
+"""Sparse feature matrix helpers.
+
+The one-hot encoded OSHA columns are almost all zeros, so they are kept as
+scipy CSR matrices instead of being densified with .toarray() and wrapped in a
+DataFrame. Everything downstream (feature importance, SMOTE, StandardScaler
+with with_mean=False and the sklearn classifiers) accepts CSR input.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.preprocessing import OneHotEncoder
+
+
+def encode_sparse(x, categorical_columns, enc=None):
+    """
+    One-hot encode the categorical columns and stack them with the numeric ones.
+
+    Args:
+        x: Feature DataFrame with numeric and categorical columns.
+        categorical_columns: Columns to one-hot encode.
+        enc: Fitted OneHotEncoder to reuse (e.g. for the test split). A new
+            encoder is fitted when None.
+
+    Returns:
+        The CSR feature matrix, the list of feature names and the encoder.
+    """
+    numeric = x.drop(columns=categorical_columns)
+    categorical = x[categorical_columns].astype(object)
+    categorical = categorical.where(categorical.notna(), np.nan)
+    if enc is None:
+        enc = OneHotEncoder(handle_unknown='ignore')
+        encoded = enc.fit_transform(categorical)
+    else:
+        encoded = enc.transform(categorical)
+
+    numeric_values = sparse.csr_matrix(numeric.to_numpy(dtype='float64', na_value=np.nan))
+    x_sparse = sparse.hstack([numeric_values, encoded], format='csr')
+    feature_names = list(numeric.columns) + list(enc.get_feature_names_out(categorical_columns))
+    return x_sparse, feature_names, enc
+
+
+def sparse_nbytes(matrix):
+    """Memory used by the data and index arrays of a CSR/CSC matrix."""
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+
+def memory_report(matrix, dtype='float64'):
+    """
+    Compare the memory of a sparse matrix with its dense equivalent.
+
+    Args:
+        matrix: scipy sparse matrix.
+        dtype: Dtype the dense matrix would use (.toarray() gives float64).
+
+    Returns:
+        A one-row DataFrame with the dense and sparse footprints in MB.
+    """
+    dense_bytes = matrix.shape[0] * matrix.shape[1] * np.dtype(dtype).itemsize
+    sparse_bytes = sparse_nbytes(matrix)
+    report = pd.DataFrame([{
+        'rows': matrix.shape[0],
+        'columns': matrix.shape[1],
+        'density': matrix.nnz / max(matrix.shape[0] * matrix.shape[1], 1),
+        'dense_mb': dense_bytes / 1024 ** 2,
+        'sparse_mb': sparse_bytes / 1024 ** 2,
+        'saving': 1 - sparse_bytes / max(dense_bytes, 1),
+    }])
+    print(report.to_string(index=False))
+    return report
@@ -0,0 +1,145 @@
+"""Shared cross-validation fold cache.
+
+Every model search used to split the same training data again and repeat the
+per-fold preprocessing for each candidate. FoldCache computes the stratified
+splits and the per-fold transforms (e.g. scaling fitted on the training part,
+SMOTE on the training part only) once, saves the resulting arrays as .npy
+files and hands out copy-on-write memory-mapped views (SVC writes to its
+input), so all candidates of all model families reuse the same materialized
+folds and joblib workers receive file references instead of pickled copies.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import joblib
+import numpy as np
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold
+from sklearn.utils import _safe_indexing
+
+from osha_tuning import data_fingerprint
+
+FOLD_CACHE_DIR = "fold_cache"
+
+
+def _save_matrix(prefix, matrix):
+    if sparse.issparse(matrix):
+        matrix = matrix.tocsr()
+        np.save(prefix + '.data.npy', matrix.data)
+        np.save(prefix + '.indices.npy', matrix.indices)
+        np.save(prefix + '.indptr.npy', matrix.indptr)
+        with open(prefix + '.shape.json', 'w') as f:
+            json.dump(list(matrix.shape), f)
+    else:
+        np.save(prefix + '.npy', np.asarray(matrix))
+
+
+def _load_matrix(prefix):
+    if os.path.exists(prefix + '.shape.json'):
+        with open(prefix + '.shape.json') as f:
+            shape = tuple(json.load(f))
+        arrays = [np.load(prefix + f'.{name}.npy', mmap_mode='c') for name in ('data', 'indices', 'indptr')]
+        return sparse.csr_matrix(tuple(arrays), shape=shape, copy=False)
+    return np.load(prefix + '.npy', mmap_mode='c')
+
+
+class FoldCache:
+    """
+    Materialized, memory-mapped cross-validation folds.
+
+    Args:
+        x: Training features (numpy array or sparse matrix).
+        y: Training target.
+        cv: Number of stratified folds.
+        transformer: Optional unfitted transformer (e.g. StandardScaler). A
+            clone is fitted on the training part of each fold and applied to
+            both parts.
+        sampler: Optional imblearn sampler (e.g. SMOTE) applied to the
+            training part of each fold only, after the transformer.
+        cache_dir: Directory holding one sub-directory per cache key.
+        random_state: Seed of the fold shuffling and of the row order used
+            when only part of the training rows is requested.
+    """
+
+    def __init__(self, x, y, cv=5, transformer=None, sampler=None, cache_dir=FOLD_CACHE_DIR, random_state=42):
+        self.cv = cv
+        self.transformer = transformer
+        self.sampler = sampler
+        self.random_state = random_state
+        y = np.asarray(y)
+        spec = json.dumps({'data': data_fingerprint(x, y), 'cv': cv, 'transformer': repr(transformer),
+                           'sampler': repr(sampler), 'random_state': random_state}, sort_keys=True)
+        self.key = hashlib.blake2b(spec.encode(), digest_size=8).hexdigest()
+        self.path = os.path.join(cache_dir, f"folds_{self.key}")
+        if os.path.exists(os.path.join(self.path, 'done')):
+            print(f"Reusing fold cache {self.path}")
+        else:
+            self._materialize(x, y)
+
+    def _transform(self, x_train, y_train, x_test=None):
+        transformer = None
+        if self.transformer is not None:
+            transformer = clone(self.transformer).fit(x_train, y_train)
+            x_train = transformer.transform(x_train)
+            if x_test is not None:
+                x_test = transformer.transform(x_test)
+        if self.sampler is not None:
+            x_train, y_train = clone(self.sampler).fit_resample(x_train, y_train)
+        return x_train, np.asarray(y_train), x_test, transformer
+
+    def _materialize(self, x, y):
+        # Build in a temporary directory so an interrupted run never leaves a partial cache
+        tmp_path = self.path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        splits = StratifiedKFold(n_splits=self.cv, shuffle=True, random_state=self.random_state)
+        for fold, (train, test) in enumerate(splits.split(np.zeros(len(y)), y)):
+            x_train, y_train, x_test, _ = self._transform(_safe_indexing(x, train), y[train], _safe_indexing(x, test))
+            prefix = os.path.join(tmp_path, f"fold{fold}")
+            _save_matrix(prefix + '_x_train', x_train)
+            _save_matrix(prefix + '_x_test', x_test)
+            np.save(prefix + '_y_train.npy', y_train)
+            np.save(prefix + '_y_test.npy', y[test])
+        # The full training set with the same transforms is used to refit the best candidates
+        x_full, y_full, _, transformer = self._transform(x, y)
+        _save_matrix(os.path.join(tmp_path, 'full_x'), x_full)
+        np.save(os.path.join(tmp_path, 'full_y.npy'), y_full)
+        joblib.dump(transformer, os.path.join(tmp_path, 'full_transformer.pkl'))
+        open(os.path.join(tmp_path, 'done'), 'w').close()
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(tmp_path, self.path)
+        print(f"Fold cache written to {self.path}")
+
+    def fold(self, fold, fraction=1.0):
+        """
+        Return x_train, y_train, x_test, y_test of a fold as memory-mapped arrays.
+
+        Args:
+            fold: Fold number.
+            fraction: Fraction of the training rows to use (successive halving).
+                The rows are taken in a fixed random order, the test part is
+                always complete.
+        """
+        prefix = os.path.join(self.path, f"fold{fold}")
+        x_train = _load_matrix(prefix + '_x_train')
+        y_train = np.load(prefix + '_y_train.npy', mmap_mode='c')
+        if fraction < 1.0:
+            order = np.random.RandomState(self.random_state + fold).permutation(len(y_train))
+            rows = np.sort(order[:max(int(np.ceil(fraction * len(y_train))), 1)])
+            x_train, y_train = _safe_indexing(x_train, rows), y_train[rows]
+        return (x_train, y_train, _load_matrix(prefix + '_x_test'),
+                np.load(prefix + '_y_test.npy', mmap_mode='c'))
+
+    def full(self):
+        """Return the transformed (and resampled) full training set."""
+        return (_load_matrix(os.path.join(self.path, 'full_x')),
+                np.load(os.path.join(self.path, 'full_y.npy'), mmap_mode='c'))
+
+    def transform(self, x):
+        """Apply the transformer fitted on the full training set (e.g. to the test split)."""
+        transformer = joblib.load(os.path.join(self.path, 'full_transformer.pkl'))
+        return x if transformer is None else transformer.transform(x)
@@ -0,0 +1,152 @@
+"""Parallel training and evaluation of several models on shared data.
+
+The baseline section of the notebook fits Logistic Regression, Decision Tree,
+Random Forest, SVM and KNN one after another on x_train_scaled and prints one
+accuracy per model. train_and_evaluate fits and scores all of them at the same
+time in a process pool:
+
+- the training and test matrices are written once as .npy files (the data,
+  indices and indptr arrays of a sparse matrix) and every worker opens them
+  copy-on-write memory-mapped, so the workers share the page cache instead of
+  receiving a pickled copy of the data each (SVC writes to its input, hence
+  copy-on-write);
+- each worker fits one model and measures accuracy, macro F1, one-vs-rest
+  macro ROC AUC, fit time and predict time;
+- the results come back as one table, with the fitted models.
+
+Models with an n_jobs parameter are run with n_jobs=1 so the pool does not
+oversubscribe the cores.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from scipy.special import softmax
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score, f1_score, roc_auc_score
+
+from osha_folds import _load_matrix, _save_matrix
+
+
+def share_data(directory, **arrays):
+    """Write arrays/sparse matrices under directory and return name -> file prefix."""
+    prefixes = {}
+    for name, array in arrays.items():
+        prefixes[name] = os.path.join(directory, name)
+        _save_matrix(prefixes[name], array)
+    return prefixes
+
+
+def class_scores(model, x):
+    """
+    Per-class scores for ROC AUC: predict_proba, or the softmax of decision_function.
+
+    Returns None for models with neither (the ROC AUC is then left empty).
+    """
+    # SVC(probability=False) has no predict_proba and falls back to decision_function
+    if hasattr(model, 'predict_proba'):
+        return model.predict_proba(x)
+    if hasattr(model, 'decision_function'):
+        scores = model.decision_function(x)
+        if scores.ndim == 1:
+            scores = np.column_stack([-scores, scores])
+        return softmax(scores, axis=1)
+    return None
+
+
+def evaluate(model, x_test, y_test):
+    """Accuracy, macro F1, one-vs-rest macro ROC AUC and predict time of a fitted model."""
+    start = time.perf_counter()
+    y_pred = model.predict(x_test)
+    predict_seconds = time.perf_counter() - start
+    scores = class_scores(model, x_test)
+    roc_auc = np.nan
+    if scores is not None and len(np.unique(y_test)) > 1:
+        if scores.shape[1] == 2:
+            roc_auc = roc_auc_score(y_test, scores[:, 1])
+        else:
+            roc_auc = roc_auc_score(y_test, scores, multi_class='ovr', average='macro', labels=model.classes_)
+    return {
+        'accuracy': accuracy_score(y_test, y_pred),
+        'f1_macro': f1_score(y_test, y_pred, average='macro'),
+        'roc_auc_ovr': roc_auc,
+        'predict_s': predict_seconds,
+    }
+
+
+def _single_threaded(model):
+    """
+    Run model on one core, since the models already run in parallel processes.
+
+    Only an explicit n_jobs is overridden: None is already single-threaded, and
+    setting n_jobs on LogisticRegression (where it has no effect) warns on every fit.
+    """
+    if model.get_params().get('n_jobs') not in (None, 1):
+        model.set_params(n_jobs=1)
+    return model
+
+
+def _fit_and_evaluate(name, model, prefixes, return_model):
+    """Worker: fit a clone of model on the shared training data and evaluate it on the shared test data."""
+    x_train, x_test = _load_matrix(prefixes['x_train']), _load_matrix(prefixes['x_test'])
+    y_train = np.load(prefixes['y_train'] + '.npy', mmap_mode='c')
+    y_test = np.load(prefixes['y_test'] + '.npy', mmap_mode='c')
+    model = _single_threaded(clone(model))
+    start = time.perf_counter()
+    model.fit(x_train, y_train)
+    fit_seconds = time.perf_counter() - start
+    row = {'model': name, **evaluate(model, x_test, y_test), 'fit_s': fit_seconds, 'pid': os.getpid()}
+    return row, model if return_model else None
+
+
+def train_and_evaluate(models, x_train, y_train, x_test, y_test, max_workers=None, data_dir=None,
+                       return_models=True):
+    """
+    Fit and evaluate several models in parallel processes on shared memory-mapped data.
+
+    Args:
+        models: Dict of name -> unfitted classifier.
+        x_train, y_train: Training data (numpy array or sparse matrix).
+        x_test, y_test: Test data.
+        max_workers: Worker processes, one per model (up to the number of cores) by default.
+        data_dir: Directory for the shared .npy files, a temporary directory
+            (removed afterwards) by default.
+        return_models: Send the fitted models back from the workers.
+
+    Returns:
+        The results DataFrame (accuracy, f1_macro, roc_auc_ovr, fit_s,
+        predict_s per model, best accuracy first) and a dict of the fitted
+        models (empty when return_models is False).
+    """
+    directory = data_dir or tempfile.mkdtemp(prefix='osha_harness_')
+    os.makedirs(directory, exist_ok=True)
+    max_workers = max_workers or min(len(models), os.cpu_count() or 1)
+    try:
+        prefixes = share_data(directory, x_train=x_train, y_train=np.asarray(y_train), x_test=x_test,
+                              y_test=np.asarray(y_test))
+        rows, fitted = [], {}
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(_fit_and_evaluate, name, model, prefixes, return_models): name
+                       for name, model in models.items()}
+            for future in as_completed(futures):
+                row, model = future.result()
+                print(f"{row['model']}: accuracy {row['accuracy']:.4f}, fit {row['fit_s']:.1f}s")
+                rows.append(row)
+                if model is not None:
+                    fitted[row['model']] = model
+        wall_seconds = time.perf_counter() - start
+    finally:
+        if data_dir is None:
+            shutil.rmtree(directory, ignore_errors=True)
+    report = pd.DataFrame(rows).sort_values('accuracy', ascending=False, ignore_index=True)
+    report = report[['model', 'accuracy', 'f1_macro', 'roc_auc_ovr', 'fit_s', 'predict_s', 'pid']]
+    print(f"{len(models)} models trained and evaluated in {wall_seconds:.1f}s with {max_workers} workers "
+          f"(sum of fit and predict times {report['fit_s'].sum() + report['predict_s'].sum():.1f}s)")
+    print(report.drop(columns='pid').to_string(index=False))
+    return report, {name: fitted[name] for name in models if name in fitted}
@@ -0,0 +1,429 @@
+"""Incremental update of the saved model with newly appended OSHA records.
+
+A new monthly release only appends rows, but the notebook re-imputes,
+re-encodes and re-runs every search over the full history. update_saved_model
+instead:
+
+1. detects the new rows by a hash of summary_nr/rel_insp_nr, compared with
+   the keys of every row the model has already seen (summary_nr is normally
+   dropped at load, so the scan reads it explicitly), and cleans them like the
+   training rows: duplicate rows are dropped and the IQR outlier bounds of the
+   training data (stored in the state) are applied;
+2. for a random forest, on the one-hot ColumnTransformer or on the
+   osha_compact.CompactEncoder, extends the one-hot vocabulary with the new
+   categories and grows new trees on the new rows only, with the
+   hyperparameters of the saved model. The existing trees are kept as fitted
+   in an ExtendedForest, which feeds every forest the columns it was grown on
+   (new categories insert columns), so the tree arrays are never modified.
+   Unlike the vocabulary, the imputer statistics (medians, most frequent
+   values) and the scaler are deliberately not updated with the new rows:
+   the existing trees must keep seeing the feature values they were grown
+   on (a shifted imputed value would move rows with missing values across
+   splits), so the old trees predict exactly as before;
+3. refits any other model, again with the saved hyperparameters, on the
+   history plus the new rows when the history is passed.
+
+The seen keys, the outlier bounds and the log of the updates are stored in
+the artifact under 'incremental' (init_incremental_state,
+save_model(..., incremental_state=...)).
+
+Usage:
+    python osha_incremental.py final_best_occupational_safety_model.pkl june_2021.csv --trees 20
+    python osha_incremental.py model.pkl june_2021.csv --history osha_cache/cleaned_<key>.feather
+"""
+
+import argparse
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.frozen import FrozenEstimator
+from sklearn.pipeline import Pipeline
+from sklearn.utils import _safe_indexing
+
+from osha_compact import CompactEncoder
+from osha_data import DROP_COLUMNS, OSHA_DTYPES, concat_chunks, filter_outliers_iqr, iter_osha_chunks
+from osha_pipeline import TARGET, load_model, prepare_records
+
+KEY_COLUMNS = ['summary_nr', 'rel_insp_nr']
+
+# The loader drops summary_nr; the incremental scan keeps it to identify the rows
+INCREMENTAL_DROP_COLUMNS = [column for column in DROP_COLUMNS if column not in KEY_COLUMNS]
+
+KEY_DTYPES = {**OSHA_DTYPES, 'summary_nr': 'Int64'}
+
+
+def record_keys(frame):
+    """uint64 hash of the summary_nr/rel_insp_nr pair of every row."""
+    return pd.util.hash_pandas_object(frame[KEY_COLUMNS], index=False).to_numpy()
+
+
+def scan_keys(path, chunksize=500_000):
+    """Sorted unique keys of all rows of an OSHA CSV, reading only the key columns."""
+    reader = pd.read_csv(path, usecols=KEY_COLUMNS, dtype={column: 'Int64' for column in KEY_COLUMNS},
+                         chunksize=chunksize)
+    with reader:
+        return np.unique(np.concatenate([record_keys(chunk) for chunk in reader] or [np.empty(0, np.uint64)]))
+
+
+def iter_new_rows(path, seen_keys, chunksize=100_000):
+    """
+    Yield the rows of an OSHA CSV whose key is not in seen_keys, chunk by chunk.
+
+    Yields:
+        (rows, keys) with the new rows (parsed like load_osha_data, plus
+        summary_nr) and their keys.
+    """
+    for chunk in iter_osha_chunks(path, chunksize, INCREMENTAL_DROP_COLUMNS, KEY_DTYPES):
+        keys = record_keys(chunk)
+        new = ~np.isin(keys, seen_keys)
+        if new.any():
+            yield chunk[new], keys[new]
+
+
+def init_incremental_state(seen_keys, outlier_bounds=None):
+    """
+    State needed to update a saved model with new rows.
+
+    Args:
+        seen_keys: Keys of the rows already processed (scan_keys of the training file).
+        outlier_bounds: osha_data.iqr_bounds the training rows were filtered
+            with; new rows are filtered with the same bounds.
+
+    Returns:
+        Dict with the sorted seen keys, the outlier bounds and the log of the
+        updates applied so far.
+    """
+    return {
+        'seen_keys': np.unique(np.asarray(seen_keys, dtype=np.uint64)),
+        'outlier_bounds': outlier_bounds,
+        'updates': [],
+    }
+
+
+def clean_new_rows(new_rows, outlier_bounds=None):
+    """
+    Clean new raw rows like the training rows.
+
+    Rows repeating an earlier new row (on every column but summary_nr, which
+    the training loader does not read) are dropped, then the rows outside the
+    training IQR outlier bounds (missing values included) are removed.
+
+    Returns:
+        The cleaned rows and a dict with the number of duplicate and outlier rows removed.
+    """
+    duplicated = new_rows.drop(columns='summary_nr', errors='ignore').duplicated().to_numpy()
+    rows = new_rows[~duplicated]
+    outliers = 0
+    if outlier_bounds is not None:
+        columns = [column for column in outlier_bounds.index if column in rows.columns]
+        kept, _ = filter_outliers_iqr(rows, columns, bounds=outlier_bounds)
+        outliers = len(rows) - len(kept)
+        rows = kept
+    return rows, {'duplicate_rows': int(duplicated.sum()), 'outlier_rows': outliers}
+
+
+def _categories(old, values):
+    """Sorted union of fitted categories and new values, missing values last."""
+    present = pd.Series(values).dropna().unique().tolist()
+    has_missing = any(pd.isna(value) for value in old) or pd.isna(pd.Series(values)).any()
+    known = sorted({value for value in old if not pd.isna(value)} | set(present))
+    return np.array(known + ([np.nan] if has_missing else []), dtype=object)
+
+
+def _extended_encoder(encoder, records):
+    """Unfitted copy of a fitted OneHotEncoder whose categories also hold the values of the new records."""
+    categories = [_categories(old, records[column]) for old, column in zip(encoder.categories_, records.columns)]
+    return clone(encoder).set_params(categories=categories)
+
+
+def _unfrozen(estimator):
+    return estimator.estimator if isinstance(estimator, FrozenEstimator) else estimator
+
+
+def _vocabulary_frame(preprocessor, transformers):
+    """Small frame with every category of the encoders once (columns padded with their first value)."""
+    columns = {column: [0.0] for column in preprocessor.feature_names_in_}
+    for name, transformer, transformer_columns in transformers:
+        encoder = transformer.named_steps['encode'] if name == 'most_frequent' else transformer
+        if name in ('most_frequent', 'categorical') and len(transformer_columns):
+            columns.update(zip(transformer_columns, (list(values) for values in encoder.categories)))
+    length = max(len(values) for values in columns.values())
+    return pd.DataFrame({column: values + [values[0]] * (length - len(values)) for column, values in columns.items()})
+
+
+def update_preprocessor(preprocessor, records):
+    """
+    Rebuild a build_preprocessor ColumnTransformer so its encoders know the categories of new records.
+
+    A CompactEncoder is extended in place with CompactEncoder.extend_categories
+    instead. The fitted numeric pipeline and most frequent imputer are wrapped in
+    FrozenEstimator and the one-hot encoders get the union of their fitted
+    categories and the new values as explicit categories; the new
+    ColumnTransformer is then fitted on a small vocabulary frame. Known
+    categories keep their encoding and new categories get new columns.
+
+    Returns:
+        The fitted preprocessor.
+    """
+    if not isinstance(preprocessor, (ColumnTransformer, CompactEncoder)):
+        raise TypeError("Incremental updates need the ColumnTransformer of osha_pipeline.build_preprocessor "
+                        "or a CompactEncoder")
+    if isinstance(preprocessor, CompactEncoder):
+        return preprocessor.extend_categories(records)
+    transformers = []
+    for name, transformer, columns in preprocessor.transformers_:
+        if name == 'remainder':
+            continue
+        transformer = _unfrozen(transformer)
+        if not len(columns):
+            transformer = clone(transformer)
+        elif name == 'numeric':
+            transformer = FrozenEstimator(transformer)
+        elif name == 'most_frequent':
+            imputer = _unfrozen(transformer.named_steps['impute'])
+            imputed = pd.DataFrame(imputer.transform(records[columns]), columns=columns)
+            transformer = Pipeline([('impute', FrozenEstimator(imputer)),
+                                    ('encode', _extended_encoder(transformer.named_steps['encode'], imputed))])
+        elif name == 'categorical':
+            transformer = _extended_encoder(transformer, records[columns])
+        transformers.append((name, transformer, columns))
+    rebuilt = clone(preprocessor).set_params(transformers=transformers)
+    return rebuilt.fit(_vocabulary_frame(preprocessor, transformers))
+
+
+class ExtendedForest(ClassifierMixin, BaseEstimator):
+    """
+    Forests grown on successive one-hot layouts, voting like one forest.
+
+    An incremental update inserts the columns of new categories, so the
+    forests grown before it read their features at other positions. Each
+    forest is kept as fitted with the feature names it was grown on, and
+    set_layout maps those names to positions in the current preprocessor
+    output; predict_proba feeds every forest its own columns and averages the
+    probabilities weighted by the number of trees, which is what a single
+    forest of all the trees would return.
+
+    Args:
+        forests: Fitted forests with the same classes_.
+        feature_names: Feature names each forest was fitted on.
+    """
+
+    # predict is the argmax of predict_proba (osha_pipeline.predict_with_proba)
+    predict_is_proba_argmax = True
+
+    def __init__(self, forests, feature_names):
+        self.forests = forests
+        self.feature_names = feature_names
+
+    def set_layout(self, names):
+        """Point every forest at its features in the preprocessor output with feature names names."""
+        position = {name: i for i, name in enumerate(names)}
+        self.columns_ = [np.array([position[name] for name in forest_names], dtype=np.intp)
+                         for forest_names in self.feature_names]
+        self.layout_ = np.asarray(names, dtype=object)
+        self.classes_ = self.forests[0].classes_
+        self.n_features_in_ = len(names)
+        return self
+
+    def add(self, forest, names):
+        """Add a forest fitted on the current layout (whose feature names are names)."""
+        self.forests.append(forest)
+        self.feature_names.append(np.asarray(names, dtype=object))
+        return self.set_layout(self.layout_)
+
+    def fit(self, x, y):
+        """Refit the trees as one forest (with the hyperparameters of the first one) on the current layout."""
+        if isinstance(x, pd.DataFrame):
+            names = x.columns
+        else:
+            names = getattr(self, 'layout_', [f"x{i}" for i in range(x.shape[1])])
+        names = np.asarray(names, dtype=object)
+        n_trees = sum(forest.n_estimators for forest in self.forests)
+        forest = clone(self.forests[0]).set_params(n_estimators=n_trees, warm_start=False).fit(x, y)
+        self.forests, self.feature_names = [forest], [names]
+        return self.set_layout(names)
+
+    def _inputs(self, x, columns):
+        if len(columns) == x.shape[1] and np.array_equal(columns, np.arange(x.shape[1])):
+            return x
+        return x.iloc[:, columns] if isinstance(x, pd.DataFrame) else _safe_indexing(x, columns, axis=1)
+
+    def predict_proba(self, x):
+        n_trees = np.array([len(forest.estimators_) for forest in self.forests], dtype=np.float64)
+        proba = 0.0
+        for forest, columns, weight in zip(self.forests, self.columns_, n_trees / n_trees.sum()):
+            proba = proba + weight * forest.predict_proba(self._inputs(x, columns))
+        return proba
+
+    def predict(self, x):
+        return self.classes_[self.predict_proba(x).argmax(axis=1)]
+
+    @property
+    def feature_importances_(self):
+        """Tree-weighted mean of the impurity importances of the forests, in the current layout."""
+        importances = np.zeros(self.n_features_in_)
+        for forest, columns in zip(self.forests, self.columns_):
+            importances[columns] += len(forest.estimators_) * forest.feature_importances_
+        total = importances.sum()
+        return importances / total if total > 0 else importances
+
+
+def _forest_steps(pipeline):
+    """(preprocessor, sampler, forest) of a one-hot or compact forest pipeline, else None."""
+    steps = getattr(pipeline, 'named_steps', {})
+    model, preprocessor = steps.get('model'), steps.get('preprocess')
+    if not isinstance(model, (RandomForestClassifier, ExtraTreesClassifier, ExtendedForest)):
+        return None
+    if isinstance(preprocessor, ColumnTransformer):
+        if not {'numeric', 'most_frequent', 'categorical'} <= set(preprocessor.named_transformers_):
+            return None
+    elif not isinstance(preprocessor, CompactEncoder):
+        return None
+    return preprocessor, steps.get('smote'), model
+
+
+def _replace_step(pipeline, name, estimator):
+    position = [step_name for step_name, _ in pipeline.steps].index(name)
+    pipeline.steps[position] = (name, estimator)
+
+
+def add_trees(pipeline, records, y, n_trees=20):
+    """
+    Update the preprocessing of a forest pipeline and grow n_trees trees on the new records.
+
+    The saved forest becomes (or already is) an ExtendedForest, which keeps
+    the existing trees as they are and feeds them their original columns. The
+    new trees form a new forest with the hyperparameters of the saved one. A
+    batch that misses a class updates the preprocessing but adds no trees,
+    since trees fitted on fewer classes would not line up with the others.
+
+    Returns:
+        Number of trees added.
+    """
+    preprocessor, sampler, model = _forest_steps(pipeline)
+    if not isinstance(model, ExtendedForest):
+        model = ExtendedForest([model], [preprocessor.get_feature_names_out()])
+    preprocessor = update_preprocessor(preprocessor, records)
+    names = preprocessor.get_feature_names_out()
+    model.set_layout(names)
+    _replace_step(pipeline, 'preprocess', preprocessor)
+    _replace_step(pipeline, 'model', model)
+    if not np.array_equal(np.unique(y), model.classes_):
+        print(f"New rows contain classes {np.unique(y).tolist()} instead of {model.classes_.tolist()}, "
+              "no trees added")
+        return 0
+    x = preprocessor.transform(records)
+    if sampler is not None:
+        x, y = sampler.fit_resample(x, y)
+    forest = clone(model.forests[0]).set_params(n_estimators=n_trees, warm_start=False)
+    if isinstance(forest.random_state, int):
+        forest.set_params(random_state=forest.random_state + len(model.forests))
+    model.add(forest.fit(x, y), names)
+    return n_trees
+
+
+def update_model(artifact, new_rows, keys, n_trees=20, history=None):
+    """
+    Update a loaded artifact with new raw rows.
+
+    Args:
+        artifact: Artifact dict of load_model, saved with an incremental_state.
+        new_rows: New raw rows, including degree_of_inj. They are cleaned with
+            clean_new_rows; rows without degree_of_inj are skipped.
+        keys: record_keys of new_rows, added to the seen keys.
+        n_trees: Trees grown on the new rows by a random forest model.
+        history: Raw training rows with degree_of_inj. Needed to refit a model
+            that cannot be updated incrementally (everything but a random
+            forest on the one-hot or compact preprocessing).
+
+    Returns:
+        The updated artifact.
+    """
+    state = artifact['incremental']
+    cleaned, removed = clean_new_rows(new_rows, state.get('outlier_bounds'))
+    if state.get('outlier_bounds') is None:
+        print("The incremental state has no outlier bounds, new rows are only deduplicated")
+    labeled = cleaned[cleaned[TARGET].notna()]
+    numeric_columns, categorical_columns = artifact['numeric_columns'], artifact['categorical_columns']
+    records = prepare_records(labeled, numeric_columns, categorical_columns)
+    y = labeled[TARGET].to_numpy(dtype=np.int64)
+    start = time.perf_counter()
+    if not len(labeled):
+        mode = "no labeled rows left after cleaning, model unchanged"
+    elif _forest_steps(artifact['pipeline']) is not None:
+        added = add_trees(artifact['pipeline'], records, y, n_trees)
+        mode = f"{added} trees added"
+    elif history is not None:
+        combined = pd.concat([history, labeled], ignore_index=True)
+        combined_records = prepare_records(combined, numeric_columns, categorical_columns)
+        artifact['pipeline'] = clone(artifact['pipeline']).fit(combined_records,
+                                                               combined[TARGET].to_numpy(dtype=np.int64))
+        mode = f"refitted on {len(combined)} rows with the saved hyperparameters"
+    else:
+        raise ValueError("Only a random forest on the one-hot or compact preprocessing can be updated without the "
+                         "history; pass history to refit the saved model")
+    state['seen_keys'] = np.union1d(state['seen_keys'], keys)
+    state['updates'].append({'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'new_rows': len(new_rows),
+                             **removed, 'labeled_rows': len(labeled), 'mode': mode})
+    print(f"Incremental update with {len(labeled)} new labeled rows: {mode} in {time.perf_counter() - start:.1f}s")
+    return artifact
+
+
+def update_saved_model(model_path, data_path, n_trees=20, chunksize=100_000, history=None, output_path=None):
+    """
+    Update the artifact at model_path with the rows of data_path it has not seen yet.
+
+    Args:
+        model_path: Artifact written by save_model with an incremental_state.
+        data_path: OSHA CSV with the new release (may also contain the old rows).
+        n_trees: Trees grown on the new rows.
+        chunksize: Rows read per chunk while looking for new rows.
+        history: Raw training rows, see update_model.
+        output_path: Where the updated artifact is written, model_path by default.
+
+    Returns:
+        The updated artifact, or the unchanged one when there are no new rows.
+    """
+    artifact = load_model(model_path)
+    if 'incremental' not in artifact:
+        raise ValueError(f"{model_path} has no incremental state, save it with save_model(..., incremental_state=...)")
+    chunks = list(iter_new_rows(data_path, artifact['incremental']['seen_keys'], chunksize))
+    if not chunks:
+        print(f"No new rows in {data_path}")
+        return artifact
+    new_rows = concat_chunks(chunk for chunk, _ in chunks)
+    keys = np.concatenate([chunk_keys for _, chunk_keys in chunks])
+    print(f"{len(new_rows)} new rows in {data_path}")
+    artifact = update_model(artifact, new_rows, keys, n_trees, history)
+    joblib.dump(artifact, output_path or model_path)
+    return artifact
+
+
+def read_history(path):
+    """Cleaned training rows with degree_of_inj from a Feather (e.g. the osha_cache file) or CSV file."""
+    if path.endswith('.feather'):
+        return pd.read_feather(path)
+    return pd.read_csv(path, low_memory=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update the saved model with the new rows of an OSHA release.")
+    parser.add_argument('model', help="Artifact written by save_model")
+    parser.add_argument('data', help="OSHA CSV of the new release")
+    parser.add_argument('--trees', type=int, default=20, help="Trees grown on the new rows")
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    parser.add_argument('--output', help="Output artifact, the input artifact by default")
+    parser.add_argument('--history', help="Cleaned training rows with degree_of_inj (.feather, e.g. the osha_cache "
+                                          "file, or .csv), needed to refit models other than a random forest")
+    args = parser.parse_args(argv)
+    history = read_history(args.history) if args.history else None
+    update_saved_model(args.model, args.data, args.trees, args.chunksize, history, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""KNN with one neighbour index per fold and a single query at the largest k.
+
+KNeighborsClassifier falls back to brute force on the sparse one-hot matrix,
+and the grid search over n_neighbors x weights recomputes the neighbours of
+every test row for each of the 8 combinations. Here:
+
+- IndexedKNN builds its neighbour index once: a BallTree (or KDTree) on a
+  dense training matrix, or for a sparse one sklearn's brute-force search on
+  the CSR matrix itself (densifying the one-hot matrix would undo the sparse
+  encoding). The index is pickled with the model, so save_model stores it and
+  a loaded model predicts without rebuilding it;
+- tune_knn builds one index per CV fold, queries every validation row once at
+  the largest n_neighbors of the grid, and scores every (n_neighbors, weights)
+  candidate from the first k columns of that single result.
+
+Votes follow KNeighborsClassifier: uniform weights count the neighbours,
+distance weights use 1 / distance (exact matches take all the weight) and ties
+go to the first class.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy import sparse
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+from sklearn.neighbors import BallTree, KDTree, NearestNeighbors
+from sklearn.utils import _safe_indexing
+
+INDEXES = {'ball_tree': BallTree, 'kd_tree': KDTree}
+
+
+def _dense(x):
+    if sparse.issparse(x):
+        return x.toarray().astype(np.float64)
+    return np.asarray(x, dtype=np.float64)
+
+
+def build_index(x, algorithm='auto', leaf_size=40, n_jobs=-1):
+    """
+    Neighbour index of the training rows.
+
+    'auto' uses brute force on a sparse x (kept sparse) and a BallTree on a
+    dense one. 'ball_tree' and 'kd_tree' always build the tree on a dense copy.
+    """
+    if algorithm == 'auto':
+        algorithm = 'brute' if sparse.issparse(x) else 'ball_tree'
+    if algorithm == 'brute':
+        return NearestNeighbors(algorithm='brute', n_jobs=n_jobs).fit(x)
+    if algorithm not in INDEXES:
+        raise ValueError(f"Unknown algorithm {algorithm!r}, expected 'auto', 'brute' or one of {list(INDEXES)}")
+    return INDEXES[algorithm](_dense(x), leaf_size=leaf_size)
+
+
+def query_index(tree, x, k, batch_size=10_000, n_jobs=-1):
+    """
+    Distances and indices of the k nearest training rows.
+
+    A tree is queried in parallel dense batches; a brute-force index queries
+    the (sparse) rows directly, chunked by sklearn.
+    """
+    if isinstance(tree, NearestNeighbors):
+        return tree.kneighbors(x, k)
+    batches = [(start, x[start:start + batch_size]) for start in range(0, x.shape[0], batch_size)]
+    # BallTree/KDTree queries release the GIL, so threads are enough
+    results = Parallel(n_jobs=n_jobs, prefer='threads')(
+        delayed(tree.query)(_dense(batch), k=k) for _, batch in batches)
+    if not results:
+        return np.empty((0, k)), np.empty((0, k), dtype=np.intp)
+    distances, indices = zip(*results)
+    return np.vstack(distances), np.vstack(indices)
+
+
+def vote(neighbor_labels, distances, n_classes, weights='uniform'):
+    """
+    Class probabilities from the labels of the nearest neighbours.
+
+    Args:
+        neighbor_labels: Encoded labels (0..n_classes-1) of the neighbours, shape (n_rows, k).
+        distances: Distances of the neighbours, shape (n_rows, k).
+        n_classes: Number of classes.
+        weights: 'uniform' or 'distance'.
+    """
+    if weights == 'uniform':
+        row_weights = np.ones_like(distances)
+    elif weights == 'distance':
+        with np.errstate(divide='ignore'):
+            row_weights = 1.0 / distances
+        exact = np.isinf(row_weights)
+        # Like sklearn, rows with exact matches only vote with those matches
+        has_exact = exact.any(axis=1)
+        row_weights[has_exact] = exact[has_exact]
+    else:
+        raise ValueError(f"Unknown weights {weights!r}, expected 'uniform' or 'distance'")
+    proba = np.zeros((neighbor_labels.shape[0], n_classes))
+    np.add.at(proba, (np.arange(neighbor_labels.shape[0])[:, None], neighbor_labels), row_weights)
+    normalizer = proba.sum(axis=1, keepdims=True)
+    normalizer[normalizer == 0.0] = 1.0
+    return proba / normalizer
+
+
+class IndexedKNN(ClassifierMixin, BaseEstimator):
+    """
+    k-nearest neighbours classifier backed by a prebuilt BallTree/KDTree.
+
+    Args:
+        n_neighbors: Number of neighbours.
+        weights: 'uniform' or 'distance'.
+        algorithm: 'auto' (brute force for sparse input, BallTree for dense),
+            'brute', 'ball_tree' or 'kd_tree'.
+        leaf_size: Leaf size of the tree.
+        n_jobs: Threads used by the queries.
+    """
+
+    # predict is the argmax of predict_proba (osha_pipeline.predict_with_proba)
+    predict_is_proba_argmax = True
+
+    def __init__(self, n_neighbors=5, weights='uniform', algorithm='auto', leaf_size=40, n_jobs=-1):
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+        self.n_jobs = n_jobs
+
+    def fit(self, x, y):
+        self.classes_, self.y_encoded_ = np.unique(np.asarray(y), return_inverse=True)
+        self.index_ = build_index(x, self.algorithm, self.leaf_size, self.n_jobs)
+        self.n_features_in_ = x.shape[1]
+        return self
+
+    def kneighbors(self, x, n_neighbors=None):
+        """Distances and indices of the nearest training rows."""
+        return query_index(self.index_, x, n_neighbors or self.n_neighbors, n_jobs=self.n_jobs)
+
+    def predict_proba(self, x):
+        distances, indices = self.kneighbors(x)
+        return vote(self.y_encoded_[indices], distances, len(self.classes_), self.weights)
+
+    def predict(self, x):
+        return self.classes_.take(np.argmax(self.predict_proba(x), axis=1), axis=0)
+
+
+def tune_knn(x, y, param_grid, cv=5, scoring='accuracy', algorithm='auto', leaf_size=40, n_jobs=-1,
+             random_state=42, refit=True, fold_cache=None):
+    """
+    Tune n_neighbors and weights from one neighbour query per fold.
+
+    Args:
+        x: Training features.
+        y: Training target.
+        param_grid: Grid with 'n_neighbors' and optionally 'weights' (PARAM_GRIDS['KNN']).
+        cv: Number of stratified folds (same splits as tune_models).
+        scoring: sklearn scorer name; it is applied to a fitted IndexedKNN
+            whose prediction is taken from the cached neighbours.
+        algorithm: IndexedKNN algorithm.
+        leaf_size: Leaf size of the tree.
+        n_jobs: Threads used by the queries.
+        random_state: Seed of the folds.
+        refit: Fit an IndexedKNN with the best parameters on all of x, y.
+        fold_cache: Optional osha_folds.FoldCache, used like in tune_models.
+
+    Returns:
+        Dict with best_params, best_score, best_estimator and cv_results, like
+        one entry of the tune_models result.
+    """
+    y = np.asarray(y)
+    candidates = list(ParameterGrid({'weights': ['uniform'], **param_grid}))
+    k_max = max(params['n_neighbors'] for params in candidates)
+    scorer = get_scorer(scoring)
+    if fold_cache is not None:
+        cv = fold_cache.cv
+        splits = (fold_cache.fold(fold) for fold in range(cv))
+    else:
+        folds = StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state)
+        splits = ((_safe_indexing(x, train), y[train], _safe_indexing(x, test), y[test])
+                  for train, test in folds.split(np.zeros(len(y)), y))
+
+    scores = {i: [] for i in range(len(candidates))}
+    query_seconds = 0.0
+    for x_train, y_train, x_test, y_test in splits:
+        start = time.perf_counter()
+        knn = IndexedKNN(k_max, algorithm=algorithm, leaf_size=leaf_size, n_jobs=n_jobs).fit(x_train, y_train)
+        distances, indices = knn.kneighbors(x_test, k_max)
+        query_seconds += time.perf_counter() - start
+        labels = knn.y_encoded_[indices]
+        for i, params in enumerate(candidates):
+            k = params['n_neighbors']
+            proba = vote(labels[:, :k], distances[:, :k], len(knn.classes_), params['weights'])
+            scores[i].append(scorer(_PrecomputedClassifier(knn.classes_, proba), np.arange(len(y_test)), y_test))
+
+    cv_results = pd.DataFrame([{'model': 'KNN', 'params': params, 'n_resources': len(y),
+                                'mean_test_score': np.mean(scores[i]), 'std_test_score': np.std(scores[i])}
+                               for i, params in enumerate(candidates)])
+    best = cv_results.loc[cv_results['mean_test_score'].idxmax()]
+    print(f"KNN: {len(candidates)} candidates scored from one query at k={k_max} per fold "
+          f"({query_seconds:.2f}s of index build and query)")
+    best_estimator = None
+    if refit:
+        x_refit, y_refit = (x, y) if fold_cache is None else fold_cache.full()
+        best_estimator = IndexedKNN(algorithm=algorithm, leaf_size=leaf_size, n_jobs=n_jobs,
+                                    **best['params']).fit(x_refit, y_refit)
+    print(f"Best parameters for KNN: {best['params']}")
+    print(f"Best cross-validation score for KNN: {best['mean_test_score']:.4f}\n")
+    return {'best_params': best['params'], 'best_score': best['mean_test_score'],
+            'best_estimator': best_estimator, 'cv_results': cv_results}
+
+
+class _PrecomputedClassifier(ClassifierMixin, BaseEstimator):
+    """Classifier whose predictions for row i are read from precomputed probabilities, so sklearn scorers work."""
+
+    def __init__(self, classes, proba):
+        self.classes = classes
+        self.proba = proba
+        self.classes_ = classes
+
+    def fit(self, x, y):
+        return self
+
+    def __sklearn_is_fitted__(self):
+        return True
+
+    def predict_proba(self, rows):
+        return self.proba[rows]
+
+    def predict(self, rows):
+        return self.classes_.take(np.argmax(self.proba[rows], axis=1), axis=0)
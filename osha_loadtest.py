@@ -0,0 +1,107 @@
+"""Load test for the osha_server prediction service.
+
+Opens a number of keep-alive connections to a running server, sends single
+record /predict requests as fast as the server answers for a fixed duration and
+reports client side p50/p99 latency and throughput next to the server /metrics.
+
+Usage:
+    python osha_server.py --port 8080 &
+    python osha_loadtest.py --port 8080 --concurrency 64 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+SAMPLE_RECORD = {'fatality': 'X', 'nature_of_inj': 2, 'activity_nr': 17456682, 'part_of_body': 20,
+                 'evn_factor': 1, 'rel_insp_nr': 17456682, 'src_of_injury': 27, 'age': 48, 'sic_list': 1791,
+                 'sex': 'M', 'union_status': 'N'}
+
+
+def random_record(rng):
+    """SAMPLE_RECORD with the coded columns varied so requests are not all identical."""
+    record = dict(SAMPLE_RECORD)
+    record.update(nature_of_inj=rng.randint(1, 22), part_of_body=rng.randint(1, 31),
+                  src_of_injury=rng.randint(1, 47), age=rng.randint(16, 75), sex=rng.choice(['M', 'F']))
+    return record
+
+
+async def request(reader, writer, host, method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode().partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def worker(host, port, deadline, latencies, errors, seed):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, host, 'POST', '/predict', random_record(rng))
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_load_test(host='127.0.0.1', port=8080, concurrency=64, duration=10.0):
+    """
+    Run the load test and return the client and server side metrics.
+
+    Args:
+        host: Server host.
+        port: Server port.
+        concurrency: Number of concurrent keep-alive connections.
+        duration: Test duration in seconds.
+    """
+    latencies, errors = [], []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*[worker(host, port, deadline, latencies, errors, seed) for seed in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    client = {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_sec': len(latencies) / elapsed,
+        'latency_p50_ms': float(np.percentile(latencies_ms, 50)) if len(latencies) else None,
+        'latency_p99_ms': float(np.percentile(latencies_ms, 99)) if len(latencies) else None,
+    }
+    reader, writer = await asyncio.open_connection(host, port)
+    _, server = await request(reader, writer, host, 'GET', '/metrics')
+    writer.close()
+    return {'client': client, 'server': server}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the prediction server on localhost.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args(argv)
+    results = asyncio.run(run_load_test(args.host, args.port, args.concurrency, args.duration))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
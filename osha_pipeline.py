@@ -0,0 +1,214 @@
+"""Reusable preprocessing + model pipeline for the degree of injury model.
+
+The notebook imputes, one-hot encodes and scales with separate module level
+statements, so inference callers had to rebuild columns such as fatality_X by
+hand. Here the same steps are one fitted sklearn Pipeline that is saved
+together with the model and applied to raw incident records in one call.
+"""
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LogisticRegression
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from osha_compact import TREE_MODELS, CompactEncoder
+from osha_resampling import make_resampling_pipeline
+
+TARGET = 'degree_of_inj'
+
+# Categorical columns imputed with the most frequent value in the notebook.
+# The other categorical columns (e.g. fatality) keep missing values as their
+# own category, like the fatality_nan column of the notebook.
+MOST_FREQUENT_COLUMNS = ['sex', 'union_status']
+
+# Classifiers whose predict returns the class of highest predict_proba. For
+# other ones, e.g. SVC(probability=True) whose Platt-scaled probabilities can
+# disagree with its decision function, the label needs a predict call.
+PROBA_ARGMAX_MODELS = TREE_MODELS + (KNeighborsClassifier, HistGradientBoostingClassifier, LogisticRegression)
+
+
+def split_columns(x):
+    """Return the numeric and categorical column names of the raw features."""
+    numeric_columns = list(x.select_dtypes(include="number"))
+    categorical_columns = [column for column in x.columns if column not in numeric_columns]
+    return numeric_columns, categorical_columns
+
+
+def build_preprocessor(numeric_columns, categorical_columns):
+    """
+    Build the ColumnTransformer that turns raw records into model features.
+
+    Args:
+        numeric_columns: Numeric columns, imputed with the median and scaled.
+        categorical_columns: Categorical columns, one-hot encoded.
+    """
+    imputed = [column for column in categorical_columns if column in MOST_FREQUENT_COLUMNS]
+    other = [column for column in categorical_columns if column not in MOST_FREQUENT_COLUMNS]
+    numeric = Pipeline([
+        ('impute', SimpleImputer(strategy='median')),
+        ('scale', StandardScaler()),
+    ])
+    most_frequent = Pipeline([
+        ('impute', SimpleImputer(strategy='most_frequent')),
+        ('encode', OneHotEncoder(handle_unknown='ignore')),
+    ])
+    return ColumnTransformer([
+        ('numeric', numeric, numeric_columns),
+        ('most_frequent', most_frequent, imputed),
+        ('categorical', OneHotEncoder(handle_unknown='ignore'), other),
+    ], sparse_threshold=1.0)  # keep the one-hot output sparse (CSR) end to end
+
+
+def build_pipeline(model, x, sampler=None, compact=False, id_mode='drop'):
+    """
+    Wrap a classifier with the preprocessing for the raw feature frame x.
+
+    Args:
+        model: Unfitted sklearn classifier.
+        x: Raw training features (cleaned_data without degree_of_inj).
+        sampler: Optional oversampler (e.g. ChunkedSMOTE). The pipeline then
+            is an imblearn Pipeline that resamples the encoded training rows
+            during fit only.
+        compact: Use osha_compact.CompactEncoder (uint8 one-hots, small
+            integer codes, float32 scaled values for non-tree models and with
+            a sampler) instead of the float64 ColumnTransformer.
+        id_mode: 'drop' or 'hash' for the identifier columns of the compact encoder.
+
+    A model that is already a Pipeline with its own 'preprocess' step (e.g.
+    osha_boosting.build_hgb_pipeline) takes the raw columns and is returned
+    as is. It cannot be combined with a sampler or compact=True, which would
+    otherwise be ignored, so a ValueError is raised.
+    """
+    if isinstance(model, Pipeline) and 'preprocess' in model.named_steps:
+        if sampler is not None or compact:
+            raise ValueError("The model already has its own 'preprocess' step; "
+                             "a sampler or compact=True cannot be added to it")
+        return model
+    numeric_columns, categorical_columns = split_columns(x)
+    if compact:
+        # Trees keep the integer codes, unless SMOTE needs scaled distances between the rows
+        scale = sampler is not None or not isinstance(model, TREE_MODELS)
+        preprocess = CompactEncoder(id_mode=id_mode, scale=scale, most_frequent_columns=MOST_FREQUENT_COLUMNS)
+    else:
+        preprocess = build_preprocessor(numeric_columns, categorical_columns)
+    if sampler is not None:
+        return make_resampling_pipeline(model, sampler, preprocess)
+    return Pipeline([
+        ('preprocess', preprocess),
+        ('model', model),
+    ])
+
+
+def fit_pipeline(model, x, y, sampler=None, compact=False, id_mode='drop'):
+    """Build the pipeline for x and fit it on the raw training rows."""
+    numeric_columns, categorical_columns = split_columns(x)
+    pipeline = build_pipeline(model, x, sampler, compact, id_mode)
+    return pipeline.fit(prepare_records(x, numeric_columns, categorical_columns), y)
+
+
+def prepare_records(raw_records, numeric_columns, categorical_columns):
+    """
+    Turn raw records into a frame with the training columns and dtypes.
+
+    Args:
+        raw_records: DataFrame or list of record dicts. Missing
+            columns are filled with missing values and extra ones are ignored.
+    """
+    records = pd.DataFrame(raw_records)
+    records = records.reindex(columns=numeric_columns + categorical_columns)
+    for column in numeric_columns:
+        records[column] = pd.to_numeric(records[column], errors='coerce').astype('float64')
+    for column in categorical_columns:
+        values = records[column].astype(object)
+        records[column] = values.where(values.notna(), np.nan)
+    return records
+
+
+def save_model(pipeline, path, x, selected_features=None, incremental_state=None):
+    """
+    Save the fitted pipeline and the raw column layout in one artifact.
+
+    Args:
+        pipeline: Fitted pipeline returned by build_pipeline.
+        path: Output path of the joblib artifact.
+        x: Raw training features, used to record the expected input columns.
+        selected_features: Optional list of the one-hot features chosen by
+            feature selection (osha_selection), stored with the artifact.
+        incremental_state: Optional osha_incremental.init_incremental_state
+            dict, needed to update the model with new rows later.
+    """
+    numeric_columns, categorical_columns = split_columns(x)
+    artifact = {
+        'pipeline': pipeline,
+        'numeric_columns': numeric_columns,
+        'categorical_columns': categorical_columns,
+    }
+    if selected_features is not None:
+        artifact['selected_features'] = list(selected_features)
+    if incremental_state is not None:
+        artifact['incremental'] = incremental_state
+    joblib.dump(artifact, path)
+    return path
+
+
+def load_model(path, mmap_mode=None):
+    """
+    Load an artifact written by save_model.
+
+    Args:
+        path: Artifact path.
+        mmap_mode: joblib mmap_mode, e.g. 'r' to memory-map the large arrays
+            of an uncompressed artifact instead of reading them.
+    """
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+def predict(raw_records, artifact):
+    """
+    Predict the degree of injury of raw incident records.
+
+    All transforms (imputation, one-hot encoding, scaling) run inside the saved
+    pipeline in one vectorized pass over the records.
+    """
+    records = prepare_records(raw_records, artifact['numeric_columns'], artifact['categorical_columns'])
+    return artifact['pipeline'].predict(records)
+
+
+def predict_is_proba_argmax(model):
+    """
+    True when model.predict is the argmax of model.predict_proba.
+
+    Checks the final step of a Pipeline; an estimator can also declare it with
+    a predict_is_proba_argmax = True class attribute.
+    """
+    if isinstance(model, Pipeline):
+        model = model[-1]
+    return isinstance(model, PROBA_ARGMAX_MODELS) or getattr(model, 'predict_is_proba_argmax', False)
+
+
+def predict_with_proba(model, x):
+    """
+    Labels and class probabilities of x.
+
+    The labels are always those of model.predict; predict_proba is only
+    reused for them when predict_is_proba_argmax(model). The probabilities
+    are None for a model without predict_proba.
+    """
+    if not hasattr(model, 'predict_proba'):
+        return np.asarray(model.predict(x)), None
+    probabilities = model.predict_proba(x)
+    if predict_is_proba_argmax(model):
+        return np.asarray(model.classes_)[probabilities.argmax(axis=1)], probabilities
+    return np.asarray(model.predict(x)), probabilities
+
+
+def predict_proba(raw_records, artifact):
+    """Return the class probabilities of raw incident records."""
+    records = prepare_records(raw_records, artifact['numeric_columns'], artifact['categorical_columns'])
+    return artifact['pipeline'].predict_proba(records)
@@ -0,0 +1,344 @@
+"""Prediction cache in front of the saved model.
+
+The intake system re-scores the same or nearly the same incident record every
+time a record is edited and re-submitted. PredictionCache keeps the prediction
+and class probabilities of recently scored records so repeated records skip
+the model:
+
+- the key identifies the preprocessed feature vector (the output of the
+  pipeline's 'preprocess' step: imputed, one-hot encoded and scaled), so
+  records that only differ in fields the model does not use, in the type of
+  a number ('20' and 20), in a missing value versus its imputed value or in
+  two categories unknown to the encoder share one entry;
+- entries are evicted least recently used once max_size is reached and expire
+  after ttl_seconds (if set);
+- hits, misses, evictions and expirations are counted (stats()).
+
+Running the ColumnTransformer on a single record costs about as much as the
+forest itself, so for the osha_pipeline.build_preprocessor layout the key is
+computed in plain Python from the fitted imputer statistics and encoder
+categories: the numeric values after median imputation and the categorical
+values after most frequent imputation, unknown categories collapsed into one
+(they all encode to zeros). Scaling is one-to-one and does not change which
+records share a key. Other preprocessors are keyed by a hash of the transformed
+row. Only the missed records are preprocessed and scored. Call clear() after
+the model is updated (e.g. with osha_incremental).
+
+Usage:
+    python osha_prediction_cache.py --model final_best_occupational_safety_model.pkl --requests 5000
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.compose import ColumnTransformer
+from sklearn.frozen import FrozenEstimator
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+from sklearn.utils import _safe_indexing
+
+from osha_loadtest import random_record
+from osha_pipeline import load_model, predict_with_proba, prepare_records
+
+MODEL_PATH = 'final_best_occupational_safety_model.pkl'
+
+# Key value of the categories the encoder does not know
+UNKNOWN = '<unknown>'
+
+
+def row_keys(x):
+    """16-byte blake2b digest of every row of a dense array, DataFrame or CSR matrix."""
+    if sparse.issparse(x):
+        x = x.tocsr()
+        x.sort_indices()
+        keys = []
+        for start, stop in zip(x.indptr[:-1], x.indptr[1:]):
+            digest = hashlib.blake2b(x.indices[start:stop].tobytes(), digest_size=16)
+            digest.update(x.data[start:stop].tobytes())
+            keys.append(digest.digest())
+        return keys
+    x = np.ascontiguousarray(np.asarray(x))
+    return [hashlib.blake2b(row.tobytes(), digest_size=16).digest() for row in x]
+
+
+def _to_float(value):
+    """float(value), NaN when it is missing or not a number (like pd.to_numeric(errors='coerce'))."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _is_missing(value):
+    return value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value))
+
+
+def _unfrozen(estimator):
+    return estimator.estimator if isinstance(estimator, FrozenEstimator) else estimator
+
+
+def _step(transformer, name, kind):
+    """Fitted step name of a Pipeline transformer if it is a kind instance, else None."""
+    transformer = _unfrozen(transformer)
+    if not isinstance(transformer, Pipeline) or name not in transformer.named_steps:
+        return None
+    step = _unfrozen(transformer.named_steps[name])
+    return step if isinstance(step, kind) else None
+
+
+def record_normalizer(preprocessor, numeric_columns, categorical_columns):
+    """
+    Function turning a raw record dict into the key of its preprocessed features.
+
+    Only the ColumnTransformer of osha_pipeline.build_preprocessor (median
+    imputed and scaled numeric columns, one-hot encoded categorical columns,
+    also after an osha_incremental update) is supported; None is returned for
+    any other preprocessor, e.g. the passthrough/ordinal ColumnTransformer of
+    osha_boosting, which uses transformers of the same names.
+    """
+    if not isinstance(preprocessor, ColumnTransformer):
+        return None
+    fills, categories = {}, {}
+    for name, transformer, columns in preprocessor.transformers_:
+        if not len(columns):
+            continue
+        if name == 'numeric':
+            imputer = _step(transformer, 'impute', SimpleImputer)
+            if imputer is None or set(_unfrozen(transformer).named_steps) - {'impute', 'scale'}:
+                return None
+            fills.update(zip(columns, imputer.statistics_))
+        elif name == 'most_frequent':
+            imputer, encoder = _step(transformer, 'impute', SimpleImputer), _step(transformer, 'encode', OneHotEncoder)
+            if imputer is None or encoder is None:
+                return None
+            fills.update(zip(columns, imputer.statistics_))
+            categories.update(zip(columns, encoder.categories_))
+        elif name == 'categorical' and isinstance(_unfrozen(transformer), OneHotEncoder):
+            categories.update(zip(columns, _unfrozen(transformer).categories_))
+        elif not (name == 'remainder' and transformer == 'drop'):
+            return None
+    # Known categories per column, and whether a missing value is a category of its own
+    known = {column: ({value for value in values if not _is_missing(value)},
+                      any(_is_missing(value) for value in values)) for column, values in categories.items()}
+
+    def normalize(record):
+        key = []
+        for column in numeric_columns:
+            value = _to_float(record.get(column))
+            key.append(fills[column] if np.isnan(value) else value)
+        for column in categorical_columns:
+            value = record.get(column)
+            if _is_missing(value):
+                value = fills.get(column)
+            values, missing_is_category = known[column]
+            if _is_missing(value):
+                key.append(None if missing_is_category else UNKNOWN)
+            else:
+                key.append(value if value in values else UNKNOWN)
+        return tuple(key)
+
+    return normalize
+
+
+class PredictionCache:
+    """
+    LRU/TTL cache of model outputs keyed by the preprocessed feature vector.
+
+    Args:
+        artifact: Model artifact from osha_pipeline.load_model.
+        max_size: Maximum number of cached records (least recently used are evicted).
+        ttl_seconds: Seconds an entry stays valid, None for no expiry.
+    """
+
+    def __init__(self, artifact, max_size=100_000, ttl_seconds=None):
+        self.artifact = artifact
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        pipeline = artifact['pipeline']
+        if 'preprocess' not in getattr(pipeline, 'named_steps', {}):
+            raise ValueError("PredictionCache needs a pipeline with a 'preprocess' step (see build_pipeline)")
+        # Samplers (SMOTE) only act during fit, so preprocess + model is the prediction path
+        self.preprocess = pipeline.named_steps['preprocess']
+        self.model = pipeline[-1]
+        self.normalize = record_normalizer(self.preprocess, artifact['numeric_columns'],
+                                           artifact['categorical_columns'])
+        self.classes = np.asarray(pipeline.classes_)
+        self.has_proba = hasattr(pipeline, 'predict_proba')
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def features(self, raw_records):
+        """Preprocessed feature matrix of raw records (the cache key input)."""
+        records = prepare_records(raw_records, self.artifact['numeric_columns'], self.artifact['categorical_columns'])
+        return self.preprocess.transform(records)
+
+    def _model_output(self, x):
+        labels, probabilities = predict_with_proba(self.model, x)
+        if probabilities is None:
+            return [(label, None) for label in labels]
+        return list(zip(labels, probabilities))
+
+    def _lookup(self, keys, now):
+        found = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] is not None and entry[1] <= now:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    found[i] = entry[0]
+        return found
+
+    def _store(self, keys, outputs, now):
+        expires = None if self.ttl_seconds is None else now + self.ttl_seconds
+        with self._lock:
+            for key, output in zip(keys, outputs):
+                self._entries[key] = (output, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def score(self, raw_records):
+        """
+        Predictions (those of the model's predict) and class probabilities
+        (None for models without predict_proba) of raw records, taken from
+        the cache when possible.
+        """
+        records = raw_records.to_dict('records') if isinstance(raw_records, pd.DataFrame) else list(raw_records)
+        n_rows = len(records)
+        x = None
+        if self.normalize is not None:
+            keys = [self.normalize(record) for record in records]
+        else:
+            x = self.features(records)
+            keys = row_keys(x)
+        now = time.monotonic()
+        found = self._lookup(keys, now)
+        missing = [i for i in range(n_rows) if i not in found]
+        # Records repeated inside the batch are only scored once
+        unique_missing = list({keys[i]: i for i in missing}.values())
+        if unique_missing:
+            if x is None:
+                scored = self._model_output(self.features([records[i] for i in unique_missing]))
+            else:
+                scored = self._model_output(_safe_indexing(x, unique_missing))
+            self._store([keys[i] for i in unique_missing], scored, now)
+            computed = dict(zip((keys[i] for i in unique_missing), scored))
+            for i in missing:
+                found[i] = computed[keys[i]]
+        predictions = np.array([found[i][0] for i in range(n_rows)])
+        if not self.has_proba:
+            return predictions, None
+        return predictions, np.array([found[i][1] for i in range(n_rows)])
+
+    def predict_proba(self, raw_records):
+        if not self.has_proba:
+            raise AttributeError("The cached model has no predict_proba")
+        return self.score(raw_records)[1]
+
+    def predict(self, raw_records):
+        return self.score(raw_records)[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss/eviction/expiration counters and the current size."""
+        lookups = self.hits + self.misses
+        return {'size': len(self._entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None, 'evictions': self.evictions,
+                'expirations': self.expirations}
+
+
+def repeated_traffic(n_requests=5_000, n_distinct=500, repeat_rate=0.8, seed=42):
+    """
+    Single-record requests where repeat_rate of them re-submit one of n_distinct earlier records.
+
+    A re-submitted copy gets an edited free text field, which is not a model
+    input, so it hits the cache through the preprocessed features only.
+    """
+    rng = random.Random(seed)
+    distinct = [random_record(rng) for _ in range(n_distinct)]
+    requests = []
+    for n in range(n_requests):
+        if rng.random() < repeat_rate:
+            record = dict(rng.choice(distinct), abstract_text=f"Edited record, revision {n}")
+        else:
+            record = random_record(rng)
+        requests.append(record)
+    return requests
+
+
+def _latency_summary(name, seconds, extra=None):
+    milliseconds = np.array(seconds) * 1000
+    return {'mode': name, 'requests': len(milliseconds), 'mean_ms': float(milliseconds.mean()),
+            'p50_ms': float(np.percentile(milliseconds, 50)), 'p99_ms': float(np.percentile(milliseconds, 99)),
+            'total_s': float(milliseconds.sum() / 1000), **(extra or {})}
+
+
+def benchmark_cache(artifact, requests, max_size=100_000, ttl_seconds=None):
+    """
+    Score the requests one by one without and with the cache and compare latency.
+
+    Returns:
+        List of two result dicts (uncached, cached) with mean/p50/p99 latency;
+        the cached one also has the cache stats and whether every prediction
+        matches the uncached one.
+    """
+    pipeline = artifact['pipeline']
+    columns = artifact['numeric_columns'], artifact['categorical_columns']
+    uncached, expected = [], []
+    for record in requests:
+        start = time.perf_counter()
+        expected.append(pipeline.predict(prepare_records([record], *columns))[0])
+        uncached.append(time.perf_counter() - start)
+    cache = PredictionCache(artifact, max_size, ttl_seconds)
+    cached, predictions = [], []
+    for record in requests:
+        start = time.perf_counter()
+        predictions.append(cache.predict([record])[0])
+        cached.append(time.perf_counter() - start)
+    results = [_latency_summary('uncached', uncached),
+               _latency_summary('cached', cached, {**cache.stats(),
+                                                   'identical': bool(np.array_equal(expected, predictions))})]
+    for result in results:
+        print(f"{result['mode']:>8}: mean {result['mean_ms']:.2f} ms, p50 {result['p50_ms']:.2f} ms, "
+              f"p99 {result['p99_ms']:.2f} ms, total {result['total_s']:.1f}s")
+    print(f"Hit rate {cache.stats()['hit_rate']:.1%}, speed-up {results[0]['total_s'] / results[1]['total_s']:.1f}x")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the prediction cache on repeated single-record traffic.")
+    parser.add_argument('--model', default=MODEL_PATH, help="Saved model artifact")
+    parser.add_argument('--requests', type=int, default=5_000)
+    parser.add_argument('--distinct', type=int, default=500, help="Distinct records that get re-submitted")
+    parser.add_argument('--repeat-rate', type=float, default=0.8)
+    parser.add_argument('--max-size', type=int, default=100_000)
+    parser.add_argument('--ttl', type=float, default=None, help="Entry lifetime in seconds")
+    args = parser.parse_args(argv)
+    requests = repeated_traffic(args.requests, args.distinct, args.repeat_rate)
+    results = benchmark_cache(load_model(args.model), requests, args.max_size, args.ttl)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""Stage-level timing and memory instrumentation.
+
+A slow retrain can spend its time in CSV parsing, imputation, encoding, SMOTE
+or one of the search fits. StageRecorder wraps each stage and records its wall
+time, CPU time, the RSS before and after it, the highest RSS sampled during the
+stage and its increase over the RSS at stage start, the traced Python/NumPy allocation peak
+(optional, tracemalloc) and the rows/columns going in and out. Every stage is
+appended as one JSON line to a log file, and a stage can also dump a cProfile
+file (open with pstats or snakeviz) and the top tracemalloc allocation sites.
+
+Usage:
+    recorder = StageRecorder('stage_log.jsonl', profile_dir='profiles', profile_stages={'smote'})
+    with recorder.stage('load') as stage:
+        data = load_osha_data(path)
+        stage.output(data)
+    recorder.summary()
+"""
+
+import cProfile
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+
+import pandas as pd
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process and of its finished children since they started, in MB.
+
+    This is a high-water mark for the whole process; use RssSampler for the peak of one stage.
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return own / scale, children / scale
+
+
+def current_rss_mb():
+    """Current resident memory of this process in MB (None where /proc is not available)."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+
+class RssSampler:
+    """
+    Background thread sampling the RSS of this process to find the peak of a code section.
+
+    Args:
+        interval: Seconds between samples; allocations freed faster than this can be missed.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+            self.peak_mb = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and return the peak RSS in MB (None where /proc is not available)."""
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return self.peak_mb
+
+
+def shape_of(obj):
+    """(rows, columns) of a DataFrame, Series, array, sparse matrix or (x, y) tuple, else (None, None)."""
+    if isinstance(obj, tuple) and obj:
+        obj = obj[0]
+    shape = getattr(obj, 'shape', None)
+    if shape is None:
+        return None, None
+    return int(shape[0]) if len(shape) else None, int(shape[1]) if len(shape) > 1 else 1
+
+
+class Stage:
+    """Record of one running stage; output() sets the data produced by the stage."""
+
+    def __init__(self, name, data_in=None, **info):
+        self.record = {'stage': name, **info}
+        self.record['rows_in'], self.record['cols_in'] = shape_of(data_in)
+        self.record['rows_out'], self.record['cols_out'] = None, None
+
+    def output(self, data_out):
+        self.record['rows_out'], self.record['cols_out'] = shape_of(data_out)
+        return data_out
+
+
+class StageRecorder:
+    """
+    Record wall/CPU time, memory and data shapes of pipeline stages.
+
+    Args:
+        log_path: JSON lines file receiving one record per stage, None to keep
+            the records in memory only.
+        trace_memory: Measure the peak of traced allocations per stage with
+            tracemalloc (slows allocation heavy stages down).
+        profile_dir: Directory of the cProfile and tracemalloc dumps.
+        profile_stages: Names of the stages to profile, True for all stages.
+            Profiled stages dump <stage>.prof and, with trace_memory,
+            <stage>.tracemalloc.txt into profile_dir.
+        verbose: Print one line per finished stage.
+        rss_interval: Seconds between the RSS samples of a stage.
+    """
+
+    def __init__(self, log_path='stage_log.jsonl', trace_memory=False, profile_dir=None, profile_stages=(),
+                 verbose=True, rss_interval=0.01):
+        self.log_path = log_path
+        self.rss_interval = rss_interval
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.profile_stages = profile_stages
+        self.verbose = verbose
+        self.run_id = uuid.uuid4().hex[:12]
+        self.records = []
+
+    def _profiled(self, name):
+        if self.profile_dir is None:
+            return False
+        return self.profile_stages is True or name in self.profile_stages
+
+    @contextmanager
+    def stage(self, name, data_in=None, **info):
+        """
+        Context manager measuring one stage.
+
+        Args:
+            name: Stage name.
+            data_in: Input data, its rows and columns are recorded.
+            **info: Extra fields stored in the record (e.g. model name).
+
+        Yields:
+            A Stage; call stage.output(data) to record the output shape.
+        """
+        stage = Stage(name, data_in, **info)
+        profiler = cProfile.Profile() if self._profiled(name) else None
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        rss_before = current_rss_mb()
+        sampler = RssSampler(self.rss_interval).start()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        error = None
+        try:
+            yield stage
+        except BaseException as exc:
+            error = repr(exc)
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            wall_seconds, cpu_seconds = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            stage_peak = sampler.stop()
+            record = stage.record
+            record.update({
+                'run_id': self.run_id,
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'wall_s': wall_seconds,
+                'cpu_s': cpu_seconds,
+                'rss_before_mb': rss_before,
+                'rss_after_mb': current_rss_mb(),
+                'stage_peak_rss_mb': stage_peak,
+                'rss_increase_mb': None if stage_peak is None or rss_before is None else stage_peak - rss_before,
+            })
+            if self.trace_memory:
+                record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+            if error is not None:
+                record['error'] = error
+            if profiler is not None:
+                record['profile'] = self._dump_profile(name, profiler)
+            if tracing:
+                tracemalloc.stop()
+            self._write(record)
+
+    def _dump_profile(self, name, profiler):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        prefix = os.path.join(self.profile_dir, f"{self.run_id}_{name}".replace(':', '_').replace(' ', '_'))
+        profiler.dump_stats(f"{prefix}.prof")
+        if self.trace_memory and tracemalloc.is_tracing():
+            with open(f"{prefix}.tracemalloc.txt", 'w') as f:
+                for stat in tracemalloc.take_snapshot().statistics('lineno')[:25]:
+                    f.write(f"{stat}\n")
+        return f"{prefix}.prof"
+
+    def _write(self, record):
+        self.records.append(record)
+        if self.log_path is not None:
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+        if self.verbose:
+            shape_in = '-' if record['rows_in'] is None else f"{record['rows_in']}x{record['cols_in']}"
+            shape_out = '-' if record['rows_out'] is None else f"{record['rows_out']}x{record['cols_out']}"
+            memory = '-' if record['stage_peak_rss_mb'] is None else (
+                f"{record['stage_peak_rss_mb']:.0f} MB (+{record['rss_increase_mb']:.0f} MB)")
+            print(f"[{record['stage']}] {record['wall_s']:.3f}s wall, {record['cpu_s']:.3f}s CPU, "
+                  f"stage peak RSS {memory}, {shape_in} -> {shape_out}")
+
+    def track(self, name=None):
+        """
+        Decorator recording every call of a function as a stage.
+
+        The input shape is taken from the first argument and the output shape from the result.
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or func.__name__, args[0] if args else None) as stage:
+                    return stage.output(func(*args, **kwargs))
+            return wrapper
+        return decorator
+
+    def summary(self):
+        """DataFrame of the recorded stages, slowest first."""
+        report = pd.DataFrame(self.records)
+        if len(report):
+            report = report.sort_values('wall_s', ascending=False, ignore_index=True)
+        return report
+
+
+def read_stage_log(path):
+    """Load a JSON lines stage log as a DataFrame."""
+    return pd.read_json(path, lines=True)
@@ -0,0 +1,126 @@
+"""Leak-free, memory-bounded SMOTE oversampling.
+
+The notebook ran SMOTE on the full one-hot matrix before the train/test split
+and never used the result. Oversampling now happens inside training folds
+only, either through FoldCache(sampler=...) during tuning or through an
+imblearn Pipeline stage for the final model, which resamples during fit and
+leaves predict untouched.
+
+ChunkedSMOTE generates the synthetic rows of each class in chunks: the
+neighbours are only looked up for the rows a chunk interpolates from, so
+neither the full neighbour matrix of a large class nor one huge dense block
+of differences is held at once. Sparse (CSR) input stays sparse, float32
+input stays float32, and synthetic values of the integer columns of a
+DataFrame (e.g. the uint8 one-hots and int16 codes of osha_compact) are
+rounded so they remain valid codes.
+"""
+
+import numbers
+
+import numpy as np
+from imblearn.over_sampling.base import BaseOverSampler
+from imblearn.pipeline import Pipeline
+from scipy import sparse
+from sklearn.neighbors import NearestNeighbors
+from sklearn.utils import check_random_state
+from sklearn.utils._param_validation import Interval
+
+
+class ChunkedSMOTE(BaseOverSampler):
+    """
+    SMOTE oversampler that builds the synthetic samples chunk by chunk.
+
+    Args:
+        sampling_strategy: Same as imblearn's SMOTE ('auto' balances every
+            class up to the majority class).
+        random_state: Seed of the sampled base rows, neighbours and steps.
+        k_neighbors: Number of nearest neighbours used to build a sample.
+        chunk_size: Number of synthetic samples generated per chunk.
+        n_jobs: Number of jobs of the nearest neighbour search.
+    """
+
+    _parameter_constraints = {
+        **BaseOverSampler._parameter_constraints,
+        "k_neighbors": [Interval(numbers.Integral, 1, None, closed="left")],
+        "chunk_size": [Interval(numbers.Integral, 1, None, closed="left")],
+        "n_jobs": [numbers.Integral, None],
+    }
+
+    def __init__(self, sampling_strategy='auto', random_state=None, k_neighbors=5, chunk_size=10_000,
+                 n_jobs=None):
+        super().__init__(sampling_strategy=sampling_strategy)
+        self.random_state = random_state
+        self.k_neighbors = k_neighbors
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+
+    def fit_resample(self, X, y, **params):
+        # imblearn casts the output back to the input dtypes, which would truncate interpolated integer codes
+        dtypes = getattr(X, 'dtypes', None)
+        self._integer_columns = (None if dtypes is None else
+                                 np.flatnonzero([np.issubdtype(dtype, np.integer) for dtype in dtypes]))
+        return super().fit_resample(X, y, **params)
+
+    def _generate_chunk(self, x_class, nn, rows, neighbour_choice, steps):
+        # Neighbours are only computed for the distinct base rows of this chunk
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        neighbours = nn.kneighbors(x_class[unique_rows], return_distance=False)[:, 1:]
+        partners = neighbours[inverse, neighbour_choice]
+        base = x_class[rows]
+        diff = x_class[partners] - base
+        if sparse.issparse(x_class):
+            return (base + sparse.diags(steps) @ diff).tocsr()
+        synthetic = base + steps[:, np.newaxis].astype(x_class.dtype) * diff
+        integer_columns = getattr(self, '_integer_columns', None)
+        if integer_columns is not None and len(integer_columns):
+            synthetic[:, integer_columns] = np.round(synthetic[:, integer_columns])
+        return synthetic
+
+    def _fit_resample(self, X, y):
+        random_state = check_random_state(self.random_state)
+        dtype = np.float32 if X.dtype == np.float32 else np.float64
+        if sparse.issparse(X):
+            X = X.tocsr().astype(dtype)
+        else:
+            X = np.asarray(X, dtype=dtype)
+        x_resampled, y_resampled = [X], [np.asarray(y)]
+
+        for class_sample, n_samples in self.sampling_strategy_.items():
+            if n_samples == 0:
+                continue
+            x_class = X[np.flatnonzero(y == class_sample)]
+            if x_class.shape[0] <= self.k_neighbors:
+                raise ValueError(f"Class {class_sample} has {x_class.shape[0]} samples, "
+                                 f"k_neighbors={self.k_neighbors} needs more")
+            nn = NearestNeighbors(n_neighbors=self.k_neighbors + 1, n_jobs=self.n_jobs).fit(x_class)
+
+            for start in range(0, n_samples, self.chunk_size):
+                size = min(self.chunk_size, n_samples - start)
+                rows = random_state.randint(0, x_class.shape[0], size=size)
+                neighbour_choice = random_state.randint(0, self.k_neighbors, size=size)
+                steps = random_state.uniform(size=size)
+                x_resampled.append(self._generate_chunk(x_class, nn, rows, neighbour_choice, steps))
+                y_resampled.append(np.full(size, class_sample, dtype=y.dtype))
+
+        if sparse.issparse(X):
+            x_resampled = sparse.vstack(x_resampled, format='csr')
+        else:
+            x_resampled = np.vstack(x_resampled)
+        return x_resampled, np.concatenate(y_resampled)
+
+
+def make_resampling_pipeline(model, sampler=None, preprocess=None):
+    """
+    Wrap a classifier in an imblearn Pipeline that oversamples during fit only.
+
+    Args:
+        model: Unfitted classifier.
+        sampler: Oversampler, ChunkedSMOTE(random_state=42) by default.
+        preprocess: Optional transformer applied before the sampler.
+    """
+    if sampler is None:
+        sampler = ChunkedSMOTE(random_state=42)
+    steps = [('smote', sampler), ('model', model)]
+    if preprocess is not None:
+        steps.insert(0, ('preprocess', preprocess))
+    return Pipeline(steps)
@@ -0,0 +1,195 @@
+"""Fast, cached feature selection.
+
+The notebook fits a default RandomForestClassifier on the whole one-hot matrix
+only to read feature_importances_, keeps the features above a fixed 0.01
+impurity importance and never checks the selection again. select_features
+instead:
+
+1. drops the features a vectorized univariate test (f_classif or chi2, both
+   work on the sparse matrix) finds unrelated to the target;
+2. fits a forest on a row subsample of the remaining features and measures
+   permutation importance on held-out rows, in parallel;
+3. re-validates the selection by comparing the held-out accuracy with all
+   features and with the selected ones.
+
+The scores are cached in a JSON file keyed by the data fingerprint and the
+selection parameters, so re-running the notebook on the same data skips the
+work. raw_columns maps the selected one-hot features back to the raw input
+columns that save_model records in the artifact.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_selection import chi2, f_classif
+from sklearn.inspection import permutation_importance
+from sklearn.model_selection import train_test_split
+
+from osha_tuning import data_fingerprint
+
+FEATURE_CACHE_DIR = "feature_selection_cache"
+
+SCORE_FUNCTIONS = {'f_classif': f_classif, 'chi2': chi2}
+
+
+def prefilter(x, y, feature_names, score_func='f_classif', alpha=0.01, max_features=None):
+    """
+    Univariate pre-filter on the (sparse) feature matrix.
+
+    Args:
+        x: Feature matrix.
+        y: Target.
+        feature_names: Names of the columns of x.
+        score_func: 'f_classif' or 'chi2' (chi2 needs non-negative features).
+        alpha: Features with a p-value at or above alpha are dropped. Features
+            the test cannot score (NaN p-value) are kept.
+        max_features: Keep at most this many features, by score.
+
+    Returns:
+        DataFrame with the feature, its score, p_value and a 'kept' flag, indexed by column position.
+    """
+    scores, p_values = SCORE_FUNCTIONS[score_func](x, np.asarray(y))
+    table = pd.DataFrame({'feature': feature_names, 'score': scores, 'p_value': p_values})
+    table['kept'] = ~(table['p_value'] >= alpha)
+    if max_features is not None:
+        top = table[table['kept']].sort_values('score', ascending=False).index[:max_features]
+        table['kept'] = table.index.isin(top)
+    return table
+
+
+def _holdout_split(x, y, sample_size, random_state):
+    """Row subsample of at most sample_size rows split into a fitting and a held-out part."""
+    rows = np.arange(x.shape[0])
+    if sample_size is not None and len(rows) > sample_size:
+        rows = np.sort(np.random.RandomState(random_state).choice(rows, sample_size, replace=False))
+    return train_test_split(rows, test_size=0.3, random_state=random_state, stratify=np.asarray(y)[rows])
+
+
+def permutation_scores(x, y, feature_names, n_estimators=100, sample_size=50_000, n_repeats=5, n_jobs=-1,
+                       random_state=42):
+    """
+    Permutation importance of every column of x on a held-out row subsample.
+
+    Returns:
+        DataFrame with the feature, importance_mean and importance_std, indexed by column position.
+    """
+    y = np.asarray(y)
+    fit_rows, test_rows = _holdout_split(x, y, sample_size, random_state)
+    model = RandomForestClassifier(n_estimators=n_estimators, random_state=random_state, n_jobs=n_jobs)
+    model.fit(x[fit_rows], y[fit_rows])
+    # The held-out subsample is small, so it is densified for the column shuffles
+    x_test = x[test_rows]
+    x_test = x_test.toarray() if hasattr(x_test, 'toarray') else np.asarray(x_test)
+    result = permutation_importance(model, x_test, y[test_rows], n_repeats=n_repeats, n_jobs=n_jobs,
+                                    random_state=random_state)
+    return pd.DataFrame({'feature': feature_names, 'importance_mean': result.importances_mean,
+                         'importance_std': result.importances_std})
+
+
+def validate_selection(x, y, selected, n_estimators=100, sample_size=50_000, n_jobs=-1, random_state=42):
+    """Held-out accuracy of a forest on all columns of x and on the selected columns only."""
+    y = np.asarray(y)
+    fit_rows, test_rows = _holdout_split(x, y, sample_size, random_state + 1)
+    accuracies = {}
+    for name, columns in (('all', np.arange(x.shape[1])), ('selected', selected)):
+        model = RandomForestClassifier(n_estimators=n_estimators, random_state=random_state, n_jobs=n_jobs)
+        model.fit(x[fit_rows][:, columns], y[fit_rows])
+        accuracies[name] = model.score(x[test_rows][:, columns], y[test_rows])
+    return accuracies
+
+
+def select_features(x, y, feature_names, score_func='f_classif', alpha=0.01, max_features=None,
+                    min_importance=0.001, n_estimators=100, sample_size=50_000, n_repeats=5, n_jobs=-1,
+                    cache_dir=FEATURE_CACHE_DIR, random_state=42):
+    """
+    Select features with a univariate pre-filter followed by permutation importance.
+
+    Args:
+        x: One-hot feature matrix (sparse or dense).
+        y: Target.
+        feature_names: Names of the columns of x.
+        score_func: Univariate test of the pre-filter, 'f_classif' or 'chi2'.
+        alpha: p-value threshold of the pre-filter.
+        max_features: Maximum number of features kept by the pre-filter.
+        min_importance: Minimum mean accuracy drop for a feature to be selected.
+            When no feature reaches it, the top ranked feature is selected.
+        n_estimators: Trees of the forests used for permutation and validation.
+        sample_size: Rows subsampled for the permutation and validation forests.
+        n_repeats: Shuffles per feature.
+        n_jobs: Parallel jobs of the forests and of the permutations.
+        cache_dir: Directory of the cached scores, None disables caching.
+        random_state: Seed of the subsamples, the forests and the shuffles.
+
+    Returns:
+        The selected column positions, their names and a report DataFrame with
+        the univariate and permutation scores of every feature.
+    """
+    params = {'score_func': score_func, 'alpha': alpha, 'max_features': max_features,
+              'min_importance': min_importance, 'n_estimators': n_estimators, 'sample_size': sample_size,
+              'n_repeats': n_repeats, 'random_state': random_state}
+    cache_file = None
+    if cache_dir is not None:
+        key = json.dumps({'data': data_fingerprint(x, y), 'features': list(feature_names), **params},
+                         sort_keys=True)
+        digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+        cache_file = os.path.join(cache_dir, f"selection_{digest}.json")
+        if os.path.exists(cache_file):
+            with open(cache_file) as f:
+                cached = json.load(f)
+            report = pd.DataFrame(cached['report']).set_index('position')
+            print(f"Feature selection loaded from {cache_file}")
+            return np.array(cached['selected']), list(report.loc[cached['selected'], 'feature']), report
+
+    start = time.perf_counter()
+    report = prefilter(x, y, feature_names, score_func, alpha, max_features)
+    kept = report.index[report['kept']].to_numpy()
+    if not len(kept):
+        # Nothing passes the test: the permutation step still ranks the best scored feature
+        kept = report['score'].fillna(-np.inf).nlargest(1).index.to_numpy()
+        report.loc[kept, 'kept'] = True
+        print(f"No feature has a p-value below {alpha}; keeping the top scored feature "
+              f"{report.loc[kept[0], 'feature']}")
+    print(f"Univariate pre-filter kept {len(kept)} of {len(report)} features")
+    importances = permutation_scores(x[:, kept], y, report.loc[kept, 'feature'].tolist(), n_estimators,
+                                     sample_size, n_repeats, n_jobs, random_state)
+    importances.index = kept
+    report = report.join(importances[['importance_mean', 'importance_std']])
+    report['selected'] = report['importance_mean'].fillna(-np.inf) > min_importance
+    if not report['selected'].any():
+        # Fall back to the top ranked feature rather than training on zero columns
+        top = report.loc[kept, 'importance_mean'].fillna(-np.inf).idxmax()
+        report.loc[top, 'selected'] = True
+        print(f"No feature reaches min_importance={min_importance}; keeping the top ranked feature "
+              f"{report.loc[top, 'feature']}")
+    selected = report.index[report['selected']].to_numpy()
+    accuracies = validate_selection(x, y, selected, n_estimators, sample_size, n_jobs, random_state)
+    print(f"Selected {len(selected)} features in {time.perf_counter() - start:.1f}s; held-out accuracy "
+          f"{accuracies['selected']:.4f} with the selected features vs {accuracies['all']:.4f} with all "
+          f"{x.shape[1]} features")
+
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_file, 'w') as f:
+            json.dump({'params': params, 'selected': selected.tolist(), 'accuracies': accuracies,
+                       'report': report.reset_index(names='position').to_dict(orient='records')}, f, default=float)
+    report.index.name = 'position'
+    return selected, list(report.loc[selected, 'feature']), report
+
+
+def raw_columns(selected_features, numeric_columns, categorical_columns):
+    """
+    Raw input columns that produce at least one of the selected one-hot features.
+
+    Returns:
+        The numeric and categorical raw columns, in their original order.
+    """
+    selected = set(selected_features)
+    numeric = [column for column in numeric_columns if column in selected]
+    categorical = [column for column in categorical_columns
+                   if any(feature.startswith(f"{column}_") for feature in selected)]
+    return numeric, categorical
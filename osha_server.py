@@ -0,0 +1,285 @@
+"""Low-latency HTTP prediction service with micro-batching.
+
+The model artifact is loaded once at startup. Concurrent requests are queued
+and coalesced into micro-batches (up to max_batch_size records, waiting at most
+max_wait_ms for more to arrive) so the pipeline runs one vectorized predict per
+batch instead of one per record. When a batch fails it is re-scored record by
+record, so only the requests with a bad record get an error. Only the standard
+library asyncio streams are used, so no web framework is needed.
+
+Endpoints:
+    POST /predict   JSON record or list of records
+                    -> {"predictions": [...], "probabilities": [[...]], "classes": [...]}
+    GET  /metrics   p50/p99 latency, throughput, batch sizes and prediction cache counters
+    GET  /health
+
+Usage:
+    python osha_server.py --model final_best_occupational_safety_model.pkl --port 8080 --cache-size 100000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+from osha_pipeline import load_model, predict_with_proba, prepare_records
+from osha_prediction_cache import PredictionCache
+
+MODEL_PATH = 'final_best_occupational_safety_model.pkl'
+
+
+class Metrics:
+    """Rolling request latency and throughput counters."""
+
+    def __init__(self, window=10_000):
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.requests = 0
+        self.records = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+
+    def observe(self, seconds, n_records):
+        self.latencies.append(seconds)
+        self.requests += 1
+        self.records += n_records
+
+    def snapshot(self):
+        uptime = time.perf_counter() - self.started
+        latencies = np.array(self.latencies) * 1000
+        batch_sizes = np.array(self.batch_sizes)
+        return {
+            'requests': self.requests,
+            'records': self.records,
+            'errors': self.errors,
+            'uptime_s': uptime,
+            'requests_per_sec': self.requests / uptime if uptime else 0.0,
+            'records_per_sec': self.records / uptime if uptime else 0.0,
+            'latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'latency_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'batches': len(batch_sizes),
+            'mean_batch_size': float(batch_sizes.mean()) if len(batch_sizes) else None,
+        }
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent prediction calls into vectorized batches.
+
+    Args:
+        artifact: Model artifact from osha_pipeline.load_model.
+        max_batch_size: Maximum number of records per batch.
+        max_wait_ms: Maximum time the first record of a batch waits for more.
+        metrics: Metrics object receiving the batch sizes.
+        cache: Optional osha_prediction_cache.PredictionCache answering
+            repeated records without calling the model.
+    """
+
+    def __init__(self, artifact, max_batch_size=256, max_wait_ms=5.0, metrics=None, cache=None):
+        self.artifact = artifact
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.metrics = metrics or Metrics()
+        self.queue = asyncio.Queue()
+        pipeline = artifact['pipeline']
+        self.classes = pipeline.classes_.tolist()
+
+    async def predict(self, records):
+        """Queue records and wait for their (prediction, probabilities) results."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for record in records:
+            future = loop.create_future()
+            await self.queue.put((record, future))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    def _score(self, records):
+        # The predictions are those of the pipeline's predict (see predict_with_proba)
+        if self.cache is not None:
+            predictions, probabilities = self.cache.score(records)
+        else:
+            x = prepare_records(records, self.artifact['numeric_columns'], self.artifact['categorical_columns'])
+            predictions, probabilities = predict_with_proba(self.artifact['pipeline'], x)
+        if probabilities is None:
+            return [(prediction, None) for prediction in predictions.tolist()]
+        return list(zip(predictions.tolist(), probabilities.tolist()))
+
+    def _score_each(self, records):
+        """Score every record alone; a record that fails gets its exception as result."""
+        results = []
+        for record in records:
+            try:
+                results.append(self._score([record])[0])
+            except Exception as error:
+                results.append(error)
+        return results
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.metrics.batch_sizes.append(len(batch))
+            records = [record for record, _ in batch]
+            try:
+                # The sklearn call runs in a thread so the event loop keeps accepting requests
+                results = await loop.run_in_executor(None, self._score, records)
+            except Exception:
+                # One bad record must not fail the other requests of the batch
+                results = await loop.run_in_executor(None, self._score_each, records)
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+async def _read_request(reader):
+    """
+    Parse one HTTP/1.1 request, return (method, path, headers, body) or None at EOF.
+
+    Raises ValueError for a malformed request line, header or Content-Length.
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    parts = request_line.decode('latin-1').split(' ', 2)
+    if len(parts) != 3:
+        raise ValueError(f"Malformed request line {request_line[:100]!r}")
+    method, path, _ = parts
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length < 0:
+        raise ValueError(f"Invalid Content-Length {length}")
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+
+def _response(status, payload, keep_alive=True):
+    body = json.dumps(payload).encode()
+    reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}[status]
+    head = (f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+
+class PredictionServer:
+    """
+    asyncio HTTP server in front of a MicroBatcher.
+
+    Args:
+        model_path: Artifact written by osha_pipeline.save_model.
+        max_batch_size: Maximum number of records per micro-batch.
+        max_wait_ms: Maximum wait for a micro-batch to fill.
+        cache_size: Records kept in the prediction cache, 0 disables it.
+        cache_ttl: Seconds a cached prediction stays valid, None for no expiry.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, max_batch_size=256, max_wait_ms=5.0, cache_size=0, cache_ttl=None):
+        self.metrics = Metrics()
+        artifact = load_model(model_path)
+        self.cache = PredictionCache(artifact, cache_size, cache_ttl) if cache_size else None
+        self.batcher = MicroBatcher(artifact, max_batch_size, max_wait_ms, self.metrics, self.cache)
+
+    async def handle_predict(self, body):
+        payload = json.loads(body)
+        records = payload if isinstance(payload, list) else [payload]
+        results = await self.batcher.predict(records)
+        return {'predictions': [prediction for prediction, _ in results],
+                'probabilities': [probabilities for _, probabilities in results],
+                'classes': self.batcher.classes}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except ValueError as error:
+                    # The rest of the stream cannot be parsed reliably, so the connection is closed
+                    self.metrics.errors += 1
+                    writer.write(_response(400, {'error': str(error)}, keep_alive=False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                start = time.perf_counter()
+                if method == 'POST' and path == '/predict':
+                    try:
+                        payload = await self.handle_predict(body)
+                        status = 200
+                    except (ValueError, TypeError, KeyError) as error:
+                        self.metrics.errors += 1
+                        status, payload = 400, {'error': str(error)}
+                    except Exception as error:
+                        self.metrics.errors += 1
+                        status, payload = 500, {'error': str(error)}
+                    if status == 200:
+                        self.metrics.observe(time.perf_counter() - start, len(payload['predictions']))
+                elif method == 'GET' and path == '/metrics':
+                    status, payload = 200, self.metrics.snapshot()
+                    if self.cache is not None:
+                        payload['cache'] = self.cache.stats()
+                elif method == 'GET' and path == '/health':
+                    status, payload = 200, {'status': 'ok'}
+                else:
+                    status, payload = 404, {'error': f"No route for {method} {path}"}
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        batcher_task = asyncio.create_task(self.batcher.run())
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving predictions on http://{host}:{port} "
+              f"(max batch {self.batcher.max_batch_size}, max wait {self.batcher.max_wait * 1000:.1f} ms)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve degree of injury predictions over HTTP.")
+    parser.add_argument('--model', default=MODEL_PATH, help="Saved model artifact")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--cache-size', type=int, default=0, help="Prediction cache entries, 0 disables the cache")
+    parser.add_argument('--cache-ttl', type=float, default=None, help="Prediction cache entry lifetime in seconds")
+    args = parser.parse_args(argv)
+    server = PredictionServer(args.model, args.max_batch_size, args.max_wait_ms, args.cache_size, args.cache_ttl)
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
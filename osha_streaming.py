@@ -0,0 +1,223 @@
+"""Out-of-core training of the linear and random forest baselines.
+
+The notebook fits every model on in-memory arrays, which does not work for
+the full multi-year OSHA history. train_streaming reads the CSV chunk by chunk
+with iter_osha_chunks and never holds more than one chunk of rows:
+
+1. a first pass keeps a uniform random sample of the training rows (sample_size
+   rows) to fit the preprocessing (imputation, one-hot encoding, scaling) and
+   collects the class labels;
+2. SGDClassifier(loss='log_loss') - a logistic regression trained with SGD,
+   the streaming counterpart of the LogisticRegression baseline - is updated
+   with partial_fit on every chunk, for one or more epochs;
+3. a RandomForestClassifier with warm_start=True grows trees_per_chunk new trees
+   on each chunk, so the forest is an ensemble of trees each trained on one chunk;
+4. a last pass scores the held-out rows.
+
+Every row is assigned to the held-out split by a generator seeded with the
+chunk number, so each pass sees the same split. With compare_in_memory=True the
+same training rows are also loaded at once and the LogisticRegression and
+RandomForestClassifier baselines are fitted in memory for comparison.
+
+Usage:
+    python osha_streaming.py history.csv --chunksize 200000 --trees-per-chunk 10 --compare
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.pipeline import Pipeline
+
+from osha_data import DATA_PATH, iter_osha_chunks
+from osha_pipeline import TARGET, build_preprocessor, prepare_records
+from osha_profiling import peak_rss_mb
+
+# Raw features used by the notebook after the column drop
+FEATURE_COLUMNS = ['age', 'nature_of_inj', 'part_of_body', 'src_of_injury', 'evn_factor', 'sic_list',
+                   'activity_nr', 'rel_insp_nr', 'fatality', 'sex', 'union_status']
+
+
+def iter_split_chunks(path, chunksize=100_000, columns=FEATURE_COLUMNS, test_size=0.2, random_state=42):
+    """
+    Yield (x_train, y_train, x_test, y_test) for every chunk of the CSV.
+
+    Rows without a degree_of_inj are skipped. The held-out rows are drawn by a
+    generator seeded with (random_state, chunk number), so the split is the same
+    on every pass over the file.
+    """
+    for chunk_index, chunk in enumerate(iter_osha_chunks(path, chunksize)):
+        rng = np.random.default_rng([random_state, chunk_index])
+        test = rng.random(len(chunk)) < test_size
+        labeled = chunk[TARGET].notna().to_numpy()
+        x = chunk.reindex(columns=columns)
+        y = chunk[TARGET].to_numpy(dtype='float64', na_value=np.nan)
+        train_rows, test_rows = labeled & ~test, labeled & test
+        yield x[train_rows], y[train_rows].astype(np.int64), x[test_rows], y[test_rows].astype(np.int64)
+
+
+def _columns(columns, categorical_columns):
+    categorical = [column for column in columns if column in categorical_columns]
+    return [column for column in columns if column not in categorical], categorical
+
+
+def fit_stream_preprocessor(path, chunksize=100_000, columns=FEATURE_COLUMNS, test_size=0.2, sample_size=100_000,
+                            categorical_columns=('fatality', 'sex', 'union_status'), random_state=42):
+    """
+    Fit the preprocessing on a uniform sample of the training rows in one pass.
+
+    Each row gets a random key and the sample_size rows with the smallest keys
+    are kept, so at most one chunk plus the sample is in memory. Categories
+    that never occur in the sample are ignored by the one-hot encoders
+    (handle_unknown='ignore').
+
+    Returns:
+        The fitted preprocessor, the numeric and categorical columns, the
+        class labels and the number of training rows.
+    """
+    numeric_columns, categorical_columns = _columns(columns, categorical_columns)
+    rng = np.random.default_rng(random_state)
+    sample, sample_keys = None, None
+    classes = set()
+    n_train = 0
+    for x_train, y_train, _, _ in iter_split_chunks(path, chunksize, columns, test_size, random_state):
+        n_train += len(y_train)
+        classes.update(np.unique(y_train).tolist())
+        keys = rng.random(len(x_train))
+        candidates = x_train if sample is None else pd.concat([sample, x_train])
+        candidate_keys = keys if sample_keys is None else np.concatenate([sample_keys, keys])
+        keep = np.argsort(candidate_keys)[:sample_size]
+        sample, sample_keys = candidates.iloc[keep], candidate_keys[keep]
+    if sample is None:
+        raise ValueError(f"No labeled rows in {path}")
+    preprocessor = build_preprocessor(numeric_columns, categorical_columns)
+    preprocessor.fit(prepare_records(sample, numeric_columns, categorical_columns))
+    return preprocessor, numeric_columns, categorical_columns, np.array(sorted(classes)), n_train
+
+
+def train_streaming(path=DATA_PATH, chunksize=100_000, columns=FEATURE_COLUMNS, test_size=0.2, epochs=1,
+                    trees_per_chunk=10, forest_params=None, sample_size=100_000, compare_in_memory=False,
+                    random_state=42):
+    """
+    Train the streaming linear model and forest chunk by chunk and report held-out accuracy.
+
+    Args:
+        path: OSHA CSV file, read with iter_osha_chunks.
+        chunksize: Rows read per chunk; bounds the memory of every pass.
+        columns: Raw feature columns.
+        test_size: Fraction of the rows held out for evaluation.
+        epochs: Passes of SGDClassifier.partial_fit over the training chunks.
+        trees_per_chunk: Trees added to the forest for every chunk.
+        forest_params: Extra RandomForestClassifier parameters, e.g. max_depth.
+        sample_size: Training rows sampled to fit the preprocessing.
+        compare_in_memory: Also fit LogisticRegression and a RandomForestClassifier
+            with the same number of trees on all training rows at once.
+        random_state: Seed of the split, the sample and the models.
+
+    Returns:
+        Dict with the fitted 'linear' and 'forest' pipelines (preprocessing +
+        model), the 'numeric_columns'/'categorical_columns' layout and the
+        'report' DataFrame.
+    """
+    start = time.perf_counter()
+    preprocessor, numeric_columns, categorical_columns, classes, n_train = fit_stream_preprocessor(
+        path, chunksize, columns, test_size, sample_size, random_state=random_state)
+    print(f"Preprocessing fitted on a sample of {min(sample_size, n_train)} of {n_train} training rows "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    def transformed_chunks():
+        for x_train, y_train, x_test, y_test in iter_split_chunks(path, chunksize, columns, test_size,
+                                                                  random_state):
+            yield (preprocessor.transform(prepare_records(x_train, numeric_columns, categorical_columns)), y_train,
+                   preprocessor.transform(prepare_records(x_test, numeric_columns, categorical_columns)), y_test)
+
+    linear = SGDClassifier(loss='log_loss', random_state=random_state)
+    forest = RandomForestClassifier(n_estimators=trees_per_chunk, warm_start=True, random_state=random_state,
+                                    n_jobs=-1, **(forest_params or {}))
+    fit_seconds = {'SGD logistic regression (streaming)': 0.0, 'Random Forest (warm start)': 0.0}
+    for epoch in range(epochs):
+        for chunk_index, (x_train, y_train, _, _) in enumerate(transformed_chunks()):
+            if not len(y_train):
+                continue
+            tic = time.perf_counter()
+            linear.partial_fit(x_train, y_train, classes=classes)
+            fit_seconds['SGD logistic regression (streaming)'] += time.perf_counter() - tic
+            # The trees are grown once, on the first pass over the chunks
+            if epoch > 0:
+                continue
+            # Trees fitted on a chunk missing a class would not line up with the others
+            if not np.array_equal(np.unique(y_train), classes):
+                print(f"Chunk {chunk_index} does not contain every class, no trees added")
+                continue
+            tic = time.perf_counter()
+            if hasattr(forest, 'estimators_'):
+                forest.n_estimators += trees_per_chunk
+            forest.fit(x_train, y_train)
+            fit_seconds['Random Forest (warm start)'] += time.perf_counter() - tic
+        print(f"Epoch {epoch + 1}/{epochs} done, peak RSS {peak_rss_mb()[0]:.0f} MB")
+    streaming_rss = peak_rss_mb()[0]
+
+    models = {'SGD logistic regression (streaming)': linear, 'Random Forest (warm start)': forest}
+    if compare_in_memory:
+        x_train, y_train = [], []
+        for chunk_x, chunk_y, _, _ in transformed_chunks():
+            x_train.append(chunk_x)
+            y_train.append(chunk_y)
+        x_train, y_train = sparse.vstack(x_train, format='csr'), np.concatenate(y_train)
+        in_memory = {
+            'Logistic Regression (in memory)': LogisticRegression(max_iter=1000),
+            'Random Forest (in memory)': RandomForestClassifier(n_estimators=len(forest.estimators_),
+                                                                random_state=random_state, n_jobs=-1,
+                                                                **(forest_params or {})),
+        }
+        for name, model in in_memory.items():
+            tic = time.perf_counter()
+            model.fit(x_train, y_train)
+            fit_seconds[name] = time.perf_counter() - tic
+        del x_train, y_train
+        models.update(in_memory)
+
+    correct = dict.fromkeys(models, 0)
+    n_test = 0
+    for _, _, x_test, y_test in transformed_chunks():
+        n_test += len(y_test)
+        if len(y_test):
+            for name, model in models.items():
+                correct[name] += int((model.predict(x_test) == y_test).sum())
+    report = pd.DataFrame([{
+        'model': name,
+        'mode': 'in memory' if name.endswith('(in memory)') else 'streaming',
+        'test_accuracy': correct[name] / max(n_test, 1),
+        'fit_s': fit_seconds[name],
+    } for name in models])
+    print(f"Held-out rows: {n_test}, peak RSS streaming {streaming_rss:.0f} MB, "
+          f"overall {peak_rss_mb()[0]:.0f} MB")
+    print(report.to_string(index=False))
+    return {
+        'linear': Pipeline([('preprocess', preprocessor), ('model', linear)]),
+        'forest': Pipeline([('preprocess', preprocessor), ('model', forest)]),
+        'numeric_columns': numeric_columns,
+        'categorical_columns': categorical_columns,
+        'report': report,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the linear and forest baselines chunk by chunk.")
+    parser.add_argument('data', nargs='?', default=DATA_PATH, help="OSHA CSV file")
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    parser.add_argument('--epochs', type=int, default=1)
+    parser.add_argument('--trees-per-chunk', type=int, default=10)
+    parser.add_argument('--sample-size', type=int, default=100_000)
+    parser.add_argument('--compare', action='store_true', help="Also fit the in-memory baselines")
+    args = parser.parse_args(argv)
+    train_streaming(args.data, args.chunksize, epochs=args.epochs, trees_per_chunk=args.trees_per_chunk,
+                    sample_size=args.sample_size, compare_in_memory=args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""Synthetic OSHA accident and inspection records.
+
+Generates rows with the columns of the merged OSHA CSV (the kept columns and
+the columns in DROP_COLUMNS) so loading, training and scoring can be tested
+offline at any size. The coded columns follow skewed (Zipf-like) frequencies
+over their real code ranges, and degree_of_inj is drawn from an imbalanced
+class distribution that depends on the nature of injury, event type, source
+of injury and age, so models have signal to learn. The null rates are those of
+the May 2021 file (notebook output), so the generated columns survive the
+MAX_NULL_FRACTION filter of the loader like the real ones: the coded columns
+are almost never missing, and fatality is 'X' for nearly all fatal injuries
+and for the other injuries of fatal accidents, about 67% of the rows.
+
+All distributions are fixed by the seed; each chunk draws its rows from its
+own generator, so the output only depends on (seed, chunksize, n_rows) and a
+file of any size is written with constant memory.
+
+Usage:
+    python osha_synthetic.py synthetic_osha.csv --rows 10000000 --chunksize 100000
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from osha_data import CODE_DTYPES
+
+# The coded columns, age, sic_list and degree_of_inj are missing in 4 of the 23896 rows of the May 2021 file
+CODE_NULL_RATE = 0.0002
+
+# Code range and null rate of the coded columns
+CODE_COLUMNS = {
+    'nature_of_inj': (1, 22, CODE_NULL_RATE),
+    'part_of_body': (1, 31, CODE_NULL_RATE),
+    'src_of_injury': (1, 47, CODE_NULL_RATE),
+    'event_type': (1, 14, CODE_NULL_RATE),
+    'evn_factor': (1, 18, CODE_NULL_RATE),
+    'hum_factor': (1, 20, CODE_NULL_RATE),
+    'task_assigned': (1, 2, CODE_NULL_RATE),
+}
+
+N_SIC_CODES = 900
+SIC_NULL_RATE = CODE_NULL_RATE
+AGE_NULL_RATE = CODE_NULL_RATE
+# OSHA records unknown ages as 0
+AGE_ZERO_RATE = 0.03
+DEGREE_NULL_RATE = CODE_NULL_RATE
+FATALITY_NULL_RATE = 0.33
+
+SEX_VALUES = {'M': 0.88, 'F': 0.084, None: 0.036}
+UNION_VALUES = {'N': 0.64, 'Y': 0.14, 'A': 0.06, 'B': 0.05, 'U': 0.088, None: 0.022}
+
+# degree_of_inj: 1 fatality, 2 hospitalized, 3 non-hospitalized
+DEGREE_CLASSES = np.array([1, 2, 3])
+DEGREE_PRIOR = np.array([0.28, 0.52, 0.20])
+
+ABSTRACTS = [
+    'Employee #1 was working on a roof when he fell to the ground below.',
+    'Employee #1 was struck by a backing truck at the construction site.',
+    'Employee #1 was operating a press when his hand was caught in the die.',
+    'Employee #1 was electrocuted when the boom contacted an overhead power line.',
+    'Employee #1 was cleaning a machine when a conveyor started and amputated a finger.',
+]
+
+
+def _zipf_probabilities(n_values, rng, exponent=1.1):
+    """Skewed frequencies over n_values codes, in a random code order."""
+    probabilities = 1.0 / np.arange(1, n_values + 1) ** exponent
+    return rng.permutation(probabilities / probabilities.sum())
+
+
+class SyntheticOSHA:
+    """
+    Seeded generator of OSHA-shaped records.
+
+    Args:
+        random_state: Seed fixing the code frequencies, the class effects and the rows.
+        include_dropped: Also generate the columns in DROP_COLUMNS (free text,
+            dates, addresses), so the file has the width of the real one.
+    """
+
+    def __init__(self, random_state=42, include_dropped=True):
+        self.random_state = random_state
+        self.include_dropped = include_dropped
+        rng = np.random.default_rng([random_state, 0])
+        self.code_probabilities = {column: _zipf_probabilities(high - low + 1, rng)
+                                   for column, (low, high, _) in CODE_COLUMNS.items()}
+        self.sic_codes = np.sort(rng.choice(np.arange(100, 10_000), N_SIC_CODES, replace=False))
+        self.sic_probabilities = _zipf_probabilities(N_SIC_CODES, rng, exponent=0.9)
+        # Per-code shifts of the degree_of_inj log-odds
+        self.degree_effects = {column: rng.normal(0, 0.8, (high - low + 2, len(DEGREE_CLASSES)))
+                               for column, (low, high, _) in CODE_COLUMNS.items()
+                               if column in ('nature_of_inj', 'event_type', 'src_of_injury')}
+
+    def _codes(self, column, n_rows, rng):
+        low, high, null_rate = CODE_COLUMNS[column]
+        codes = pd.array(low + rng.choice(high - low + 1, n_rows, p=self.code_probabilities[column]),
+                         dtype=CODE_DTYPES[column])
+        codes[rng.random(n_rows) < null_rate] = pd.NA
+        return codes
+
+    def _choice(self, values, n_rows, rng):
+        return rng.choice(np.array(list(values), dtype=object), n_rows, p=list(values.values()))
+
+    def _degree(self, data, age, rng):
+        logits = np.tile(np.log(DEGREE_PRIOR), (len(data), 1))
+        for column, effects in self.degree_effects.items():
+            low = CODE_COLUMNS[column][0]
+            codes = data[column].fillna(low - 1).to_numpy(dtype=np.int64) - low + 1
+            logits += effects[codes]
+        # Older workers are more likely to be hospitalized or killed
+        logits[:, :2] += np.nan_to_num((age - 40) / 40)[:, None] * 0.5
+        probabilities = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        draws = (probabilities.cumsum(axis=1) < rng.random((len(data), 1))).sum(axis=1)
+        return DEGREE_CLASSES[np.minimum(draws, len(DEGREE_CLASSES) - 1)]
+
+    def chunk(self, chunk_index, n_rows, first_id=0):
+        """Generate chunk number chunk_index with n_rows rows; summary_nr starts at first_id."""
+        rng = np.random.default_rng([self.random_state, 1, chunk_index])
+        data = pd.DataFrame({'summary_nr': np.arange(first_id, first_id + n_rows, dtype=np.int64) + 10_000_000})
+        activity_nr = rng.integers(100_000_000, 350_000_000, n_rows)
+        data['activity_nr'] = activity_nr
+        # Most accidents belong to the inspection that reported them
+        data['rel_insp_nr'] = np.where(rng.random(n_rows) < 0.8, activity_nr,
+                                       rng.integers(100_000_000, 350_000_000, n_rows))
+        age = np.clip(rng.normal(40, 12, n_rows).round(), 16, 80)
+        age[rng.random(n_rows) < AGE_ZERO_RATE] = 0
+        age[rng.random(n_rows) < AGE_NULL_RATE] = np.nan
+        data['age'] = pd.array(age, dtype='Float64').astype('Int8')
+        data['sex'] = self._choice(SEX_VALUES, n_rows, rng)
+        for column in CODE_COLUMNS:
+            data[column] = self._codes(column, n_rows, rng)
+        sic = self.sic_codes[rng.choice(N_SIC_CODES, n_rows, p=self.sic_probabilities)]
+        data['sic_list'] = pd.array(sic, dtype='Int16')
+        data.loc[rng.random(n_rows) < SIC_NULL_RATE, 'sic_list'] = pd.NA
+        data['union_status'] = self._choice(UNION_VALUES, n_rows, rng)
+
+        degree = self._degree(data, age, rng)
+        fatal = (degree == 1) & (rng.random(n_rows) < 0.97)
+        # The other injuries of fatal accidents are flagged too, up to 1 - FATALITY_NULL_RATE of the rows
+        other_rate = (1 - FATALITY_NULL_RATE - fatal.mean()) / max((degree != 1).mean(), 1e-9)
+        flagged = fatal | ((degree != 1) & (rng.random(n_rows) < np.clip(other_rate, 0, 1)))
+        data['fatality'] = np.where(flagged, 'X', None)
+        data['degree_of_inj'] = pd.array(degree, dtype='Int8')
+        data.loc[rng.random(n_rows) < DEGREE_NULL_RATE, 'degree_of_inj'] = pd.NA
+
+        if self.include_dropped:
+            self._add_dropped_columns(data, rng)
+        return data
+
+    def _add_dropped_columns(self, data, rng):
+        n_rows = len(data)
+        days = rng.integers(0, 365 * 20, n_rows)
+        dates = (np.datetime64('2001-01-01') + days).astype(str)
+        data['abstract_text'] = np.array(ABSTRACTS, dtype=object)[rng.integers(0, len(ABSTRACTS), n_rows)]
+        data['event_date'] = dates
+        data['event_time'] = rng.integers(0, 2400, n_rows)
+        data['open_date'] = dates
+        data['close_case_date'] = (np.datetime64('2001-03-01') + days).astype(str)
+        data['injury_line_nr'] = rng.integers(1, 4, n_rows)
+        data['site_zip'] = rng.integers(10_000, 99_999, n_rows)
+        data['mail_zip'] = np.where(rng.random(n_rows) < 0.7, np.nan, rng.integers(10_000, 99_999, n_rows))
+        data['naics_code'] = rng.integers(111_110, 928_120, n_rows)
+        data['sic_code'] = data['sic_list']
+        data['occ_code'] = np.where(rng.random(n_rows) < 0.4, np.nan, rng.integers(1, 900, n_rows))
+        data['nr_in_estab'] = rng.lognormal(3, 1.5, n_rows).round()
+        data['owner_code'] = rng.integers(0, 4, n_rows)
+        data['fall_distance'] = np.where(rng.random(n_rows) < 0.85, np.nan, rng.integers(1, 60, n_rows))
+
+    def iter_chunks(self, n_rows, chunksize=100_000):
+        """Yield DataFrames of at most chunksize rows, n_rows in total."""
+        for chunk_index, start in enumerate(range(0, n_rows, chunksize)):
+            yield self.chunk(chunk_index, min(chunksize, n_rows - start), first_id=start)
+
+
+def make_osha_frame(n_rows, random_state=42, include_dropped=True, chunksize=100_000):
+    """Synthetic OSHA records as a single in-memory DataFrame."""
+    generator = SyntheticOSHA(random_state, include_dropped)
+    return pd.concat(generator.iter_chunks(n_rows, chunksize), ignore_index=True)
+
+
+def write_synthetic_osha(path, n_rows, chunksize=100_000, random_state=42, include_dropped=True):
+    """
+    Stream synthetic OSHA records to a CSV or Parquet file chunk by chunk.
+
+    Args:
+        path: Output file, Parquet when it ends with .parquet, CSV otherwise.
+        n_rows: Total number of rows.
+        chunksize: Rows generated and written at a time.
+        random_state: Seed of the generator.
+        include_dropped: Also write the columns in DROP_COLUMNS.
+
+    Returns:
+        The output path.
+    """
+    generator = SyntheticOSHA(random_state, include_dropped)
+    tmp_path = f"{path}.tmp"
+    if path.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for chunk in generator.iter_chunks(n_rows, chunksize):
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        for i, chunk in enumerate(generator.iter_chunks(n_rows, chunksize)):
+            chunk.to_csv(tmp_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic OSHA accident and inspection records.")
+    parser.add_argument('output', help="Output .csv or .parquet file")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--kept-columns-only', action='store_true', help="Skip the columns in DROP_COLUMNS")
+    args = parser.parse_args(argv)
+    write_synthetic_osha(args.output, args.rows, args.chunksize, args.seed, not args.kept_columns_only)
+    print(f"Wrote {args.rows} synthetic rows to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+"""One resumable hyperparameter search engine for all candidate models.
+
+The notebook tuned every model twice with separate GridSearchCV calls. Here all
+candidates go through the same engine, which supports exhaustive and random
+search and their successive halving variants (the strategies of sklearn's
+GridSearchCV, RandomizedSearchCV, HalvingGridSearchCV and
+HalvingRandomSearchCV), runs every (model, params, fold) fit in parallel on all
+cores and appends each finished fit to a checkpoint file. A search that is
+interrupted resumes from the checkpoint without repeating finished fits.
+"""
+
+import hashlib
+import json
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid, ParameterSampler, StratifiedKFold
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.svm import SVC
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.utils import _safe_indexing
+
+CHECKPOINT_DIR = "tuning_checkpoints"
+
+SEARCH_MODES = ['grid', 'random', 'halving_grid', 'halving_random']
+
+# Parameter grids for each model
+PARAM_GRIDS = {
+    "Random Forest": {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [None, 10, 20],
+        'min_samples_split': [2, 5, 10]
+    },
+    "Decision Tree": {
+        'max_depth': [None, 10, 20],
+        'min_samples_split': [2, 5, 10]
+    },
+    "Logistic Regression": {
+        'C': [0.001, 0.01, 0.1, 1, 10],
+        'solver': ['liblinear', 'saga']
+    },
+    "SVM": {
+        'C': [0.001, 0.01, 0.1, 1, 10],
+        'kernel': ['linear', 'rbf']
+    },
+    "KNN": {
+        'n_neighbors': [3, 5, 7, 9],
+        'weights': ['uniform', 'distance']
+    }
+}
+
+
+def candidate_models():
+    """Return the unfitted candidate models keyed by name."""
+    return {
+        "Random Forest": RandomForestClassifier(),
+        "Decision Tree": DecisionTreeClassifier(),
+        "Logistic Regression": LogisticRegression(max_iter=1000),
+        "SVM": SVC(probability=True),
+        "KNN": KNeighborsClassifier(),
+    }
+
+
+def data_fingerprint(x, y):
+    """Hash the training data so checkpoints are never reused for other data."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(x.shape).encode())
+    if sparse.issparse(x):
+        x = x.tocsr()
+        for array in (x.data, x.indices, x.indptr):
+            digest.update(np.ascontiguousarray(array).tobytes())
+    elif isinstance(x, pd.DataFrame):
+        digest.update(pd.util.hash_pandas_object(x, index=False).to_numpy().tobytes())
+    else:
+        digest.update(np.ascontiguousarray(x).tobytes())
+    digest.update(pd.util.hash_pandas_object(pd.Series(np.asarray(y)), index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def estimator_fingerprint(estimator):
+    """
+    Hash the class and constructor settings of an estimator (nested ones included).
+
+    Part of every checkpoint key, so fits of a changed model definition are not reused.
+    """
+    params = estimator.get_params(deep=True)
+    items = []
+    for name in sorted(params):
+        value = params[name]
+        if hasattr(value, 'get_params'):
+            # The settings of nested estimators are listed under their own 'step__param' names
+            value = type(value).__qualname__
+        elif callable(value):
+            value = f"{getattr(value, '__module__', '')}.{getattr(value, '__qualname__', repr(value))}"
+        items.append((name, repr(value)))
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(f"{type(estimator).__module__}.{type(estimator).__qualname__}{items!r}".encode())
+    return digest.hexdigest()
+
+
+def _task_key(name, estimator_key, params, fold, n_resources):
+    return json.dumps({'model': name, 'estimator': estimator_key, 'params': params, 'fold': fold,
+                       'n_resources': n_resources}, sort_keys=True, default=str)
+
+
+class CheckpointStore:
+    """
+    Append-only JSON lines file with the result of every finished fit.
+
+    Args:
+        path: Checkpoint file. It is created on the first finished fit.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.results = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut by an interrupted write is simply recomputed
+                        continue
+                    self.results[record['key']] = record
+
+    def __contains__(self, key):
+        return key in self.results
+
+    def __getitem__(self, key):
+        return self.results[key]
+
+    def add(self, record):
+        self.results[record['key']] = record
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+            f.flush()
+
+
+def _fit_and_score(key, estimator, params, x_train, y_train, x_test, y_test, scorer):
+    estimator = clone(estimator).set_params(**params)
+    # Epoch timestamps, comparable between the worker processes, give the wall-clock span of a candidate
+    started = time.time()
+    start = time.perf_counter()
+    try:
+        estimator.fit(x_train, y_train)
+    except Exception as error:
+        # Like GridSearchCV(error_score=np.nan), a failing candidate gets a NaN score
+        return {'key': key, 'score': np.nan, 'fit_time': time.perf_counter() - start, 'score_time': 0.0,
+                'started': started, 'finished': time.time(), 'error': repr(error)}
+    fit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    score = scorer(estimator, x_test, y_test)
+    score_time = time.perf_counter() - start
+    return {'key': key, 'score': float(score), 'fit_time': fit_time, 'score_time': score_time,
+            'started': started, 'finished': time.time()}
+
+
+def _wall_time(records):
+    """Seconds from the first fold start to the last fold end of a candidate, NaN for older checkpoints."""
+    if not all('started' in record for record in records):
+        return np.nan
+    return max(record['finished'] for record in records) - min(record['started'] for record in records)
+
+
+def _sort_key(row):
+    score = row['mean_test_score']
+    return -np.inf if np.isnan(score) else score
+
+
+def _candidate_params(param_grid, search, n_iter, random_state):
+    if search in ('grid', 'halving_grid'):
+        return list(ParameterGrid(param_grid))
+    return list(ParameterSampler(param_grid, n_iter=n_iter, random_state=random_state))
+
+
+def _halving_schedule(n_candidates, max_resources, min_resources, factor):
+    """Number of rows used at each successive halving iteration."""
+    n_iterations = 1 + int(math.floor(math.log(max(n_candidates, 1), factor)))
+    first = max(max_resources // factor ** (n_iterations - 1), min_resources)
+    schedule = [min(first * factor ** i, max_resources) for i in range(n_iterations)]
+    schedule[-1] = max_resources
+    return schedule
+
+
+def tune_models(x, y, models=None, param_grids=PARAM_GRIDS, search='grid', cv=5, scoring='accuracy',
+                n_iter=10, factor=3, n_jobs=-1, checkpoint_dir=CHECKPOINT_DIR, random_state=42, refit=True,
+                fold_cache=None):
+    """
+    Tune every candidate model with the same resumable search engine.
+
+    Args:
+        x: Training features (numpy array, sparse matrix or DataFrame).
+        y: Training target.
+        models: Dict of name -> unfitted estimator, candidate_models() by default.
+        param_grids: Dict of name -> parameter grid (or distributions for random search).
+        search: One of 'grid', 'random', 'halving_grid' or 'halving_random'.
+        cv: Number of stratified folds.
+        scoring: sklearn scorer name.
+        n_iter: Number of sampled candidates for the random searches.
+        factor: Fraction of candidates kept (1 / factor) and growth of the
+            number of rows between successive halving iterations.
+        n_jobs: Number of parallel fits (-1 uses all cores).
+        checkpoint_dir: Directory of the checkpoint files, None disables checkpointing.
+        random_state: Seed for the folds, the row subsamples and the sampled candidates.
+        refit: Refit the best parameters of each model on all of x, y.
+        fold_cache: Optional osha_folds.FoldCache built on x, y. Its
+            materialized folds (with their per-fold transforms) are used
+            instead of splitting x, y, and the refit uses its transformed
+            full training set. cv and random_state then come from the cache.
+
+    Returns:
+        Dict of name -> dict with best_params, best_score, best_estimator and
+        cv_results (DataFrame with one row per evaluated candidate; fit_time
+        and score_time are summed over the folds, which run in parallel, and
+        wall_time is the wall-clock span of the candidate's folds).
+    """
+    if search not in SEARCH_MODES:
+        raise ValueError(f"Unknown search '{search}', expected one of {SEARCH_MODES}")
+    if models is None:
+        models = candidate_models()
+    y = np.asarray(y)
+    scorer = get_scorer(scoring)
+
+    store = None
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        data_key = data_fingerprint(x, y) if fold_cache is None else f"folds_{fold_cache.key}"
+        run_key = json.dumps({'data': data_key, 'search': search, 'cv': cv, 'scoring': scoring,
+                              'factor': factor, 'random_state': random_state}, sort_keys=True)
+        run_id = hashlib.blake2b(run_key.encode(), digest_size=8).hexdigest()
+        store = CheckpointStore(os.path.join(checkpoint_dir, f"search_{run_id}.jsonl"))
+        print(f"Checkpoint file {store.path} ({len(store.results)} finished fits)")
+
+    estimator_keys = {name: estimator_fingerprint(model) for name, model in models.items()}
+    # Rows are added in a fixed random order when successive halving grows the resources
+    order = np.random.RandomState(random_state).permutation(len(y))
+    n_classes = len(np.unique(y))
+    folds = StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state)
+    if fold_cache is not None:
+        cv = fold_cache.cv
+
+    def fold_data(n_resources):
+        """Return (x_train, y_train, x_test, y_test) of every fold for n_resources rows."""
+        if fold_cache is not None:
+            return [fold_cache.fold(fold, n_resources / len(y)) for fold in range(cv)]
+        rows = np.sort(order[:n_resources])
+        x_rows, y_rows = _safe_indexing(x, rows), y[rows]
+        return [(_safe_indexing(x_rows, train), y_rows[train], _safe_indexing(x_rows, test), y_rows[test])
+                for train, test in folds.split(np.zeros(len(rows)), y_rows)]
+
+    def evaluate(pending, n_resources):
+        """Run (name, params) candidates on n_resources rows, reusing checkpointed fits."""
+        splits = None
+        tasks, results = [], {}
+        for name, params in pending:
+            for fold in range(cv):
+                key = _task_key(name, estimator_keys[name], params, fold, n_resources)
+                if store is not None and key in store:
+                    results[key] = store[key]
+                    continue
+                if splits is None:
+                    # Folds are only built when some fit is missing from the checkpoint
+                    splits = fold_data(n_resources)
+                tasks.append(delayed(_fit_and_score)(key, models[name], params, *splits[fold], scorer))
+        if tasks:
+            for record in Parallel(n_jobs=n_jobs, return_as='generator_unordered')(tasks):
+                results[record['key']] = record
+                if store is not None:
+                    store.add(record)
+
+        rows_out = []
+        for name, params in pending:
+            records = [results[_task_key(name, estimator_keys[name], params, fold, n_resources)] for fold in range(cv)]
+            fit_time = sum(record['fit_time'] for record in records)
+            score_time = sum(record['score_time'] for record in records)
+            rows_out.append({'model': name, 'params': params, 'n_resources': n_resources,
+                             'mean_test_score': np.mean([record['score'] for record in records]),
+                             'std_test_score': np.std([record['score'] for record in records]),
+                             'fit_time': fit_time, 'score_time': score_time, 'wall_time': _wall_time(records),
+                             'error': next((record['error'] for record in records if 'error' in record), None)})
+            print(f"{name} {params} on {n_resources} rows: score {rows_out[-1]['mean_test_score']:.4f}, "
+                  f"wall {rows_out[-1]['wall_time']:.2f}s, summed fit+score {fit_time + score_time:.2f}s")
+        return rows_out
+
+    candidates = {name: _candidate_params(param_grids[name], search, n_iter, random_state) for name in models}
+    cv_results = {name: [] for name in models}
+
+    if search in ('grid', 'random'):
+        # All models share one pool so the cores stay busy until the last fit
+        pending = [(name, params) for name in models for params in candidates[name]]
+        for row in evaluate(pending, len(y)):
+            cv_results[row['model']].append(row)
+    else:
+        min_resources = 2 * cv * n_classes
+        for name in models:
+            print(f"Tuning {name}...")
+            remaining = candidates[name]
+            schedule = _halving_schedule(len(remaining), len(y), min_resources, factor)
+            for iteration, n_resources in enumerate(schedule):
+                rows_out = evaluate([(name, params) for params in remaining], n_resources)
+                for row in rows_out:
+                    row['iteration'] = iteration
+                cv_results[name].extend(rows_out)
+                if iteration < len(schedule) - 1:
+                    keep = max(1, math.ceil(len(remaining) / factor))
+                    best = sorted(rows_out, key=_sort_key, reverse=True)[:keep]
+                    remaining = [row['params'] for row in best]
+
+    x_refit, y_refit = (x, y) if fold_cache is None else fold_cache.full()
+    results = {}
+    for name in models:
+        table = pd.DataFrame(cv_results[name])
+        # The best candidate is taken from the last (largest) iteration
+        last = table[table['n_resources'] == table['n_resources'].max()]
+        if last['mean_test_score'].isna().all():
+            raise ValueError(f"Every {name} candidate failed to fit on the last iteration, "
+                             f"e.g. {last['error'].dropna().iloc[0]}")
+        best = last.loc[last['mean_test_score'].idxmax()]
+        best_estimator = None
+        if refit:
+            best_estimator = clone(models[name]).set_params(**best['params']).fit(x_refit, y_refit)
+        results[name] = {'best_params': best['params'], 'best_score': best['mean_test_score'],
+                         'best_estimator': best_estimator, 'cv_results': table}
+        print(f"Best parameters for {name}: {best['params']}")
+        print(f"Best cross-validation score for {name}: {best['mean_test_score']:.4f}\n")
+    return results
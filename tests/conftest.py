@@ -0,0 +1,31 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from osha_data import load_osha_data  # noqa: E402
+from osha_pipeline import TARGET  # noqa: E402
+from osha_streaming import FEATURE_COLUMNS  # noqa: E402
+from osha_synthetic import write_synthetic_osha  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def osha_csv(tmp_path_factory):
+    """Small synthetic OSHA file with the layout of the real one."""
+    return write_synthetic_osha(str(tmp_path_factory.mktemp('data') / 'osha.csv'), 3_000, chunksize=1_000)
+
+
+@pytest.fixture(scope='session')
+def labeled_rows(osha_csv):
+    """Loaded rows of osha_csv with a degree_of_inj."""
+    data = load_osha_data(osha_csv)
+    return data[data[TARGET].notna()].reset_index(drop=True)
+
+
+@pytest.fixture()
+def training_data(labeled_rows):
+    """Raw features and target of the labeled rows."""
+    return labeled_rows[FEATURE_COLUMNS].copy(), labeled_rows[TARGET].to_numpy(dtype=np.int64)
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.svm import SVC
+
+import osha_batch
+from osha_batch import score_chunk, score_file
+from osha_pipeline import fit_pipeline, predict, save_model, split_columns
+
+
+@pytest.mark.filterwarnings('ignore:The `probability` parameter:FutureWarning')
+@pytest.mark.parametrize('model', [RandomForestClassifier(10, random_state=0), SVC(probability=True, random_state=0)])
+def test_score_chunk_labels_match_predict(training_data, model):
+    x, y = training_data
+    numeric_columns, categorical_columns = split_columns(x)
+    artifact = {'pipeline': fit_pipeline(model, x[:1_500], y[:1_500]),
+                'numeric_columns': numeric_columns, 'categorical_columns': categorical_columns}
+    chunk = x[1_500:].reset_index(drop=True)
+    result = score_chunk(chunk, artifact, id_columns=['activity_nr'])
+    assert np.array_equal(result['prediction'], predict(chunk, artifact))
+    probabilities = result[[f'proba_{label}' for label in artifact['pipeline'].classes_]].to_numpy()
+    assert np.allclose(probabilities.sum(axis=1), 1.0)
+
+
+def _scored_artifact(tmp_path, training_data):
+    x, y = training_data
+    model_path = str(tmp_path / 'model.pkl')
+    save_model(fit_pipeline(RandomForestClassifier(5, random_state=0), x, y), model_path, x)
+    input_path = str(tmp_path / 'extract.csv')
+    x.to_csv(input_path, index=False)
+    return model_path, input_path, len(x)
+
+
+def test_score_file(tmp_path, training_data):
+    model_path, input_path, n_rows = _scored_artifact(tmp_path, training_data)
+    output_path = str(tmp_path / 'predictions.parquet')
+    report = score_file(input_path, output_path, model_path, chunksize=500, workers=2)
+    assert report['rows'] == n_rows
+    assert len(pd.read_parquet(output_path)) == n_rows
+
+
+def test_failed_chunk_leaves_no_output(tmp_path, training_data, monkeypatch):
+    model_path, input_path, _ = _scored_artifact(tmp_path, training_data)
+    output_path = str(tmp_path / 'predictions.parquet')
+
+    def failing_score_chunk(chunk, artifact, id_columns=()):
+        if chunk.index[0] >= 1_000:
+            raise ValueError("bad chunk")
+        return score_chunk(chunk, artifact, id_columns)
+
+    # The worker processes are forked and see the patched function
+    monkeypatch.setattr(osha_batch, 'score_chunk', failing_score_chunk)
+    with pytest.raises(ValueError, match="bad chunk"):
+        score_file(input_path, output_path, model_path, chunksize=500, workers=1)
+    assert not os.path.exists(output_path)
@@ -0,0 +1,16 @@
+import numpy as np
+
+from osha_boosting import build_hgb_pipeline
+from osha_pipeline import prepare_records, split_columns
+
+
+def test_missing_category_is_a_split_value(labeled_rows):
+    # fatality only takes 'X', so the model can only split on it if missing is a category of its own
+    x, y = labeled_rows[['fatality']], labeled_rows['degree_of_inj'].to_numpy(dtype=np.int64)
+    records = prepare_records(x, *split_columns(x))
+    pipeline = build_hgb_pipeline(x, max_iter=20).fit(records, y)
+    # Best accuracy of one split on fatality: the majority class of the 'X' rows and of the missing rows
+    flagged = records['fatality'].notna().to_numpy()
+    split_correct = sum(np.bincount(y[group]).max() for group in (flagged, ~flagged))
+    assert split_correct > np.bincount(y).max()
+    assert pipeline.score(records, y) >= split_correct / len(y) - 0.01
@@ -0,0 +1,16 @@
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from osha_compact import compare_representations
+
+
+@pytest.mark.parametrize('columns', [['age', 'nature_of_inj', 'part_of_body'], ['age', 'nature_of_inj', 'fatality']])
+def test_compare_representations(training_data, columns):
+    # Without a categorical column the float64 features are a dense array
+    x, y = training_data
+    x = x[columns]
+    report, pipelines = compare_representations(RandomForestClassifier(5, random_state=0), x[:2_000], y[:2_000],
+                                                x[2_000:], y[2_000:])
+    assert list(report.index) == ['float64', 'compact']
+    assert (report['train_mb'] > 0).all()
+    assert set(pipelines) == {'float64', 'compact'}
@@ -0,0 +1,27 @@
+import warnings
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+from osha_harness import _single_threaded, train_and_evaluate
+
+
+def test_single_threaded_does_not_warn():
+    rng = np.random.RandomState(0)
+    x, y = rng.normal(size=(200, 3)), rng.randint(0, 3, 200)
+    assert _single_threaded(RandomForestClassifier(n_jobs=-1)).n_jobs == 1
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', FutureWarning)
+        _single_threaded(LogisticRegression()).fit(x, y)
+
+
+def test_train_and_evaluate(tmp_path):
+    rng = np.random.RandomState(0)
+    x, y = rng.normal(size=(400, 3)), rng.randint(0, 3, 400)
+    models = {'Logistic Regression': LogisticRegression(), 'Random Forest': RandomForestClassifier(10, n_jobs=-1)}
+    report, fitted = train_and_evaluate(models, x[:300], y[:300], x[300:], y[300:], max_workers=2,
+                                        data_dir=str(tmp_path))
+    assert set(report['model']) == set(models)
+    assert fitted['Random Forest'].n_jobs == 1
+    assert fitted['Logistic Regression'].n_jobs is None
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from osha_data import load_osha_data
+from osha_incremental import ExtendedForest, init_incremental_state, scan_keys, update_saved_model
+from osha_pipeline import TARGET, fit_pipeline, load_model, prepare_records, save_model
+from osha_streaming import FEATURE_COLUMNS
+from osha_synthetic import make_osha_frame
+
+
+@pytest.fixture(scope='module')
+def releases(tmp_path_factory):
+    """An old release and a new one appending rows with categories the old one does not have."""
+    directory = tmp_path_factory.mktemp('releases')
+    frame = make_osha_frame(4_000, chunksize=1_000)
+    frame.loc[3_000:3_300, 'sex'] = 'U'
+    frame.loc[3_000:3_100, 'union_status'] = 'Z'
+    old_path, new_path = str(directory / 'old.csv'), str(directory / 'new.csv')
+    frame.iloc[:3_000].to_csv(old_path, index=False)
+    frame.to_csv(new_path, index=False)
+    return old_path, new_path
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_update_keeps_old_trees_and_importances(releases, tmp_path, compact):
+    old_path, new_path = releases
+    old = load_osha_data(old_path)
+    old = old[old[TARGET].notna()]
+    x, y = old[FEATURE_COLUMNS], old[TARGET].to_numpy(dtype=np.int64)
+    pipeline = fit_pipeline(RandomForestClassifier(10, random_state=0), x, y, compact=compact)
+    model_path = str(tmp_path / 'model.pkl')
+    save_model(pipeline, model_path, x, incremental_state=init_incremental_state(scan_keys(old_path)))
+    artifact = load_model(model_path)
+    records = prepare_records(old, artifact['numeric_columns'], artifact['categorical_columns'])
+    before = artifact['pipeline'].predict_proba(records)
+
+    updated = update_saved_model(model_path, new_path, n_trees=4, output_path=str(tmp_path / 'updated.pkl'))
+    pipeline = updated['pipeline']
+    model, names = pipeline.named_steps['model'], pipeline.named_steps['preprocess'].get_feature_names_out()
+    assert isinstance(model, ExtendedForest)
+    assert [len(forest.estimators_) for forest in model.forests] == [10, 4]
+    assert any(name.endswith('sex_U') for name in names)
+
+    features = pipeline.named_steps['preprocess'].transform(records)
+    old_forest = model.forests[0]
+    assert np.array_equal(old_forest.predict_proba(model._inputs(features, model.columns_[0])), before)
+    new_proba = model.forests[1].predict_proba(features)
+    assert np.allclose(pipeline.predict_proba(records), (10 * before + 4 * new_proba) / 14)
+    assert np.array_equal(pipeline.predict(records), model.classes_[pipeline.predict_proba(records).argmax(axis=1)])
+
+    importances = model.feature_importances_
+    assert importances.shape == (len(names),)
+    assert np.isclose(importances.sum(), 1.0)
+    assert np.allclose(importances[model.columns_[0]] * 14, 10 * old_forest.feature_importances_
+                       + 4 * model.forests[1].feature_importances_[model.columns_[0]])
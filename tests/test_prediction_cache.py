@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.svm import SVC
+
+from osha_boosting import build_hgb_pipeline
+from osha_pipeline import fit_pipeline, prepare_records, split_columns
+from osha_prediction_cache import PredictionCache
+
+
+def _artifact(pipeline, x):
+    numeric_columns, categorical_columns = split_columns(x)
+    return {'pipeline': pipeline, 'numeric_columns': numeric_columns, 'categorical_columns': categorical_columns}
+
+
+def test_one_hot_pipeline_uses_record_normalizer(training_data):
+    x, y = training_data
+    pipeline = fit_pipeline(RandomForestClassifier(5, random_state=0), x, y)
+    cache = PredictionCache(_artifact(pipeline, x))
+    records = x.head(50).to_dict('records')
+    assert cache.normalize is not None
+    assert np.array_equal(cache.predict(records), pipeline.predict(prepare_records(x.head(50), *split_columns(x))))
+
+
+def test_hgb_pipeline_falls_back_to_transformed_row_keys(training_data):
+    x, y = training_data
+    pipeline = build_hgb_pipeline(x, max_iter=5)
+    pipeline.fit(prepare_records(x, *split_columns(x)), y)
+    cache = PredictionCache(_artifact(pipeline, x))
+    records = x.head(50).to_dict('records')
+    assert cache.normalize is None
+    expected = pipeline.predict_proba(prepare_records(x.head(50), *split_columns(x)))
+    assert np.allclose(cache.predict_proba(records), expected)
+    assert np.allclose(cache.predict_proba(records), expected)
+    assert cache.stats()['hits'] == 50
+
+
+@pytest.mark.filterwarnings('ignore:The `probability` parameter:FutureWarning')
+def test_cached_labels_match_predict(training_data):
+    # The Platt-scaled probabilities of SVC can disagree with its predict
+    x, y = training_data
+    pipeline = fit_pipeline(SVC(probability=True, random_state=0), x[:1_500], y[:1_500])
+    cache = PredictionCache(_artifact(pipeline, x))
+    records = x[1_500:]
+    expected = pipeline.predict(prepare_records(records, *split_columns(x)))
+    assert np.array_equal(cache.predict(records), expected)
+    assert np.array_equal(cache.predict(records), expected)
+    assert cache.stats()['hits'] == len(records)
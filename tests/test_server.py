@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+from sklearn.svm import SVC
+
+from osha_pipeline import fit_pipeline, predict, split_columns
+from osha_prediction_cache import PredictionCache
+from osha_server import MicroBatcher
+
+
+@pytest.mark.filterwarnings('ignore:The `probability` parameter:FutureWarning')
+@pytest.mark.parametrize('cached', [False, True])
+def test_served_labels_match_predict(training_data, cached):
+    x, y = training_data
+    numeric_columns, categorical_columns = split_columns(x)
+    artifact = {'pipeline': fit_pipeline(SVC(probability=True, random_state=0), x[:1_500], y[:1_500]),
+                'numeric_columns': numeric_columns, 'categorical_columns': categorical_columns}
+    batcher = MicroBatcher(artifact, cache=PredictionCache(artifact) if cached else None)
+    records = x[1_500:].to_dict('records')
+    results = batcher._score(records)
+    assert [prediction for prediction, _ in results] == predict(records, artifact).tolist()
+    assert np.allclose([sum(probabilities) for _, probabilities in results], 1.0)
@@ -0,0 +1,24 @@
+import numpy as np
+from sklearn.impute import SimpleImputer
+
+from osha_data import MAX_NULL_FRACTION, filter_outliers_iqr, load_profiled_osha_data
+from osha_pipeline import TARGET
+
+
+def test_generated_data_survives_the_notebook_cleaning(osha_csv):
+    # The load and cleaning cells of main_project_nithin.py
+    data, column_profile, _ = load_profiled_osha_data(osha_csv, chunksize=1_000, max_null_fraction=MAX_NULL_FRACTION)
+    assert not column_profile['dropped'].any()
+    for column in ('fatality', 'hum_factor', 'task_assigned', 'sex', 'union_status', TARGET):
+        assert column in data.columns
+    numeric_columns = list(data.select_dtypes(include='number'))
+    data[TARGET] = SimpleImputer(strategy='median').fit_transform(data[[TARGET]])
+    data1 = data.copy()
+    data1['fatality'] = data1['fatality'].astype(object).fillna('no')
+    for column in ('sex', 'union_status'):
+        data[column] = SimpleImputer(strategy='most_frequent').fit_transform(data[[column]]).flatten()
+
+    cleaned_data, _ = filter_outliers_iqr(data, numeric_columns, mode='sequential')
+    assert len(cleaned_data) > 0.5 * len(data)
+    assert set(np.unique(cleaned_data[TARGET])) == {1, 2, 3}
+    assert set(cleaned_data['fatality'].dropna()) == {'X'}
@@ -0,0 +1,18 @@
+import numpy as np
+from sklearn.tree import DecisionTreeClassifier
+
+from osha_tuning import tune_models
+
+
+def test_candidate_wall_time(tmp_path):
+    rng = np.random.RandomState(0)
+    x, y = rng.normal(size=(600, 4)), rng.randint(0, 2, 600)
+    models = {'Decision Tree': DecisionTreeClassifier(random_state=0)}
+    grids = {'Decision Tree': {'max_depth': [2, 4]}}
+    table = tune_models(x, y, models, grids, n_jobs=2, checkpoint_dir=str(tmp_path))['Decision Tree']['cv_results']
+    assert len(table) == 2
+    assert (table['wall_time'] > 0).all()
+    # The summed fold times are reported separately
+    assert (table['fit_time'] > 0).all()
+    resumed = tune_models(x, y, models, grids, n_jobs=2, checkpoint_dir=str(tmp_path))['Decision Tree']['cv_results']
+    assert np.allclose(resumed['wall_time'], table['wall_time'])